@@ -0,0 +1,74 @@
+import os
+import re
+
+from output_writer import OutputWriter, hash_bytes
+
+# Folder (next to the per-document folders in app/) holding the shared front-end bundle
+ASSET_BUNDLE_FOLDER = "_assets"
+BUNDLE_MANIFEST_FILE = "bundle.json"
+
+# Fingerprinted files never change, so they can be cached by browsers and CDNs for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Matches the local script/stylesheet references in scripts/index.html
+ASSET_REFERENCE_PATTERN = re.compile(r'(src|href)="((?:js|css)/[^"]+)"')
+
+
+def fingerprint_name(rel_path, data: bytes, length=10):
+    """js/navigation.js -> js/navigation.<hash>.js"""
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{hash_bytes(data)[:length]}{ext}"
+
+
+def build_asset_bundle(bundle_path, scripts_dir, asset_folders=("js", "css"), url_path=f"/{ASSET_BUNDLE_FOLDER}"):
+    """
+    Publish the front-end scripts once into a shared, fingerprinted bundle.
+
+    Every file under scripts_dir/js and scripts_dir/css is written to bundle_path with its
+    content hash in the file name. Older fingerprinted files are kept, so documents built
+    against a previous bundle keep working. A bundle.json maps the original paths to the
+    fingerprinted ones, and a _headers file gives the hashed files long-lived cache headers.
+
+    Returns the bundle manifest: {"version": ..., "files": {"js/navigation.js": "js/navigation.<hash>.js"}}
+    """
+    writer = OutputWriter(bundle_path)
+    files = {}
+
+    for folder in asset_folders:
+        src_dir = os.path.join(scripts_dir, folder)
+        for root, _, filenames in os.walk(src_dir):
+            for filename in sorted(filenames):
+                src_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(src_path, scripts_dir).replace(os.sep, "/")
+                with open(src_path, "rb") as f:
+                    data = f.read()
+                files[rel_path] = fingerprint_name(rel_path, data)
+                writer.write_bytes(files[rel_path], data)
+
+    # The bundle version changes whenever any of its files change
+    version = hash_bytes("\n".join(f"{k}={v}" for k, v in sorted(files.items())).encode("utf-8"))[:10]
+    bundle = {"version": version, "files": files}
+    writer.write_json(BUNDLE_MANIFEST_FILE, bundle)
+
+    headers = "".join(
+        f"{url_path}/{folder}/*\n  Cache-Control: {IMMUTABLE_CACHE_CONTROL}\n"
+        for folder in asset_folders
+    )
+    headers += f"{url_path}/{BUNDLE_MANIFEST_FILE}\n  Cache-Control: no-cache\n"
+    writer.write_text("_headers", headers)
+
+    # Keep old fingerprinted files: already published documents may still reference them
+    writer.finalize(prune=False)
+    return bundle
+
+
+def render_index_html(index_html, bundle, base_url=f"../{ASSET_BUNDLE_FOLDER}"):
+    """Point the js/ and css/ references of index.html at the fingerprinted files of the shared bundle."""
+    def replace_reference(match):
+        attr, rel_path = match.groups()
+        if rel_path not in bundle["files"]:
+            return match.group(0)  # Not part of the bundle (e.g. a script this example doesn't ship)
+        return f'{attr}="{base_url}/{bundle["files"][rel_path]}"'
+
+    html = ASSET_REFERENCE_PATTERN.sub(replace_reference, index_html)
+    return html.replace("<head>", f'<head>\n    <meta name="asset-bundle-version" content="{bundle["version"]}">', 1)
@@ -0,0 +1,243 @@
+"""
+Benchmark every docx_converter / html_converter function and the end-to-end pipeline on
+synthetic documents of growing size, and report how their run time scales.
+
+    python benchmark.py --scales 1 2 4 8 --repeat 3 --output bench.json
+    python benchmark.py --pandoc /usr/local/bin/pandoc --only extract_table_format html_convert
+    python benchmark.py --memory --scales 1 4 16   # table extraction memory and tables.json size: dicts vs compact records
+
+Runs offline: documents are generated locally (synthetic_docx.py) and pandoc is taken from
+--pandoc, $PYPANDOC_PANDOC or the pypandoc-binary install. The scaling exponent is the slope
+of log(time) against log(document scale): ~1 is linear, ~2 is quadratic.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import docx_converter as dc
+import html_converter as hc
+import legacy_tables
+import pipeline
+from figure_registry import FigureRegistry
+from output_writer import dump_json
+from synthetic_docx import DEFAULT_SPEC, generate_corpus
+from table_records import serialize_tables
+from table_renderer import render_tables_html
+
+DEFAULT_SCALES = (1, 2, 4, 8)
+
+# Exponents above this are flagged as superlinear in the report
+SUPERLINEAR_EXPONENT = 1.5
+
+# Timings below this are mostly noise and are left out of the exponent fit
+MIN_FIT_SECONDS = 0.001
+
+
+def prepare_context(docx_path, work_dir):
+    """Run the pipeline once and keep every intermediate result, so each function can be timed on its real input."""
+    ctx = {"docx_path": docx_path, "work_dir": work_dir}
+    ctx["compatible_docx_path"] = dc.check_compatibility(docx_path, os.path.join(work_dir, "compatible.docx"))
+    compatible = ctx["compatible_docx_path"]
+
+    alt_text_map = dc.extract_docx_media(compatible, os.path.join(work_dir, "media_out"), dc.FOLDERS['media'], ["timeline"])
+    ctx["keep_images"] = [value.replace("assets", "media") for value in alt_text_map.values()]
+    ctx["figures"] = FigureRegistry.from_docx(compatible)
+
+    ctx["initial_html"] = dc.convert_docx_to_html(compatible, pipeline.LUA_SCRIPT, ctx["keep_images"])
+    ctx["html_clean"] = dc.remove_empty_paragraphs(ctx["initial_html"])
+    ctx["html_figures_removed"] = dc.remove_empty_figures(ctx["html_clean"])
+    ctx["html_images_replaced"] = dc.replace_images_with_divs(ctx["html_figures_removed"], ctx["figures"])
+    ctx["html_captions_removed"] = dc.remove_captions_from_unwanted_figures(ctx["html_images_replaced"])
+    ctx["html_references_updated"] = dc.update_in_text_figure_references(ctx["html_captions_removed"], ctx["figures"].number_map())
+    ctx["content_html"] = pipeline.replace_tables(ctx["html_references_updated"])
+    ctx["tables"] = dc.extract_table_format(compatible, pipeline.DEFAULT_STYLES)
+    ctx["platform_json"] = hc.html_convert(BeautifulSoup(ctx["content_html"], "html.parser"))
+    return ctx
+
+
+# name -> function(ctx). Each one calls a single converter function on its real input.
+BENCHMARKS = {
+    "check_compatibility": lambda ctx: dc.check_compatibility(ctx["docx_path"], os.path.join(ctx["work_dir"], "bench_compatible.docx")),
+    "extract_styles": lambda ctx: dc.extract_styles(ctx["compatible_docx_path"]),
+    "extract_corpus_styles": lambda ctx: dc.extract_corpus_styles([ctx["compatible_docx_path"]]),
+    "extract_table_format": lambda ctx: dc.extract_table_format(ctx["compatible_docx_path"], pipeline.DEFAULT_STYLES),
+    "extract_docx_media": lambda ctx: dc.extract_docx_media(ctx["compatible_docx_path"], os.path.join(ctx["work_dir"], "bench_media"), dc.FOLDERS['media'], ["timeline"]),
+    "figure_registry": lambda ctx: FigureRegistry.from_docx(ctx["compatible_docx_path"]),
+    "convert_docx_to_html": lambda ctx: dc.convert_docx_to_html(ctx["compatible_docx_path"], pipeline.LUA_SCRIPT, ctx["keep_images"]),
+    "remove_empty_paragraphs": lambda ctx: dc.remove_empty_paragraphs(ctx["initial_html"]),
+    "remove_empty_figures": lambda ctx: dc.remove_empty_figures(ctx["html_clean"]),
+    "replace_images_with_divs": lambda ctx: dc.replace_images_with_divs(ctx["html_figures_removed"], ctx["figures"]),
+    "remove_captions_from_unwanted_figures": lambda ctx: dc.remove_captions_from_unwanted_figures(ctx["html_images_replaced"]),
+    "update_in_text_figure_references": lambda ctx: dc.update_in_text_figure_references(ctx["html_captions_removed"], ctx["figures"].number_map()),
+    "table_replacer": lambda ctx: pipeline.replace_tables(ctx["html_references_updated"]),
+    "render_tables_html": lambda ctx: render_tables_html(ctx["tables"], pipeline.DEFAULT_STYLES, ctx["content_html"]),
+    "generate_navigation_data": lambda ctx: dc.generate_navigation_data(ctx["content_html"]),
+    "html_convert": lambda ctx: hc.html_convert(BeautifulSoup(ctx["content_html"], "html.parser")),
+    "clean_nested_json": lambda ctx: hc.clean_nested_json(ctx["platform_json"]),
+    "end_to_end": lambda ctx: pipeline.convert_docx(ctx["docx_path"], pipeline.LUA_SCRIPT, os.path.join(ctx["work_dir"], "app", "bench")),
+}
+
+
+def measure_memory(func, *args):
+    """(result, peak bytes allocated during the call, bytes still held by the result)."""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak, retained
+
+
+def run_table_memory_benchmark(scales=DEFAULT_SCALES, base_spec=None, work_dir=None):
+    """
+    Peak and retained memory of reading the tables of each scale with the original dict-per-segment
+    extraction (legacy_tables.extract_table_format_dicts) and with the compact records (extract_table_records),
+    plus the size of the tables.json each one serializes to.
+    """
+    own_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="docx_bench_")
+    results = {"scales": list(scales), "spec": base_spec or DEFAULT_SPEC, "tables": {}}
+    try:
+        corpus = generate_corpus(os.path.join(work_dir, "corpus"), scales, base_spec)
+        for scale, (docx_path, spec) in corpus.items():
+            styles = dc.extract_template_styles(docx_path)
+            dc.extract_table_records(docx_path, styles)  # Warm-up: lazy imports and caches are not counted against either one
+            dicts, dicts_peak, dicts_retained = measure_memory(legacy_tables.extract_table_format_dicts, docx_path, styles)
+            records, records_peak, records_retained = measure_memory(dc.extract_table_records, docx_path, styles)
+            entry = {
+                "cells": sum(len(table["headers"]) + sum(map(len, table["rows"])) for table in dicts.values()),
+                "dicts_peak": dicts_peak,
+                "dicts_retained": dicts_retained,
+                "records_peak": records_peak,
+                "records_retained": records_retained,
+                "dicts_json_bytes": len(dump_json(dicts)),
+                "records_json_bytes": len(dump_json(serialize_tables(records))),
+            }
+            results["tables"][scale] = entry
+            print(f"  x{scale:<4} {entry['cells']:>8} cells  retained {dicts_retained / 1e6:8.2f} MB -> {records_retained / 1e6:8.2f} MB"
+                  f"  peak {dicts_peak / 1e6:8.2f} MB -> {records_peak / 1e6:8.2f} MB"
+                  f"  tables.json {entry['dicts_json_bytes'] / 1e3:8.1f} kB -> {entry['records_json_bytes'] / 1e3:8.1f} kB")
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def time_call(func, ctx, repeat):
+    """Best-of-repeat wall time in seconds, or the error message if the function fails."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func(ctx)
+        except Exception as error:  # Report and keep benchmarking the other functions
+            return None, f"{type(error).__name__}: {error}"
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, None
+
+
+def scaling_exponent(points):
+    """Least-squares slope of log(time) against log(scale)."""
+    points = [(scale, seconds) for scale, seconds in points if seconds and seconds >= MIN_FIT_SECONDS]
+    if len(points) < 2:
+        return None
+    xs = [math.log(scale) for scale, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if not var_x:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, repeat=3, only=None, base_spec=None, work_dir=None):
+    """Generate the corpus, time every benchmark at every scale and return the results as a dictionary."""
+    names = [name for name in BENCHMARKS if not only or name in only]
+    own_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="docx_bench_")
+    cwd = os.getcwd()
+    results = {"scales": list(scales), "repeat": repeat, "spec": base_spec or DEFAULT_SPEC, "functions": {}}
+
+    try:
+        # pandoc --extract-media=. writes into the working directory
+        os.chdir(work_dir)
+        corpus = generate_corpus(os.path.join(work_dir, "corpus"), scales, base_spec)
+        for name in names:
+            results["functions"][name] = {"seconds": {}, "errors": {}}
+
+        for scale, (docx_path, spec) in corpus.items():
+            scale_dir = os.path.join(work_dir, f"x{scale}")
+            os.makedirs(scale_dir, exist_ok=True)
+            ctx = prepare_context(docx_path, scale_dir)
+            results.setdefault("documents", {})[scale] = {"docx_size": os.path.getsize(docx_path), **spec}
+            for name in names:
+                seconds, error = time_call(BENCHMARKS[name], ctx, repeat)
+                if error:
+                    results["functions"][name]["errors"][scale] = error
+                else:
+                    results["functions"][name]["seconds"][scale] = seconds
+                print(f"  x{scale:<4} {name:<40} {error or f'{seconds * 1000:10.2f} ms'}")
+
+        for name, entry in results["functions"].items():
+            entry["exponent"] = scaling_exponent(list(entry["seconds"].items()))
+            entry["superlinear"] = entry["exponent"] is not None and entry["exponent"] > SUPERLINEAR_EXPONENT
+    finally:
+        os.chdir(cwd)
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def format_report(results):
+    scales = results["scales"]
+    header = f"{'function':<40}" + "".join(f"{f'x{s} (ms)':>12}" for s in scales) + f"{'exponent':>10}"
+    lines = [header, "-" * len(header)]
+    for name, entry in results["functions"].items():
+        cells = []
+        for scale in scales:
+            seconds = entry["seconds"].get(scale)
+            cells.append(f"{seconds * 1000:>12.2f}" if seconds is not None else f"{'error':>12}")
+        exponent = f"{entry['exponent']:.2f}" if entry["exponent"] is not None else "-"
+        flag = "  <- superlinear" if entry["superlinear"] else ""
+        lines.append(f"{name:<40}" + "".join(cells) + f"{exponent:>10}{flag}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES, help="Document size multipliers")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmark only these functions")
+    parser.add_argument("--pandoc", help="Path to a local pandoc binary")
+    parser.add_argument("--memory", action="store_true", help="Measure the memory of table extraction instead of timing")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.pandoc:
+        os.environ["PYPANDOC_PANDOC"] = os.path.abspath(args.pandoc)
+
+    scales = [int(s) if float(s).is_integer() else s for s in args.scales]
+    if args.memory:
+        results = run_table_memory_benchmark(scales)
+    else:
+        results = run_benchmarks(scales, args.repeat, args.only)
+        print()
+        print(format_report(results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import html
+import json
+import re
+
+from table_renderer import TABLE_PLACEHOLDER_PATTERN, render_table_html
+
+# <script type="application/json" id="bootstrap-data"> in index.html, read by contentLoader.js,
+# navigation.js and mediaLoader.js instead of fetching styles.json, navigation.json, ...
+BOOTSTRAP_DATA_ID = "bootstrap-data"
+
+# Tables of the first section are rendered into index.html up to this size. Larger ones keep
+# their empty placeholder and are attached from tables.html / tables.json when needed.
+INLINE_TABLE_BYTES = 16 * 1024
+
+# Still empty table placeholder of a section fragment
+EMPTY_TABLE_PATTERN = re.compile(TABLE_PLACEHOLDER_PATTERN.pattern + "</div>")
+
+IMAGE_SOURCE_PATTERN = re.compile(r'<div class="image"[^>]*? data-src="([^"]*)"')
+
+CONTENT_DIV = '<div id="content"></div>'
+
+
+def inline_tables(section_html, tables, styles, max_bytes=INLINE_TABLE_BYTES):
+    """Render the tables of a section fragment into their placeholders, except the ones larger than max_bytes."""
+    def render(match):
+        table_data = tables.get(match.group(1))
+        if table_data is None:
+            return match.group(0)
+        table_html = render_table_html(table_data, styles, html.unescape(match.group(2) or ""))
+        if len(table_html.encode("utf-8")) > max_bytes:
+            return match.group(0)
+        return f'{match.group(0)[:-len("</div>")]}{table_html}</div>'
+
+    return EMPTY_TABLE_PATTERN.sub(render, section_html)
+
+
+def section_media(section_html, media):
+    """The media.json entries of the images in a section fragment."""
+    return {src: media[src] for src in IMAGE_SOURCE_PATTERN.findall(section_html) if src in media}
+
+
+def script_json(data):
+    """JSON that is safe inside a <script> element."""
+    return json.dumps(data, ensure_ascii=False).replace("</", "<\\/")
+
+
+def render_bootstrap_index(index_html, content_html, data, stylesheet=None):
+    """
+    Inline the critical data of a document into its index.html, so the first section renders
+    from a single request.
+
+    :param index_html: The front-end index.html (with its empty <div id="content">).
+    :param content_html: Markup of the preamble and first section, placed inside #content.
+    :param data: Styles, navigation, section manifest and first-section media for the loaders.
+    :param stylesheet: (href, css) of the generated stylesheet, inlined as <style data-href="...">.
+    """
+    if CONTENT_DIV not in index_html:
+        raise ValueError(f"index.html has no {CONTENT_DIV} to inline the first section into")
+
+    head = f'    <script type="application/json" id="{BOOTSTRAP_DATA_ID}">{script_json(data)}</script>\n'
+    if stylesheet:
+        href, css = stylesheet
+        head = f'    <style data-href="{href}">\n{css}    </style>\n' + head
+
+    index_html = index_html.replace("</head>", f"{head}</head>", 1)
+    return index_html.replace(CONTENT_DIV, f'<div id="content">{content_html}</div>', 1)
+
+
+def bootstrap_document(sections_manifest, read_text, styles, tables, navigation, media, max_table_bytes=INLINE_TABLE_BYTES):
+    """
+    Build the inlined content and bootstrap data of a document split into sections.
+
+    The preamble and the first section go into #content with their small tables rendered in
+    place; the section manifest handed to the viewer marks the first section as already present,
+    so only the other sections (and heavy tables) are fetched, when they are opened.
+
+    :param read_text: Returns the text of an output file from its path relative to the document folder.
+    :return: (content_html, bootstrap data).
+    """
+    content = []
+    inline_media = {}
+    if sections_manifest.get("preamble"):
+        preamble = inline_tables(read_text(sections_manifest["preamble"]), tables, styles, max_table_bytes)
+        content.append(preamble)
+        inline_media.update(section_media(preamble, media))
+
+    sections = [dict(section) for section in sections_manifest.get("sections", [])]
+    if sections:
+        first = sections[0]
+        section_html = inline_tables(read_text(first["file"]), tables, styles, max_table_bytes)
+        content.append(f'<div data-section="{html.escape(first["id"])}">{section_html}</div>')
+        inline_media.update(section_media(section_html, media))
+        first["inline"] = True
+
+    data = {
+        "styles": styles,
+        "navigation": navigation,
+        "sections": {"preamble": None, "sections": sections},  # The preamble is inlined
+        "media": inline_media,
+    }
+    return "".join(content), data
@@ -0,0 +1,82 @@
+import json
+import logging
+import sys
+
+# Parent logger of every conversion stage, e.g. "content_formatting.tables"
+LOGGER_NAME = "content_formatting"
+
+# Stages used by the converter modules. Each gets its own logger so they can be tuned independently.
+STAGES = (
+    "compatibility",
+    "styles",
+    "tables",
+    "media",
+    "figures",
+    "pandoc",
+    "html",
+    "platform_json",
+    "output",
+    "pipeline",
+    "queue",
+    "split",
+    "revisions",
+)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(stage)s] %(message)s"
+
+
+def get_logger(stage):
+    """Return the logger for one conversion stage."""
+    return logging.getLogger(f"{LOGGER_NAME}.{stage}")
+
+
+class StageFilter(logging.Filter):
+    """Adds the stage name (the last part of the logger name) to every record."""
+
+    def filter(self, record):
+        record.stage = record.name.rsplit(".", 1)[-1]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for worker logs that are shipped to a log store."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "stage": getattr(record, "stage", record.name),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=logging.INFO, stage_levels=None, json_format=False, stream=None):
+    """
+    Configure the conversion loggers.
+
+    :param level: Level for all stages (e.g. logging.INFO or "DEBUG").
+    :param stage_levels: Optional per-stage overrides, e.g. {"tables": "DEBUG", "html": "WARNING"}.
+    :param json_format: Emit one JSON object per line instead of plain text.
+    :param stream: Stream to write to (default: stdout, like the print calls this replaces).
+    """
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(level)
+    root.propagate = False
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.addFilter(StageFilter())
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT, "%H:%M:%S"))
+    root.addHandler(handler)
+
+    for stage in STAGES:
+        get_logger(stage).setLevel(logging.NOTSET)
+    for stage, stage_level in (stage_levels or {}).items():
+        get_logger(stage).setLevel(stage_level)
+
+    return root
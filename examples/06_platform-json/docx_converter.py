@@ -1,16 +1,35 @@
 from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from lxml import etree
 import json
-from collections import Counter
 from enum import Enum
 import pypandoc
 import re
 from bs4 import BeautifulSoup, NavigableString
+from bs4.dammit import EntitySubstitution
+from bs4.formatter import HTMLFormatter
 import os
-import shutil
 import xml.etree.ElementTree as ET
 import html  # Ensure this is imported
 from collections import namedtuple
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZipFile
+import logging
+
+from conversion_logging import get_logger
+from docx_package import docx_package, load_document, open_view
+from image_headers import image_size
+from output_writer import atomic_output, atomic_write, hash_bytes
+from style_resolver import StyleResolver
+from style_stats import TableStyleStats
+from table_records import LINE_BREAK, CellRecord, StyleInterner, TableRecord, TextRun, serialize_tables
+from zip_rewrite import rewrite_zip
+
+compat_logger = get_logger("compatibility")
+tables_logger = get_logger("tables")
+media_logger = get_logger("media")
+figures_logger = get_logger("figures")
+pandoc_logger = get_logger("pandoc")
+html_logger = get_logger("html")
 
 # Define the prefix for alt text that should be kept in the output
 ALT_TEXT_KEEP_PREFIX = "keep-"
@@ -35,22 +54,131 @@ GLOBAL_DEFAULT_STYLES = {
     "verticalAlign": "middle"
 }
 
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCUMENT_PART = "word/document.xml"
+STYLES_PART = "word/styles.xml"
+DOCUMENT_RELS_PART = "word/_rels/document.xml.rels"
+MEDIA_PART_FOLDER = "word/media"
+
+
+def paragraph_style_names(styles_xml):
+    """({paragraph style id: name}, default paragraph style id) of a styles.xml part."""
+    names, default_id = {}, None
+    for style in etree.fromstring(styles_xml).iterfind(f"{W_NS}style"):
+        if style.get(f"{W_NS}type") != "paragraph":
+            continue
+        style_id = style.get(f"{W_NS}styleId")
+        name = style.find(f"{W_NS}name")
+        names[style_id] = name.get(f"{W_NS}val") if name is not None else None
+        if style.get(f"{W_NS}default") in ("1", "true", "on"):
+            default_id = default_id or style_id
+    return names, default_id
+
+
+def paragraph_has_text(p):
+    """Same test as para.text.strip() in python-docx: visible text of the runs and hyperlinks."""
+    for path in (f"{W_NS}r", f"{W_NS}hyperlink/{W_NS}r"):
+        for run in p.iterfind(path):
+            for child in run:
+                if child.tag == f"{W_NS}t" and (child.text or "").strip():
+                    return True
+                if child.tag == f"{W_NS}noBreakHyphen":
+                    return True
+    return False
+
+
+def paragraph_style_id(p):
+    p_style = p.find(f"{W_NS}pPr/{W_NS}pStyle")
+    return p_style.get(f"{W_NS}val") if p_style is not None else None
+
+
+def needs_normal_style(p, names, default_id):
+    """An empty body paragraph whose (effective) paragraph style isn't Normal."""
+    style_id = paragraph_style_id(p)
+    if style_id not in names:
+        style_id = default_id  # Unknown or missing styles fall back to the default paragraph style
+    return names.get(style_id) != "Normal" and not paragraph_has_text(p)
+
+
+def set_paragraph_style(p, style_id):
+    """Apply a paragraph style like python-docx does: no <w:pStyle> at all for the default style."""
+    p_pr = p.find(f"{W_NS}pPr")
+    p_style = p_pr.find(f"{W_NS}pStyle") if p_pr is not None else None
+    if style_id is None:
+        if p_style is not None:
+            p_pr.remove(p_style)
+        return
+    if p_pr is None:
+        p_pr = etree.Element(f"{W_NS}pPr")
+        p.insert(0, p_pr)
+    if p_style is None:
+        p_style = etree.Element(f"{W_NS}pStyle")
+        p_pr.insert(0, p_style)
+    p_style.set(f"{W_NS}val", style_id)
+
+
+def count_paragraphs_to_normalize(document_file, names, default_id):
+    """Stream document.xml and count the body paragraphs needing the Normal style (nothing is kept in memory)."""
+    count = 0
+    for _, p in etree.iterparse(document_file, events=("end",), tag=f"{W_NS}p"):
+        parent = p.getparent()
+        if parent is not None and parent.tag == f"{W_NS}body" and needs_normal_style(p, names, default_id):
+            count += 1
+        p.clear()
+        while p.getprevious() is not None:  # Drop the paragraphs already checked
+            del parent[0]
+    return count
+
+
+def normalize_empty_paragraphs_xml(document_xml, names, default_id):
+    """document.xml with every empty non-Normal body paragraph set to the Normal style."""
+    normal_id = next((style_id for style_id, name in names.items() if name == "Normal"), None)
+    root = etree.fromstring(document_xml)
+    for p in root.find(f"{W_NS}body").iterchildren(f"{W_NS}p"):
+        if needs_normal_style(p, names, default_id):
+            set_paragraph_style(p, None if normal_id == default_id else normal_id)
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
 def check_compatibility(docx_path, output_path):
-    """Check compatibility of docx file and fix or flag any potential issues."""
-    ## Load the document
-    doc = Document(docx_path)
-    ## normalize empty paragraphs in a DOCX file
-    def normalize_empty_paragraphs(doc):      
-        for para in doc.paragraphs:
-            # Check if the paragraph is empty but has a non-Normal style
-            if not para.text.strip() and para.style.name != "Normal":
-                para.style = doc.styles["Normal"]
-        return doc
+    """
+    Check compatibility of docx file and fix or flag any potential issues: empty body paragraphs
+    with a non-Normal style are set to Normal.
 
-    doc = normalize_empty_paragraphs(doc)
-    # Save the modified document
-    doc.save(output_path)
-    print(f"Compatible document saved as: {output_path}")
+    Only word/document.xml is rewritten; every other part of the package (media included) is
+    copied to output_path without being recompressed. When nothing needs fixing, nothing is
+    written and the original document is used as it is.
+
+    :return: Path of the compatible document: output_path, or docx_path when it needed no fix.
+    """
+    with ZipFile(docx_path) as docx_zip:
+        names, default_id = paragraph_style_names(docx_zip.read(STYLES_PART))
+        if "Normal" not in names.values():
+            compat_logger.warning("%s has no Normal paragraph style, empty paragraphs are left as they are", docx_path)
+            to_fix = 0
+        else:
+            with docx_zip.open(DOCUMENT_PART) as document_file:
+                to_fix = count_paragraphs_to_normalize(document_file, names, default_id)
+
+        if not to_fix:
+            compat_logger.info("No compatibility fixes needed, using %s as it is", docx_path)
+            # A copy left by an earlier run would no longer match the document
+            if os.path.exists(output_path) and not os.path.samefile(output_path, docx_path):
+                os.remove(output_path)
+            return docx_path
+
+        document_xml = normalize_empty_paragraphs_xml(docx_zip.read(DOCUMENT_PART), names, default_id)
+
+    try:
+        rewrite_zip(docx_path, output_path, {DOCUMENT_PART: document_xml})
+    except ValueError as error:
+        # ZIP64 or otherwise unusual packages: inflate and deflate every member instead
+        compat_logger.warning("Copying the parts of %s as they are failed (%s), recompressing them", docx_path, error)
+        with ZipFile(docx_path) as docx_zip, atomic_output(output_path) as f, ZipFile(f, "w", ZIP_DEFLATED) as output_zip:
+            for info in docx_zip.infolist():
+                output_zip.writestr(info, document_xml if info.filename == DOCUMENT_PART else docx_zip.read(info))
+    compat_logger.info("%d empty paragraph(s) set to Normal, compatible document saved as: %s", to_fix, output_path)
+    return output_path
 
 
 
@@ -60,7 +188,7 @@ def check_for_missing_figures(docx_path, html_content):
     This function extracts figures from the DOCX file and verifies if they are present in the HTML.
 
     Args:
-        docx_path (str): Path to the DOCX file.
+        docx_path (str): Path to the DOCX file (or an open DocxPackage).
         html_content (str): HTML content as a string.
 
     Returns:
@@ -76,7 +204,7 @@ def check_for_missing_figures(docx_path, html_content):
 
     figures = []
 
-    with ZipFile(docx_path) as docx:
+    with docx_package(docx_path) as docx:
         # Load main document
         with docx.open('word/document.xml') as file:
             tree = ET.parse(file)
@@ -203,6 +331,21 @@ def get_font_info(style):
 
     return font_info
 
+def resolved_font_info(properties):
+    """get_font_info() for the properties of a StyleResolver (inherited and theme values included)."""
+    font_info = {}
+    if properties.get("font"):
+        font_info["fontFamily"] = properties["font"]
+    if properties.get("size"):
+        font_info["fontSize"] = convert_pt_to_rem(properties["size"])
+    if properties.get("bold"):
+        font_info["fontWeight"] = "bold"
+    if properties.get("italic"):
+        font_info["fontStyle"] = "italic"
+    if properties.get("color"):
+        font_info["color"] = properties["color"]
+    return font_info
+
 ## TABLES
 # Default styles for tables
 DEFAULT_STYLES = {
@@ -251,22 +394,85 @@ def clean_dict(data):
         return data
 
 
-# Function to compute the modal values while ignoring missing properties
-def compute_modal_style(styles_list):
-    # Add the default styles to ensure they are considered in the modal calculation
-    styles_list.append(GLOBAL_DEFAULT_STYLES.copy())
+def cell_role(row_idx, col_idx):
+    """th for the first row, td1 for the first column, td for the rest (as in extract_table_format)."""
+    if row_idx == 0:
+        return "th"
+    return "td1" if col_idx == 0 else "td"
+
+
+def is_vertical_merge_continuation(cell):
+    v_merge = cell._element.xpath('./w:tcPr/w:vMerge')
+    return bool(v_merge) and v_merge[0].get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val") in (None, "continue")
 
-    modal_styles = {}
-    all_keys = {key for styles in styles_list for key in styles}
-    
-    for key in all_keys:
-        values = [styles[key] for styles in styles_list if key in styles]
-        if values and Counter(values).most_common(1)[0][0] is not None:
-            modal_styles[key] = Counter(values).most_common(1)[0][0]
 
-    return modal_styles
+def table_cell_styles(doc, resolver=None):
+    """
+    Yield (role, style) for every visible cell of every table of a document, one cell at a time.
+    Horizontally merged cells are counted once and vertical merge continuations are skipped.
+    Font size, weight and color are the effective ones of the runs (styles and defaults included).
+    """
+    resolver = resolver or StyleResolver.from_document(doc)
+    default_font_size_rem = convert_pt_to_rem(resolver.style_properties().get("size") or 12)  ## Default font size extraction
+
+    for table in doc.tables:
+        for row_idx, row in enumerate(table.rows):
+            previous_tc = None
+            for col_idx, cell in enumerate(row.cells):
+                if cell._tc is previous_tc or is_vertical_merge_continuation(cell):
+                    continue
+                previous_tc = cell._tc
+
+                cell_style = {}
+
+                # Extract text alignment and font styles from the first paragraph with text
+                text_align = None
+                font_size = None
+                font_weight = None
+                font_color = None
+                for para in cell.paragraphs:
+                    if para.text.strip():
+                        text_align = get_paragraph_alignment(para)
+                        for run in para.runs:
+                            properties = resolver.run_properties(run, para)
+                            if properties.get("size"):
+                                font_size = convert_pt_to_rem(properties["size"])
+                            if properties.get("bold"):
+                                font_weight = "bold"
+                            if properties.get("color"):
+                                font_color = properties["color"]
+                        break  # Only need the first valid paragraph with text
+
+                if text_align:
+                    cell_style["textAlign"] = text_align
+                cell_style["fontSize"] = font_size if font_size else default_font_size_rem
+                cell_style["fontWeight"] = font_weight
+                cell_style["color"] = font_color
+
+                # Extract background color
+                shading = cell._element.xpath('.//w:shd/@w:fill')
+                cell_style["backgroundColor"] = f"#{shading[0]}" if shading else None  # Leave None to filter later
+
+                # Padding and vertical alignment
+                cell_style["padding"] = "5px"
+                cell_style["verticalAlign"] = map_vertical_align(get_cell_vertical_alignment(cell))
+
+                yield cell_role(row_idx, col_idx), cell_style
 
-def extract_table_default_styles(doc) -> dict:
+
+def count_table_styles(doc, stats=None, resolver=None):
+    """Add the cells of every table of a document to a TableStyleStats (a new one by default)."""
+    stats = stats or TableStyleStats()
+    stats.add_cells(table_cell_styles(doc, resolver))
+    stats.tables += len(doc.tables)
+    return stats
+
+
+def extract_table_default_styles(doc, stats=None, resolver=None) -> dict:
+    """
+    Table, th, td1 and td defaults: the most frequent style of every cell property over all tables
+    of the document, or over the corpus counted into stats (see extract_corpus_styles).
+    """
     table_styles = {
         "table": {
             "border": "1px solid black",
@@ -278,82 +484,12 @@ def extract_table_default_styles(doc) -> dict:
         "td": {}
     }
 
-    if not doc.tables:
+    stats = stats or count_table_styles(doc, resolver=resolver)
+    if not stats.tables:
         return table_styles
 
-    table = doc.tables[1]  # Assume second table defines the styles
-    default_font_size_rem = convert_pt_to_rem(get_doc_default_font_size(doc)) ## Default font size extraction
-
-    th_styles = []
-    td1_styles = []
-    td_styles = []
-
-
-    for row_idx, row in enumerate(table.rows):
-        for col_idx, cell in enumerate(row.cells):
-            cell_style = {}
-
-            # Extract text alignment
-            text_align = None
-            for para in cell.paragraphs:
-                if para.text.strip():
-                    text_align = get_paragraph_alignment(para)
-                    break
-            if text_align:
-                cell_style["textAlign"] = text_align
-
-            # Extract font styles
-            font_size = None
-            font_weight = None
-            font_color = None
-
-            for para in cell.paragraphs:
-                if para.text.strip():
-                    for run in para.runs:
-                        if run.font.size:
-                            font_size = convert_pt_to_rem(run.font.size.pt)
-                        elif para.style and para.style.font.size:
-                            font_size = convert_pt_to_rem(para.style.font.size.pt)
-
-                        if run.bold:
-                            font_weight = "bold"
-
-                        if run.font.color and run.font.color.rgb:
-                            font_color = f"#{run.font.color.rgb}"
-                        elif para.style and para.style.font.color and para.style.font.color.rgb:
-                            font_color = f"#{para.style.font.color.rgb}"
-                    break  # Only need the first valid paragraph with text
-
-            # if font_size:
-            #     cell_style["fontSize"] = font_size
-            # if font_weight:
-            #     cell_style["fontWeight"] = font_weight
-            # if font_color:
-            #     cell_style["color"] = font_color
-            cell_style["fontSize"] = font_size if font_size else default_font_size_rem
-            cell_style["fontWeight"] = font_weight if font_weight else None
-            cell_style["color"] = font_color if font_color else None
-
-            # Extract background color
-            shading = cell._element.xpath('.//w:shd/@w:fill')
-            cell_style["backgroundColor"] = f"#{shading[0]}" if shading else None  # Leave None to filter later
-            
-            # Padding and vertical alignment
-            cell_style["padding"] = "5px"
-            cell_style["verticalAlign"] = map_vertical_align(get_cell_vertical_alignment(cell))
-
-            # Store styles in respective lists
-            if row_idx == 0:
-                th_styles.append(cell_style)
-            elif col_idx == 0:
-                td1_styles.append(cell_style)
-            else:
-                td_styles.append(cell_style)
-
     # Compute the modal styles for each category
-    table_styles["th"] = compute_modal_style(th_styles)
-    table_styles["td1"] = compute_modal_style(td1_styles)
-    table_styles["td"] = compute_modal_style(td_styles)
+    table_styles.update(stats.modal_styles(fallback=GLOBAL_DEFAULT_STYLES))
 
     return clean_dict(table_styles)
 
@@ -374,24 +510,8 @@ def get_style_font_size(doc, style_name):
 
 
 def get_doc_default_font_size(doc):
-    """Extract the default font size from the document."""
-    # Get the XML element as a string
-    xml_data = doc.styles.element.xml
-
-    # Define the XML namespace
-    ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-
-    # Parse the XML
-    root = ET.fromstring(xml_data)
-
-    # Find the <w:docDefaults> section and locate <w:sz>
-    sz_element = root.find('.//w:docDefaults//w:sz', ns)
-
-    # Extract the font size
-    if sz_element is not None:
-        font_size = sz_element.attrib.get('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val')
-        return int(font_size) / 2 # Convert half-points to points 
-    return None
+    """Extract the default font size (docDefaults) from the document."""
+    return StyleResolver(doc.styles.element).defaults.get("size")
 
 
 def extract_styles(doc_path):
@@ -432,6 +552,73 @@ def extract_styles(doc_path):
         styles_data.update(table)
     return styles_data
 
+def extract_template_styles(doc_path, table_stats=None):
+    """
+    Extract the styles of the Word template a document was built from. Text styles are read from
+    the style definitions (Heading 1-6, Normal, List*, Caption) rather than from every paragraph,
+    so the result only depends on the template; table defaults come from the document's tables,
+    or from table_stats counted over every document of the template.
+
+    :param doc_path: Path of the DOCX, or an open DocxPackage sharing its parsed document.
+    """
+    doc = load_document(doc_path)
+
+    styles_data = {
+        "headings": {},
+        "body": {},
+        "lists": {},
+        "captions": {},
+    }
+
+    # Properties set by each style or inherited through its basedOn chain (theme fonts resolved)
+    resolver = StyleResolver.from_document(doc)
+    for style in doc.styles:
+        if style.type != WD_STYLE_TYPE.PARAGRAPH or not style.name:
+            continue
+        font_info = resolved_font_info(resolver.chain_properties(style.style_id))
+
+        if re.fullmatch(r"Heading [1-6]", style.name):
+            if font_info:
+                styles_data["headings"][style.name.replace("Heading ", "h")] = font_info
+
+        elif style.name == "Caption":
+            styles_data["captions"]["caption"] = font_info
+
+        elif style.name in ("List Bullet", "List Number", "List Paragraph"):
+            list_type = "ol" if "Number" in style.name else "ul"
+            if font_info:
+                styles_data["lists"].setdefault(list_type, font_info)
+
+        elif style.name == "Normal":
+            styles_data["body"]["p"] = font_info
+
+    # Extract default font size (Normal, else the document defaults)
+    default_font_size = resolver.style_properties().get("size") or 12
+    styles_data["body"].setdefault("p", {})["fontSize"] = convert_pt_to_rem(default_font_size)
+
+    ## TABLES (the table/th/td1/td defaults are always present, even without a table to read them from)
+    styles_data.update(extract_table_default_styles(doc, table_stats, resolver))
+    return styles_data
+
+
+def extract_corpus_styles(doc_paths):
+    """
+    Styles of a Word template from all of its documents: text styles from the first one, table
+    defaults from the cells of every table of every document (read one document at a time).
+
+    :return: {"styles": ..., "documents": n, "tables": {"tables": n, "cells": {...}}, "table_style_histograms": ...}
+    """
+    stats = TableStyleStats()
+    for doc_path in doc_paths:
+        count_table_styles(Document(doc_path), stats)
+    return {
+        "styles": extract_template_styles(doc_paths[0], stats),
+        "documents": len(doc_paths),
+        "tables": stats.summary(),
+        "table_style_histograms": stats.histograms(),
+    }
+
+
 def is_cell_merged(cell, row_idx, col_idx, merge_tracker):
     """Check if a Word table cell is merged (horizontally or vertically) and determine row span."""
     cell_xml = cell._tc  # Get the XML element of the table cell
@@ -461,186 +648,157 @@ def is_cell_merged(cell, row_idx, col_idx, merge_tracker):
     }
 
 
+def run_style(properties, default_style, intern):
+    """
+    Interned style tuple of a run (see table_records.RUN_STYLE_KEYS) from its StyleResolver
+    properties. color and fontSize are relative to the cell's default style: a value equal to
+    the default is left out.
+    """
+    color = properties.get("color")
+    font_size = convert_pt_to_rem(properties["size"]) if properties.get("size") else None
+    vert_align = properties.get("vertAlign")
+    return intern((
+        bool(properties.get("bold")), bool(properties.get("italic")), vert_align == "superscript", vert_align == "subscript",
+        color if color != default_style.get("color") else None,
+        font_size if font_size != default_style.get("fontSize") else None,
+    ))
 
-def extract_table_format(doc_path, default_styles: dict = DEFAULT_STYLES):
-    doc = Document(doc_path)
-    tables_info = {}
 
-    for table_idx, table in enumerate(doc.tables):
-        print(f"Processing table {table_idx + 1}...")
-        table_id = f"table_{table_idx}"  # Generate table ID
-        table_info = {
-            "headers": [],
-            "rows": []
-        }
+def cell_runs(cell, default_style, resolver, intern):
+    """
+    The TextRuns of a cell, with a LINE_BREAK between paragraphs and at inline newlines. Adjacent
+    runs with the same effective formatting (Word splits them at spell-check marks, revisions, ...)
+    are coalesced into one.
+    """
+    runs = []
+    for para in cell.paragraphs:
+        para_runs = para.runs
+        if not (para.text.strip() or any(run.text.strip() for run in para_runs)):
+            continue  # Ignore empty paragraphs
+        if runs:
+            runs.append(LINE_BREAK)
+        for run in para_runs:
+            if not run.text:
+                continue
+            style = run_style(resolver.run_properties(run, para), default_style, intern)
+            for i, segment in enumerate(run.text.split("\n")):
+                if i:
+                    runs.append(LINE_BREAK)
+                if not segment:
+                    continue
+                if runs and runs[-1].style is style:  # Interned: equal styles are the same tuple
+                    runs[-1].text += segment
+                else:
+                    runs.append(TextRun(segment, style))
+    return runs
 
+
+def cell_icon(paragraphs, table_idx):
+    """
+    (iconHtml, iconPosition) of the last keep-icon-<class>:<name> drawing in a cell's paragraphs, or
+    (None, None). Icons are always placed at the start of the cell.
+    """
+    icon = (None, None)
+    for para in paragraphs:
+        for drawing in para._element.iter('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing'):
+            doc_pr = drawing.find('.//wp:docPr', namespaces={'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'})
+            alt_text = doc_pr.attrib.get('descr', '').strip() if doc_pr is not None else ""
+            if not alt_text:
+                continue
+            parts = alt_text.split("-", 2)  # keep-icon-<class>:<name>
+            image_type = parts[1] if len(parts) > 1 else None
+            image_alt_text = parts[2] if len(parts) > 2 else ""
+            if image_type == "icon" and ":" in image_alt_text:
+                icon_class, icon_name = image_alt_text.split(":", 1)
+                icon = (f'<span class="{html.escape(icon_class)}">{html.escape(icon_name, quote=False)}</span>', "start")
+            else:
+                tables_logger.warning("Images not supported in tables yet (table %d): %s", table_idx, alt_text)
+    return icon
+
+
+def extract_table_records(doc_path, default_styles: dict = DEFAULT_STYLES):
+    """
+    Read the tables of a DOCX into compact records: {table_id: TableRecord} of slotted CellRecords
+    whose run segments share one interned style tuple per distinct formatting.
+    table_records.serialize_tables() turns them into the tables.json dictionary.
+    doc_path may be an open DocxPackage, whose parsed document is then shared.
+    """
+    doc = load_document(doc_path)
+    intern = StyleInterner()
+    resolver = StyleResolver.from_document(doc)
+    # Cells without a default color or font size show the body text's (Normal style)
+    body = resolver.style_properties()
+    body_style = {"color": body.get("color"), "fontSize": convert_pt_to_rem(body["size"]) if body.get("size") else None}
+    tables = {}
+
+    for table_idx, table in enumerate(doc.tables):
+        tables_logger.debug("Processing table %d...", table_idx + 1)
+        table_record = TableRecord()
         merge_tracker = {}  # Track merged cells {(row_idx, col_idx): remaining_span}
 
         for row_idx, row in enumerate(table.rows):
+            row_cells = row.cells  # Built from the XML on every access
             row_data = []
-            col_idx = 0  # Track actual column position for skipping merged cells
+            col_idx = 0
 
-            while col_idx < len(row.cells):
+            while col_idx < len(row_cells):
                 if (row_idx, col_idx) in merge_tracker:
                     merge_tracker[(row_idx, col_idx)] -= 1
                     if merge_tracker[(row_idx, col_idx)] == 0:
-                        del merge_tracker[(row_idx, col_idx)]  # Clear when done
+                        del merge_tracker[(row_idx, col_idx)]
                     col_idx += 1
                     continue  # Skip merged cells
 
-                cell = row.cells[col_idx]
-
-                # Determine default style based on position
-                if row_idx == 0:
-                    default_style = default_styles["th"]
-                elif col_idx == 0:
-                    default_style = default_styles["td1"]
-                else:
-                    default_style = default_styles["td"]
-
-                # Extract formatting and text as separate parts
-                text_parts = []
-                prev_para = None  # Track previous paragraph for detecting paragraph breaks
-
-                for para in cell.paragraphs:
-                    # Extract alt text from images in the paragraph, if the paragraph has an element
-                    img_matches = []
-                    if para._element is not None:
-                        for drawing in para._element.findall('.//w:drawing', namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                            print("Found a drawing element")
-                            doc_pr = drawing.find('.//wp:docPr', namespaces={'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'})
-                            if doc_pr is not None:
-                                alt_text = doc_pr.attrib.get('descr', '').strip()
-                                if alt_text:
-                                    img_match = {"alt_text": (alt_text)}
-                                    _, image_type, *image_alt_text = alt_text.split("-")
-                                    image_alt_text = "-".join(image_alt_text)
-                                    icon_class, icon_name = image_alt_text.split(":")
-                                    if image_type == "icon":
-                                        img_match["iconHtml"] = f"<span class={icon_class}>{icon_name}</span>"
-                                        img_match["iconPosition"] = "start" #TODO make dynamic based on actual position in cell: could also be top, bottom, end
-                                    else:
-                                        print("Images not supported in tables yet...")
-                            img_matches.append(img_match)
-
-                    if para.text.strip() or any(run.text.strip() for run in para.runs):  # Ignore empty paragraphs
-                        # Insert newline if this is a new paragraph (except for the first one)
-                        if prev_para is not None:
-                            text_parts.append({"text": "\n", "newline": True})
-
-                        prev_para = para  # Update previous paragraph tracker
+                cell = row_cells[col_idx]
 
-                        for run in para.runs:
-                            if run.text:
-                                # Handle inline newlines within a run
-                                segments = run.text.split("\n")
-                                for i, segment in enumerate(segments):
-                                    part = {"text": segment}
-                                    if run.bold:
-                                        part["bold"] = True
-                                    if run.italic:
-                                        part["italic"] = True
-                                    if run.font.superscript:
-                                        part["superscript"] = True
-                                    if run.font.subscript:
-                                        part["subscript"] = True
-                                    if run.font.color and run.font.color.rgb:
-                                        part["color"] = f"#{run.font.color.rgb}" if f"#{run.font.color.rgb}" != default_style.get("color") else None
-                                    if run.font.size:
-                                        part["fontSize"] = convert_pt_to_rem(run.font.size.pt)
-
-                                    text_parts.append(part)
-
-                                    # If this was a split part, add an explicit newline
-                                    if i < len(segments) - 1:
-                                        text_parts.append({"text": "\n", "newline": True})
-
-                # Check if any part has formatting
-                has_formatting = any(len(part) > 1 for part in text_parts if part["text"] != "\n")
-
-                # Check if all formatted parts share the same styling
-                def extract_format(part):
-                    """Extracts formatting keys (excluding text) from a part."""
-                    return {k: v for k, v in part.items() if k not in ["text", "newline"]}
-
-                common_format = extract_format(text_parts[0]) if text_parts else {}
-                all_same_format = all(extract_format(part) == common_format for part in text_parts if part["text"] != "\n")
-
-                # Handle different cases
-                if not text_parts:  # No text, return empty string
-                    actual_style = {"text": ""}
-                elif not has_formatting:  # Merge unformatted text, preserving newlines
-                    actual_style = {
-                        "text": "".join(
-                            part["text"] if "newline" not in part else "<br>"
-                            for part in text_parts
-                        )
-                    }
-                elif all_same_format:  # Merge text and apply common formatting at the top level, preserving newlines
-                    actual_style = {
-                        "text": "".join(
-                            part["text"] if "newline" not in part else "<br>"
-                            for part in text_parts
-                        ),
-                        **common_format  # Apply the shared formatting
-                    }
-                else:  # Mixed formatting, keep textParts
-                    actual_style = {"textParts": text_parts}
-
-
-                # Handle merged cells
+                # Merge first, so the text of continuation cells is never read
                 merge_info = is_cell_merged(cell, row_idx, col_idx, merge_tracker)
                 if "hidden" in merge_info:
                     col_idx += 1
-                    continue  # Skip storing this cell (it's a continuation of a merged cell)
+                    continue
 
                 if merge_info["colSpan"]:
-                    actual_style["colSpan"] = merge_info["colSpan"]
-                    for i in range(1, merge_info["colSpan"]):  # Skip following columns
+                    for i in range(1, merge_info["colSpan"]):
                         merge_tracker[(row_idx, col_idx + i)] = 1
-
                 if merge_info["rowSpan"]:
-                    actual_style["rowSpan"] = merge_info["rowSpan"]
-                    for i in range(1, merge_info["rowSpan"]):  # Track vertically merged cells
+                    for i in range(1, merge_info["rowSpan"]):
                         merge_tracker[(row_idx + i, col_idx)] = merge_info["rowSpan"] - i
 
-                # Extract other styles and replace if they differ from default
-                cell_text_align = get_paragraph_alignment(cell.paragraphs[0]) if cell.paragraphs else default_style.get("textAlign", "left")
-                
-                actual_style["textAlign"] = cell_text_align if cell_text_align != default_style["textAlign"] else None
-                cell_vertical_align = map_vertical_align(get_cell_vertical_alignment(cell))
-                actual_style["verticalAlign"] = cell_vertical_align if cell_vertical_align != default_style["verticalAlign"] else None
-
-                # Extract background color
+                default_style = {**body_style, **default_styles[cell_role(row_idx, col_idx)]}
+                paragraphs = cell.paragraphs
+                text_align = get_paragraph_alignment(paragraphs[0]) if paragraphs else default_style.get("textAlign", "left")
+                vertical_align = map_vertical_align(get_cell_vertical_alignment(cell))
                 shading = cell._element.xpath('.//w:shd/@w:fill')
-                actual_style["backgroundColor"] = f"#{shading[0]}" if shading else None
-
-                if img_matches:
-                    for img in img_matches: ## will be an empty list if none were found
-                        if "iconHtml" in img:
-                            actual_style["iconHtml"] = img["iconHtml"]
-                            actual_style["iconPosition"] = img["iconPosition"]
-                    
-
-                # Remove default styles
-                actual_style = clean_dict(actual_style)
-
-                # Determine if this is a header row or data row
+                icon_html, icon_position = cell_icon(paragraphs, table_idx)
+
+                record = CellRecord(
+                    cell_runs(cell, default_style, resolver, intern),
+                    col_span=merge_info["colSpan"],
+                    row_span=merge_info["rowSpan"],
+                    text_align=text_align if text_align != default_style.get("textAlign") else None,
+                    vertical_align=vertical_align if vertical_align != default_style.get("verticalAlign") else None,
+                    background_color=f"#{shading[0]}" if shading else None,
+                    icon_html=icon_html,
+                    icon_position=icon_position,
+                )
                 if row_idx == 0:
-                    table_info["headers"].append(actual_style)
+                    table_record.headers.append(record)
                 else:
-                    row_data.append(actual_style)
-
-                col_idx += 1  # Move to the next column
+                    row_data.append(record)
+                col_idx += 1
 
-            if row_idx > 0:  # Store only data rows (headers handled separately)
-                table_info["rows"].append(row_data)
+            if row_idx > 0:
+                table_record.rows.append(row_data)
 
-        tables_info[table_id] = table_info
+        tables[f"table_{table_idx}"] = table_record
 
-    return tables_info
+    tables_logger.debug("Table records: %d distinct run styles", len(intern.styles))
+    return tables
 
 
+def extract_table_format(doc_path, default_styles: dict = DEFAULT_STYLES):
+    """The tables.json dictionary of a DOCX: {table_id: {"headers": [cell, ...], "rows": [[cell, ...], ...]}}."""
+    return serialize_tables(extract_table_records(doc_path, default_styles))
 
 
 def extract_docx(doc_path, output_path):
@@ -654,10 +812,10 @@ def extract_docx(doc_path, output_path):
     return extracted_folder
 
 def parse_relationships(rels_path):
-    """Parses the relationships file to map image IDs to filenames."""
+    """Parses the relationships file (a path or a file object) to map image IDs to filenames."""
     image_map = {}
     
-    if os.path.exists(rels_path):
+    if not isinstance(rels_path, str) or os.path.exists(rels_path):
         tree = ET.parse(rels_path)
         root = tree.getroot()
         
@@ -670,17 +828,23 @@ def parse_relationships(rels_path):
     
     return image_map
 
-def extract_alt_texts(doc_xml_path, image_map, allowed_alt_texts, extracted_folder, output_path, image_folder):
-    """Extracts images based on allowed alt texts and renames them."""
+def extract_alt_texts(package, image_map, allowed_alt_texts, output_path, image_folder, writer=None, media_info=None):
+    """
+    Extracts images based on allowed alt texts and renames them, reading them straight from the
+    DocxPackage (nothing is unpacked to disk first).
+    If an OutputWriter is given, images are written through it so unchanged files are not rewritten.
+    If a media_info dictionary is given, it is filled with {"<image_folder>/<file>": {width, height,
+    bytes, hash, alt_text}} for every extracted image (sizes come from the image headers only).
+    """
     alt_text_map = {}
 
     # Create the output folder for images
     media_folder = os.path.join(output_path, image_folder)
-    print(f"📂 Creating media folder: {media_folder}")
-    os.makedirs(image_folder, exist_ok=True)
+    media_logger.debug("Creating media folder: %s", media_folder)
+    os.makedirs(media_folder, exist_ok=True)
     
-    if os.path.exists(doc_xml_path):
-        tree = ET.parse(doc_xml_path)
+    if DOCUMENT_PART in package:
+        tree = ET.parse(package.open(DOCUMENT_PART))
         root = tree.getroot()
 
         ns = {
@@ -702,31 +866,42 @@ def extract_alt_texts(doc_xml_path, image_map, allowed_alt_texts, extracted_fold
                     old_name = image_map[rid]
                     alt_text_map[os.path.splitext(old_name)[0]] = f"{image_folder}/{old_name}"
 
-                    old_path = os.path.join(extracted_folder, "word/media", old_name)
+                    part_name = f"{MEDIA_PART_FOLDER}/{old_name}"
                     new_path = os.path.join(media_folder, old_name)
-
-                    if os.path.exists(old_path):
-                        print(f"✅ Moving image: {old_name} ➝ {new_path}")
-                        shutil.move(old_path, new_path)
+                    if part_name not in package:
+                        media_logger.error("Image file not found: %s", part_name)
+                        continue
+
+                    # Media is streamed out once: not kept in the package's part cache
+                    data = package.read(part_name, cache=False)
+                    if media_info is not None:
+                        image_format, width, height = image_size(open_view(data))
+                        media_info[f"{image_folder}/{old_name}"] = {
+                            "format": image_format,
+                            "width": width,
+                            "height": height,
+                            "bytes": len(data),
+                            "hash": hash_bytes(data),
+                            "alt_text": alt_text,
+                        }
+
+                    if writer is not None:
+                        if writer.write_bytes(f"{image_folder}/{old_name}", data):
+                            media_logger.debug("Writing image: %s -> %s", old_name, new_path)
                     else:
-                        print(f"❌ ERROR: Image file not found: {old_path}")
+                        media_logger.debug("Writing image: %s -> %s", old_name, new_path)
+                        atomic_write(new_path, data)
     
     return alt_text_map
 
 
-def extract_docx_media(doc_path, output_path, media_folder, allowed_alt_texts):
-    """Extracts DOCX contents and images based on allowed alt texts."""
-    # Extract DOCX contents
-    extracted_folder = extract_docx(doc_path, output_path)
-
-    # Paths to XML files inside the extracted DOCX
-    rels_path = os.path.join(extracted_folder, "word/_rels/document.xml.rels")
-    doc_xml_path = os.path.join(extracted_folder, "word/document.xml")
+def extract_docx_media(doc_path, output_path, media_folder, allowed_alt_texts, writer=None, media_info=None):
+    """Extracts images based on allowed alt texts from a DOCX path or an open DocxPackage."""
+    with docx_package(doc_path) as package:
+        # Parse relationships to map image IDs to filenames
+        image_map = parse_relationships(package.open(DOCUMENT_RELS_PART)) if DOCUMENT_RELS_PART in package else {}
 
-    # Parse relationships to map image IDs to filenames
-    image_map = parse_relationships(rels_path)
-
-    alt_text_map = extract_alt_texts(doc_xml_path, image_map, allowed_alt_texts, extracted_folder, output_path, media_folder)
+        alt_text_map = extract_alt_texts(package, image_map, allowed_alt_texts, output_path, media_folder, writer, media_info)
 
     return alt_text_map
 
@@ -781,8 +956,8 @@ def table_replacer(match, counter=[0], table_caption_counter=[0]):
     if not caption_text.startswith("<p>Table"):
         if caption_text.startswith("<p>"):
             caption_text = caption_text[3:]
-        print(f"'Table ' not found in caption text for table {table_number}. Adding manually as: Table {table_caption_counter[0]+1}{caption_text}"[:-4])
         caption_text = f"Table {table_caption_counter[0]+1}{caption_text}"[:-4] ## [:-4] to remove </p> tag
+        html_logger.debug("'Table ' not found in caption text for table %d. Adding manually as: %s", table_number, caption_text)
 
     # Escape caption for safe inclusion in HTML attributes
     caption_escaped = html.escape(caption_text)  # <-- This should work now
@@ -808,26 +983,21 @@ def remove_captions_from_unwanted_figures(html_content: str) -> None:
       if first_em:
           em_text = first_em.get_text(strip=True)
           if figure_caption_pattern.match(em_text):
-              print(f"Removing orphaned figure caption: {em_text}")
+              figures_logger.debug("Removing orphaned figure caption: %s", em_text)
               p.decompose()
 
   return str(soup)
 
 
-def update_in_text_figure_references(html_content: str, image_mapping: list) -> str:
+def update_in_text_figure_references(html_content: str, figure_number_map: dict) -> str:
     """
     Update in-text figure references to match the new figure numbers.
+
+    :param figure_number_map: Original -> new figure number (FigureRegistry.number_map()).
     """
 
     soup = BeautifulSoup(html_content, "html.parser")
 
-    # Build a map from original figure number → new number
-    figure_number_map = {
-        str(item["figure_number"]): str(item["figure_number_new"])
-        for item in image_mapping
-        if item.get("figure_number") is not None and item.get("figure_number_new") is not None
-    }
-
     # Regex to find "Figure N"
     figure_ref_pattern = re.compile(r"\bFigure\s+(\d+)\b")
 
@@ -847,7 +1017,7 @@ def update_in_text_figure_references(html_content: str, image_mapping: list) ->
                     original_text
                 )
                 if new_text != original_text:
-                    print(f"Updating in-text reference: '{original_text.strip()}' → '{new_text.strip()}'")
+                    figures_logger.debug("Updating in-text reference: %r -> %r", original_text.strip(), new_text.strip())
                     descendant.replace_with(new_text)
 
     return str(soup)
@@ -870,6 +1040,8 @@ def generate_navigation_data(html_content):
 
     for tag in soup.find_all(['h1', 'h2', 'h3']):
         heading_id = tag.get('id')
+        if not heading_id and tag.name == 'h1' and H1_SECTION_CLASS in (tag.parent.get('class') or []):
+            heading_id = tag.parent.get('id')  # Moved to the section wrapper by wrap_h1_sections
         if not heading_id:
             heading_id = re.sub(r'\s+', '-', tag.text.strip().lower())
             tag['id'] = heading_id
@@ -920,6 +1092,118 @@ def insert_sub_navigation(html_content, nav_json):
     return html_content
 
 
+## Build-time layout: the same result as auto-wrap-sections.js and insertBr.js, without the runtime reflows
+
+H1_SECTION_CLASS = "h1-section"
+
+
+class DocumentOrderFormatter(HTMLFormatter):
+    """Like BeautifulSoup's "minimal" formatter, but keeps attributes in document order and writes <br>."""
+
+    def __init__(self):
+        super().__init__(entity_substitution=EntitySubstitution.substitute_xml, void_element_close_prefix=None)
+
+    def attributes(self, tag):
+        return tag.attrs.items()
+
+
+def wrap_h1_sections(soup):
+    """
+    Wraps every <h1> and the elements up to the next <h1> in a <div class="h1-section">, moving
+    the heading id to the wrapper and marking the heading as "wrapped" (as wrapHeadings() does).
+    """
+    for h1 in soup.find_all('h1'):
+        if "wrapped" in h1.get("class", []):
+            continue
+
+        wrapper = soup.new_tag("div", attrs={"class": H1_SECTION_CLASS})
+        if h1.get("id"):
+            wrapper["id"] = h1["id"]
+            del h1["id"]  # Prevent duplicate IDs
+
+        nodes = [h1]
+        node = h1.next_sibling
+        while node is not None and node.name != 'h1':
+            nodes.append(node)
+            node = node.next_sibling
+
+        h1.insert_before(wrapper)
+        for node in nodes:
+            wrapper.append(node.extract())
+        h1["class"] = h1.get("class", []) + ["wrapped"]
+    return soup
+
+
+def insert_paragraph_spacing(soup):
+    """
+    Adds a <br> after every paragraph outside captions and lists, and moves the spacing of lists
+    after their last item (as addBrAfterParagraphs() does).
+    """
+    for paragraph in soup.find_all('p'):
+        if not paragraph.find_parent(['caption', 'ul', 'ol']):
+            paragraph.insert_after(soup.new_tag("br"))
+
+    for list_tag in soup.find_all(['ul', 'ol']):
+        # Remove <br> before a list
+        previous = list_tag.previous_sibling
+        while isinstance(previous, NavigableString):
+            previous = previous.previous_sibling
+        if previous is not None and previous.name == "br":
+            previous.decompose()
+
+        items = list_tag.find_all(True, recursive=False)
+        if items:
+            items[-1].insert_after(soup.new_tag("br"))
+    return soup
+
+
+def build_section_layout(html_content, wrap_sections=True, paragraph_spacing=True):
+    """
+    Applies the section wrapping and paragraph spacing to content.html at build time, so the
+    viewer doesn't have to move every node and query every paragraph on page load.
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    if wrap_sections:
+        wrap_h1_sections(soup)
+    if paragraph_spacing:
+        insert_paragraph_spacing(soup)
+    return soup.decode(formatter=DocumentOrderFormatter())
+
+
+def split_h1_sections(html_content):
+    """
+    Splits content.html into one fragment per H1 section (a div.h1-section, or an <h1> and the
+    elements up to the next one when the sections aren't wrapped).
+
+    :return: (preamble_html, [(section_id, section_html), ...]). The preamble holds anything
+             before the first H1 and is usually empty.
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    formatter = DocumentOrderFormatter()
+    preamble = []
+    sections = []
+
+    for node in list(soup.contents):
+        if node.name == 'div' and H1_SECTION_CLASS in node.get('class', []):
+            sections.append((node.get('id') or f"section-{len(sections) + 1}", [node]))
+            continue
+        if node.name == 'h1':
+            heading_id = node.get('id') or re.sub(r'\s+', '-', node.text.strip().lower())
+            sections.append((heading_id, [node]))
+            continue
+        if not sections:
+            preamble.append(node)
+        elif sections[-1][1][0].name == 'h1' or not isinstance(node, NavigableString) or node.strip():
+            # Content of an unwrapped section (or a stray element after a wrapped one)
+            sections[-1][1].append(node)
+
+    def render(nodes):
+        return "".join(node.output_ready(formatter) if isinstance(node, NavigableString) else node.decode(formatter=formatter)
+                       for node in nodes)
+
+    return render(preamble).strip(), [(section_id, render(nodes)) for section_id, nodes in sections]
+
+
 
 ## Image html replacement
 def find_image_alt_text(html_content):
@@ -971,11 +1255,13 @@ def retrieve_all_figure_captions(docx_path, html_content, doc_img_src):
     Image = namedtuple('Image', ["figure_number", "figure_number_new", "figure_caption", "alt_text"])
 
     figure_captions = get_figure_captions(html_content, doc_img_src)
+    if len(figure_captions) == len(doc_img_src):
+        return figure_captions  # Every image was found in a <figure> with its caption
 
     figure_captions_revised = {}
     if not len(figure_captions) == len(doc_img_src):
-        print("⚠️ WARNING: Number of figure captions does not match number of images in the document.")
-        print("Sourcing missing figures from document...")
+        figures_logger.warning("Number of figure captions does not match number of images in the document. "
+                               "Sourcing missing figures from document...")
         missing_figures = check_for_missing_figures(docx_path, html_content)
         manual_sourcing_imgs = { os.path.splitext(os.path.basename(value['img_path']))[0]: key for key , value in missing_figures.items()}
         figure_counter = 1
@@ -989,8 +1275,8 @@ def retrieve_all_figure_captions(docx_path, html_content, doc_img_src):
                     figure_counter += 1
                 else:
                     # figure_captions_revised[image_name] = f"Figure {image_name} caption not found."
-                    print(f"⚠️ WARNING: Figure {image_name} caption not found.")
-                    print("If it is an icon, then it doesn't matter, otherwise please check the document.")
+                    figures_logger.warning("Figure %s caption not found. If it is an icon, then it doesn't matter, "
+                                           "otherwise please check the document.", image_name)
             else:
                 figure_captions_revised[image_name] = figure_captions[image_name]
                 figure_counter += 1
@@ -1009,9 +1295,9 @@ def parse_images_with_links_and_captions(docx_path):
     """
     image_info = []
     
-    with ZipFile(docx_path) as docx_zip:
-        document_xml = ET.fromstring(docx_zip.read("word/document.xml"))
-        rels_xml = ET.fromstring(docx_zip.read("word/_rels/document.xml.rels"))
+    with docx_package(docx_path) as package:
+        document_xml = ET.fromstring(package.read(DOCUMENT_PART))
+        rels_xml = ET.fromstring(package.read(DOCUMENT_RELS_PART))
 
     NS = {
         'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
@@ -1138,7 +1424,7 @@ def identify_image_type(keep_image_map):
     for keep_image in keep_image_map:
         _, image_type, *image_alt_text = keep_image["alt_text"].split("-")
         image_alt_text = "-".join(image_alt_text)
-        print(image_type)
+        figures_logger.debug("Image type: %s", image_type)
         if image_type == "icon":
             keep_image["image_type"] = image_type
             ## Add additional tags
@@ -1160,7 +1446,17 @@ def identify_image_type(keep_image_map):
 
     return keep_image_map
 
-def replace_images_with_divs(html_content, image_mapping):
+def image_data_src(image_meta):
+    """data-src of the div.image placeholder of a kept image (the key of its media.json entry)."""
+    return f"./assets/{image_meta['alt_text_new']}.png"
+
+
+def replace_images_with_divs(html_content, figures):
+    """
+    Replace every kept <img> (and its <figure>) with the div placeholder of its image type.
+
+    :param figures: The FigureRegistry of the document; each image is looked up by its src.
+    """
     class IconType(Enum):
         DROUGHT = "{{droughtRisk}}"
         FLOOD = "{{floodRisk}}"
@@ -1169,19 +1465,16 @@ def replace_images_with_divs(html_content, image_mapping):
     soup = BeautifulSoup(html_content, 'html.parser')
 
     for i, img in enumerate(soup.find_all('img')):
-        image_meta = image_mapping[i]
-        src = img.get('src')
-        alt_text = img.get('alt')
+        image_meta = figures.for_image(img.get('src'))
 
-        if src != image_meta["image_file"] or alt_text != image_meta["alt_text"]:
-            print(f"Image {i} does not match the criteria for replacement.")
+        if image_meta is None or not image_meta["kept"] or img.get('alt') != image_meta["alt_text"]:
+            figures_logger.debug("Image %d does not match the criteria for replacement.", i)
             continue
 
-        print(image_meta)
+        figures_logger.debug("Replacing image %d: %s", i, image_meta)
 
         # Determine replacement tag
         if image_meta["image_type"] == "icon":
-            print("icon")
             div_tag = soup.new_tag("div", **{
                 "data-icon-name": image_meta["icon"],
                 "data-icon-type": image_meta["class"].split("-")[0],
@@ -1199,7 +1492,6 @@ def replace_images_with_divs(html_content, image_mapping):
                 div_tag["data-caption"] = IconType.BUSHFIRE.value
 
         elif image_meta["image_type"] == "chart":
-            print("chart")
             div_tag = soup.new_tag("div", **{
                 "id": image_meta["chart"],
                 "data-caption": image_meta["figure_caption_new"],
@@ -1207,15 +1499,14 @@ def replace_images_with_divs(html_content, image_mapping):
             })
 
         elif image_meta["image_type"] == "image":
-            print("image")
             div_tag = soup.new_tag("div", **{
-                "data-src": f"./assets/{image_meta['alt_text_new']}.png",
+                "data-src": image_data_src(image_meta),
                 "data-caption": image_meta["figure_caption_new"],
                 "class": "image"
             })
 
         else:
-            print(f"Unknown image type for image {i}")
+            figures_logger.warning("Unknown image type for image %d", i)
             continue
 
         # Add optional link
@@ -1239,7 +1530,7 @@ def replace_images_with_divs(html_content, image_mapping):
 
         # If the next element is a <p> and contains at least one <em> tag, remove it
         if next_elem and next_elem.name == "p" and next_elem.find("em"):
-            print(f"Removing caption paragraph after image {i}")
+            figures_logger.debug("Removing caption paragraph after image %d", i)
             next_elem.decompose()
 
 
@@ -1255,7 +1546,7 @@ def replace_icons_with_placholders(html_content, icons_src: dict):
         src = img.get('src')
         if src in icons_src:
             src_name = icons_src[src]
-            print(src_name)
+            figures_logger.debug("Icon source: %s", src_name)
             if src_name:
                 icon_div = soup.new_tag("div")
                 icon_div['data-icon'] = src_name
@@ -1273,7 +1564,7 @@ def replace_charts_with_placeholders(html_content, charts_src: dict, figure_capt
 
     # Normalize chart src keys by basename
     normalized_charts_src = {os.path.basename(k): v for k, v in charts_src.items()}
-    print(f"Normalized chart src: {normalized_charts_src}")
+    figures_logger.debug("Normalized chart src: %s", normalized_charts_src)
 
     # Process all <figure> tags containing <img> tags with the source matching the charts_src keys
     for figure in soup.find_all('figure'):
@@ -1289,7 +1580,7 @@ def replace_charts_with_placeholders(html_content, charts_src: dict, figure_capt
 
                     # Lookup caption by image basename (e.g. 'image11')
                     key = os.path.splitext(src_basename)[0]
-                    print("looking up caption for key: ", key)
+                    figures_logger.debug("Looking up caption for key: %s", key)
                     if key in figure_captions:
                         chart_div['data-caption'] = f"Figure {figure_captions[key].figure_number}{figure_captions[key].figure_caption}"
                     # else:
@@ -1321,7 +1612,7 @@ def replace_images_with_placeholders(html_content, images_src: dict, figure_capt
 
     # Normalize images src keys by basename
     normalized_images_src = {os.path.basename(k): v for k, v in images_src.items()}
-    print(f"Normalized images src: {normalized_images_src}")
+    figures_logger.debug("Normalized images src: %s", normalized_images_src)
 
     # Process all <figure> tags containing <img> tags with the source matching the images_src keys
     for figure in soup.find_all('figure'):
@@ -1337,7 +1628,7 @@ def replace_images_with_placeholders(html_content, images_src: dict, figure_capt
 
                     # Lookup caption by image basename (e.g. 'image11')
                     key = os.path.splitext(src_basename)[0]
-                    print("looking up caption for key: ", key)
+                    figures_logger.debug("Looking up caption for key: %s", key)
                     if key in figure_captions:
                         image_div['data-caption'] = f"Figure {figure_captions[key].figure_number}{figure_captions[key].figure_caption}"
                     # else:
@@ -1353,13 +1644,18 @@ def replace_images_with_placeholders(html_content, images_src: dict, figure_capt
     return str(soup)
 
 
-def convert_docx_to_html(doc_path: str, lua_script: str,  keep_images: list):
+def convert_docx_to_html(doc_path: str, lua_script: str,  keep_images: list, metadata: dict = None, workdir: str = None):
     """
     Converts a DOCX file to HTML, removes image tags, and embeds custom CSS for Poppins font.
 
     :param doc_path: Path to the DOCX file.
     :param output_path: Path to save the output HTML file.
+    :param metadata: Extra metadata fields for the Lua filter, e.g. {"split_marker": ...} (see split_convert.py).
+    :param workdir: Folder pandoc runs in, and extracts the media to, instead of the current directory
+                    (pypandoc changes the directory of the whole process for the call: worker processes only).
     """
+    if workdir:
+        doc_path, lua_script = os.path.abspath(doc_path), os.path.abspath(lua_script)
     # Media to keep formatted for the lua script used by pypandoc
     metadata_json = generate_lua_lookup_table(keep_images)
 
@@ -1372,8 +1668,11 @@ def convert_docx_to_html(doc_path: str, lua_script: str,  keep_images: list):
             f"--lua-filter={lua_script}",  # Replace with your actual Lua filter file
             "--extract-media=.",  # Extract media to the current directory
             # "--metadata", f"keep_images={metadata_json}"  # Pass as JSON
-            "--metadata", f"keep_images={json.dumps(keep_images)}"  # Pass as JSON
-        ]
+            "--metadata", f"keep_images={json.dumps(keep_images)}",  # Pass as JSON
+            # The Lua filter only writes lua_log.txt when the pandoc stage is logging at DEBUG
+            "--metadata", f"lua_debug_log={'true' if pandoc_logger.isEnabledFor(logging.DEBUG) else 'false'}"
+        ] + [arg for key, value in (metadata or {}).items() for arg in ("--metadata", f"{key}={value}")],
+        cworkdir=workdir
     )
 
     return html
@@ -0,0 +1,232 @@
+import io
+import mmap
+import zlib
+from contextlib import contextmanager
+from zipfile import ZIP_DEFLATED, ZIP_STORED, BadZipFile, ZipFile
+
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.part import PartFactory
+from docx.package import Package
+
+try:
+    # python-docx internals (checked with 1.1 and 1.2): without them read_document opens the file again
+    from docx.opc.package import Unmarshaller
+    from docx.opc.pkgreader import PackageReader, _ContentTypeMap
+except ImportError:
+    PackageReader = None
+
+from conversion_logging import get_logger
+from zip_rewrite import LOCAL_HEADER, LOCAL_SIGNATURE
+
+logger = get_logger("pipeline")
+
+
+class PartReader(io.RawIOBase):
+    """Read-only, seekable file object over a memoryview (no copy of the underlying bytes)."""
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.view[self.position:self.position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+class PackagePartReader:
+    """
+    python-docx physical package reader over a DocxPackage (in place of its own ZipFile): every
+    part python-docx loads comes from the package's part cache, so it is inflated once for all
+    consumers, and a deflated part's blob is the very bytes object the cache holds.
+    """
+
+    def __init__(self, package):
+        self.package = package
+
+    def blob_for(self, pack_uri):
+        view = self.package.read(pack_uri.membername)
+        return view.obj if isinstance(view.obj, bytes) and len(view) == len(view.obj) else bytes(view)
+
+    def close(self):
+        pass
+
+    @property
+    def content_types_xml(self):
+        return self.blob_for(CONTENT_TYPES_URI)
+
+    def rels_xml_for(self, source_uri):
+        return self.blob_for(source_uri.rels_uri) if source_uri.rels_uri.membername in self.package else None
+
+
+def read_document(package):
+    """
+    The python-docx Document of a DocxPackage, loaded through PackagePartReader (as docx.Document
+    loads a file), or with docx.Document from its path when python-docx's internals changed.
+    """
+    if PackageReader is not None:
+        try:
+            return read_package_parts(package)
+        except AttributeError as error:
+            logger.warning("python-docx can't load %s from the package (%s), reading the file again", package.path, error)
+    return Document(package.path)
+
+
+def read_package_parts(package):
+    phys_reader = PackagePartReader(package)
+    content_types = _ContentTypeMap.from_xml(phys_reader.content_types_xml)
+    package_rels = PackageReader._srels_for(phys_reader, PACKAGE_URI)
+    parts = PackageReader._load_serialized_parts(phys_reader, package_rels, content_types)
+    opc_package = Package()
+    Unmarshaller.unmarshal(PackageReader(content_types, package_rels, parts), opc_package, PartFactory)
+    document_part = opc_package.main_document_part
+    if document_part.content_type != CT.WML_DOCUMENT_MAIN:
+        raise ValueError(f"file '{package.path}' is not a Word file, content type is '{document_part.content_type}'")
+    return document_part.document
+
+
+class DocxPackage:
+    """
+    One DOCX opened once for every stage that reads it:
+
+        with DocxPackage(docx_path) as package:
+            package.read("word/document.xml")        # memoryview, inflated on first access then cached
+            package.open("word/media/image1.png")    # file object over the same bytes
+            package.document()                       # python-docx Document, loaded once
+
+    The file is memory-mapped (read-only) and its central directory read once. Stored members
+    are views into the map; deflated ones are inflated once and kept (unless read with
+    cache=False, as media that is only streamed out once). The map stays valid if the file is
+    replaced by a rename while it is open, as the pipeline's atomic writes do, also on NFS.
+    The views of stored members are released by close(): don't use them after it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as error:  # Empty file
+                raise BadZipFile(f"{path}: {error}") from error
+        self._view = memoryview(self._map)
+        try:
+            with ZipFile(PartReader(self._view)) as zip_file:
+                self._members = {info.filename: info for info in zip_file.infolist()}
+        except BadZipFile:
+            self._view.release()
+            self._map.close()
+            raise
+        self._parts = {}
+        self._exports = []  # Views of the map handed out (stored members), released by close()
+        self._document = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._parts.clear()
+        self._document = None
+        for view in self._exports:
+            view.release()
+        self._exports.clear()
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # A view made from one of ours (memoryview(view), ...) is still alive: unmapped once it is gone
+            logger.warning("%s: a view of the package is still in use, it stays mapped until that view is released", self.path)
+
+    def names(self):
+        return list(self._members)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def info(self, name):
+        """The ZipInfo of a member (size, CRC) from the central directory, without reading it."""
+        return self._members[name]
+
+    def _raw(self, info):
+        """View of a member's compressed bytes in the map."""
+        with self._view[info.header_offset:info.header_offset + LOCAL_HEADER.size] as header:
+            fields = LOCAL_HEADER.unpack(header)
+        if fields[0] != LOCAL_SIGNATURE:
+            raise BadZipFile(f"{self.path}: bad local header for {info.filename}")
+        start = info.header_offset + LOCAL_HEADER.size + fields[9] + fields[10]
+        return self._view[start:start + info.compress_size]
+
+    def read(self, name, cache=True):
+        """The bytes of a member as a memoryview."""
+        if name in self._parts:
+            return self._parts[name]
+        info = self._members.get(name)
+        if info is None:
+            raise KeyError(f"There is no item named {name!r} in {self.path}")
+
+        raw = self._raw(info)
+        if info.compress_type == ZIP_STORED:
+            data = raw
+            self._exports.append(data)
+        elif info.compress_type == ZIP_DEFLATED:
+            with raw:
+                data = memoryview(zlib.decompress(raw, -15, info.file_size or zlib.DEF_BUF_SIZE))
+        else:
+            raw.release()
+            raise BadZipFile(f"{self.path}: unsupported compression {info.compress_type} for {name}")
+        if zlib.crc32(data) != info.CRC:
+            raise BadZipFile(f"{self.path}: bad CRC for {name}")
+
+        if cache:
+            self._parts[name] = data
+        return data
+
+    def open(self, name, cache=True):
+        """A binary file object over read(name)."""
+        return open_view(self.read(name, cache))
+
+    def document(self):
+        """The python-docx Document of the package, loaded from the part cache once and shared."""
+        if self._document is None:
+            self._document = read_document(self)
+        return self._document
+
+
+def open_view(view):
+    """A buffered binary file object over a memoryview (ElementTree, image header readers)."""
+    return io.BufferedReader(PartReader(view))
+
+
+def load_document(source):
+    """The python-docx Document of a path, or the one shared by a DocxPackage."""
+    return source.document() if isinstance(source, DocxPackage) else Document(source)
+
+
+@contextmanager
+def docx_package(source):
+    """A DocxPackage for a path (opened and closed around the block), or the shared one passed in."""
+    if isinstance(source, DocxPackage):
+        yield source
+    else:
+        with DocxPackage(source) as package:
+            yield package
@@ -0,0 +1,222 @@
+import re
+import xml.etree.ElementTree as ET
+
+from conversion_logging import get_logger
+from docx_converter import ALT_TEXT_KEEP_PREFIX, clean_figure_caption
+from docx_package import docx_package
+
+logger = get_logger("figures")
+
+NS = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+}
+RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# SEQ field of a Word caption: " SEQ Figure \* ARABIC "
+SEQ_FIELD_PATTERN = re.compile(r'SEQ\s+(\w+)')
+NUMBERING_TYPES = {"ARABIC": "numeric", "ALPHABETIC": "alphabetic", "ROMAN": "roman"}
+
+# Captions typed by hand instead of with a SEQ field: "Figure 3: Rainfall"
+TYPED_CAPTION_PATTERN = re.compile(r'^(Figure)\s+([A-Za-z0-9]+)')
+
+# Separator between the figure number and the caption text, which pandoc drops from <figcaption>
+CAPTION_SEPARATOR_PATTERN = re.compile(r'^[\s:.\-–—]+')
+
+
+def paragraph_text(paragraph):
+    return "".join(t.text or "" for t in paragraph.iter(f"{{{NS['w']}}}t"))
+
+
+def caption_field(paragraph):
+    """(label, number, numbering type) of the SEQ field in a caption paragraph, simple or complex."""
+    for fld in paragraph.iter(f"{{{NS['w']}}}fldSimple"):
+        match = SEQ_FIELD_PATTERN.search(fld.get(f"{{{NS['w']}}}instr", ""))
+        if match:
+            return match.group(1), paragraph_text(fld).strip() or None, numbering_type(fld.get(f"{{{NS['w']}}}instr"))
+
+    # Complex field: <w:instrText> SEQ Figure </w:instrText>, then the number in the runs after the separator
+    instr, number, in_result = None, [], False
+    for run in paragraph.iter(f"{{{NS['w']}}}r"):
+        char = run.find('w:fldChar', NS)
+        if char is not None:
+            char_type = char.get(f"{{{NS['w']}}}fldCharType")
+            if char_type == "separate" and instr:
+                in_result = True
+            elif char_type == "end" and instr:
+                break
+            continue
+        instr_text = run.find('w:instrText', NS)
+        if instr_text is not None and SEQ_FIELD_PATTERN.search(instr_text.text or ""):
+            instr = instr_text.text
+        elif in_result:
+            number.append(paragraph_text(run))
+    if instr:
+        return SEQ_FIELD_PATTERN.search(instr).group(1), "".join(number).strip() or None, numbering_type(instr)
+    return None, None, ""
+
+
+def numbering_type(instr):
+    match = re.search(r'\\\*\s*([A-Za-z]+)', instr or "")
+    if not match:
+        return "unknown"
+    return NUMBERING_TYPES.get(match.group(1).upper(), "unknown")
+
+
+def parse_caption(paragraph):
+    """
+    Figure label, number and caption text of the paragraph following a drawing, or None when it
+    isn't a figure caption. The caption text is what follows "Figure N", as pandoc renders it.
+    """
+    text = paragraph_text(paragraph).strip()
+    label, number, numbering = caption_field(paragraph)
+    if label != "Figure" or not number:
+        match = TYPED_CAPTION_PATTERN.match(text)
+        if not match:
+            return None
+        label, number, numbering = match.group(1), match.group(2), "typed"
+
+    match = re.match(rf'^{label}\s*{re.escape(number)}', text)
+    caption = text[match.end():] if match else text
+    return {
+        "figure_label": f"{label} ",
+        "figure_number": number,
+        "figure_caption": clean_figure_caption(CAPTION_SEPARATOR_PATTERN.sub("", caption)).strip(),
+        "caption_text": text,
+        "numbering_type": numbering,
+    }
+
+
+def image_type_fields(alt_text):
+    """Image type and its extra fields from a kept alt text: keep-image-<name>, keep-chart-<id>, keep-icon-<class>:<icon>."""
+    _, image_type, *rest = alt_text.split("-")
+    name = "-".join(rest)
+    if image_type == "image":
+        return {"image_type": "image", "alt_text_new": name}
+    if image_type == "chart":
+        return {"image_type": "chart", "chart": name}
+    if image_type == "icon" and ":" in name:
+        icon_class, icon_name = name.split(":", 1)
+        return {"image_type": "icon", "class": icon_class, "icon": icon_name}
+    logger.warning("Unknown image type in alt text %r", alt_text)
+    return {"image_type": None}
+
+
+class FigureRegistry:
+    """
+    Every drawing of a DOCX, keyed by the rId of its image, built in one pass over document.xml:
+
+        figures = FigureRegistry.from_docx(docx_path)
+        figures["rId9"]                               # {"image_file": "./media/image1.png", "figure_number": "1", ...}
+        figures.for_image("./media/image1.png")       # same entry, by the <img src> pandoc writes
+        figures.number_map()                          # {"1": "1", "3": "2", ...} original -> new figure number
+
+    Kept drawings (alt text starting with "keep-") get their image type, and the figure captions
+    among them are renumbered in document order: if Figures 1-3 are dropped, Figure 4 becomes Figure 1.
+    """
+
+    def __init__(self):
+        self.figures = {}   # rId -> figure, in document order
+        self.by_file = {}   # ./media/imageN.png -> figure
+
+    def __getitem__(self, rid):
+        return self.figures[rid]
+
+    def __contains__(self, rid):
+        return rid in self.figures
+
+    def __iter__(self):
+        return iter(self.figures.values())
+
+    def __len__(self):
+        return len(self.figures)
+
+    def get(self, rid, default=None):
+        return self.figures.get(rid, default)
+
+    def for_image(self, src):
+        """The figure whose image pandoc wrote as <img src="./media/imageN.png">."""
+        return self.by_file.get(src)
+
+    def kept(self):
+        return [figure for figure in self.figures.values() if figure["kept"]]
+
+    def number_map(self, label="Figure "):
+        """Original -> new number of every kept figure with this caption label."""
+        return {
+            figure["figure_number"]: figure["figure_number_new"]
+            for figure in self.kept()
+            if figure["figure_label"] == label and figure["figure_number_new"] is not None
+        }
+
+    def add(self, figure):
+        if figure["image_id"] in self.figures:
+            return  # The same image used again: the first occurrence owns its caption and number
+        self.figures[figure["image_id"]] = figure
+        self.by_file.setdefault(figure["image_file"], figure)
+
+    @classmethod
+    def from_docx(cls, docx_path, keep_prefix=ALT_TEXT_KEEP_PREFIX):
+        with docx_package(docx_path) as package:
+            document_xml = ET.fromstring(package.read("word/document.xml"))
+            rels_xml = ET.fromstring(package.read("word/_rels/document.xml.rels"))
+        rels_lookup = {rel.get('Id'): rel.get('Target') for rel in rels_xml.findall(f"{RELS_NS}Relationship")}
+
+        registry = cls()
+        counters = {}   # caption label -> number of kept figures so far
+        awaiting_caption = None
+        for paragraph in document_xml.iter(f"{{{NS['w']}}}p"):
+            if awaiting_caption is not None:
+                registry.caption(awaiting_caption, parse_caption(paragraph), counters)
+                awaiting_caption = None
+
+            for drawing in paragraph.iter(f"{{{NS['w']}}}drawing"):
+                blip = drawing.find('.//a:blip', NS)
+                rid = blip.get(f"{{{NS['r']}}}embed") if blip is not None else None
+                if rid is None:
+                    continue
+                docpr = drawing.find('.//wp:docPr', NS)
+                alt_text = (docpr.get("descr") or docpr.get("name") or "") if docpr is not None else ""
+                hlink = drawing.find('.//a:hlinkClick', NS)
+                link_rid = hlink.get(f"{{{NS['r']}}}id") if hlink is not None else None
+                kept = alt_text.startswith(keep_prefix)
+
+                figure = {
+                    "image_id": rid,
+                    "image_file": f"./{rels_lookup.get(rid)}",
+                    "link_id": link_rid,
+                    "link_url": rels_lookup.get(link_rid),
+                    "alt_text": alt_text,
+                    "kept": kept,
+                    "figure_label": None,
+                    "figure_number": None,
+                    "figure_number_new": None,
+                    "figure_caption": "",
+                    "figure_caption_new": "",
+                    "caption_text": "",
+                    "caption_text_new": "",
+                    "numbering_type": "",
+                    **(image_type_fields(alt_text) if kept else {"image_type": None}),
+                }
+                if rid not in registry:
+                    registry.add(figure)
+                    # The caption is the paragraph after the drawing (the first drawing of a paragraph)
+                    awaiting_caption = awaiting_caption or rid
+
+        logger.debug("Figure registry: %d drawings, %d kept", len(registry), len(registry.kept()))
+        return registry
+
+    def caption(self, rid, caption, counters):
+        """Attach a parsed caption to a figure and give kept figures their new number."""
+        if caption is None:
+            return
+        figure = self.figures[rid]
+        figure.update(caption)
+        if figure["kept"]:
+            label = caption["figure_label"]
+            counters[label] = counters.get(label, 0) + 1
+            figure["figure_number_new"] = str(counters[label])
+            figure["figure_caption_new"] = figure["figure_caption"]
+            figure["caption_text_new"] = f"{label}{figure['figure_number_new']} {figure['figure_caption']}".rstrip()
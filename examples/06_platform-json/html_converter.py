@@ -4,6 +4,10 @@ import html
 from pathlib import Path
 import json
 
+from conversion_logging import get_logger
+
+logger = get_logger("platform_json")
+
 INLINE_TAGS = {
     "b": "bold",
     "strong": "bold",
@@ -83,7 +87,7 @@ def extract_text_with_links(tag):
 
             # Handle <div class="icon"> as inline
             elif node.name == "div" and "icon" in node.get("class", []):
-                print(f"Found icon div: {node}")
+                logger.debug("Found icon div: %s", node)
                 return [{
                     "type": "icon",
                     "caption": node.get("data-caption"),
@@ -94,13 +98,12 @@ def extract_text_with_links(tag):
 
             # Ignore other divs (especially inside paragraphs)
             elif node.name == "div":
-                print(f"Skipping div: {node}")
+                logger.debug("Skipping div: %s", node)
                 return []  # skip generic divs in inline parsing
 
             # Fallback
             else:
-                print(f"Unknown tag: {node.name}. Skipping.")
-                print(f"Node: {node}")
+                logger.debug("Unknown tag: %s. Node: %s", node.name, node)
                 return [{
                     "type": node.name,
                     "attributes": dict(node.attrs),
@@ -188,6 +191,10 @@ def html_convert(soup):
             if "icon" in div_class:
                 continue
 
+            # Skip build-time section wrappers (the structure comes from the headings)
+            if "h1-section" in div_class:
+                continue
+
             div_type = div_class[0] if div_class else "other"
             div_content = {
                 "type": div_type,
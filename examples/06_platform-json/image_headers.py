@@ -0,0 +1,73 @@
+import struct
+
+# Enough for the PNG, GIF, BMP and WebP headers. JPEG is scanned marker by marker.
+HEADER_BYTES = 32
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC) hold the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(f):
+    """Walk the JPEG segments until a start-of-frame marker, without reading the image data."""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # Markers without a length
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            segment = f.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack(">HH", segment[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def image_size(f):
+    """
+    Return (format, width, height) of an image file object by reading only its header, or
+    (None, None, None) for formats we can't size (EMF, SVG, ...).
+    """
+    head = f.read(HEADER_BYTES)
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return "png", width, height
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        width, height = struct.unpack("<HH", head[6:10])
+        return "gif", width, height
+    if head.startswith(b"BM") and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return "bmp", width, abs(height)  # Negative height = top-down bitmap
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "webp", int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    if head.startswith(b"\xff\xd8"):
+        size = jpeg_size(f)
+        if size:
+            return "jpeg", *size
+    return None, None, None
+
+
+def read_image_size(path):
+    """image_size() of the file at path."""
+    with open(path, "rb") as f:
+        return image_size(f)
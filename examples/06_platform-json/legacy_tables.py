@@ -0,0 +1,191 @@
+"""
+The original dict-per-segment table extraction, kept unchanged as the baseline of the memory
+benchmark (benchmark.py --memory). The pipeline uses dc.extract_table_format.
+"""
+from docx import Document
+
+from docx_converter import (DEFAULT_STYLES, clean_dict, convert_pt_to_rem, get_cell_vertical_alignment,
+                            get_paragraph_alignment, is_cell_merged, map_vertical_align, tables_logger)
+
+
+def extract_table_format_dicts(doc_path, default_styles: dict = DEFAULT_STYLES):
+    """
+    The original extract_table_format, building a dictionary per run segment as it reads the
+    cells (without run coalescing or default-relative formatting).
+    """
+    doc = Document(doc_path)
+    tables_info = {}
+
+    for table_idx, table in enumerate(doc.tables):
+        tables_logger.debug("Processing table %d...", table_idx + 1)
+        table_id = f"table_{table_idx}"  # Generate table ID
+        table_info = {
+            "headers": [],
+            "rows": []
+        }
+
+        merge_tracker = {}  # Track merged cells {(row_idx, col_idx): remaining_span}
+
+        for row_idx, row in enumerate(table.rows):
+            row_data = []
+            col_idx = 0  # Track actual column position for skipping merged cells
+
+            while col_idx < len(row.cells):
+                if (row_idx, col_idx) in merge_tracker:
+                    merge_tracker[(row_idx, col_idx)] -= 1
+                    if merge_tracker[(row_idx, col_idx)] == 0:
+                        del merge_tracker[(row_idx, col_idx)]  # Clear when done
+                    col_idx += 1
+                    continue  # Skip merged cells
+
+                cell = row.cells[col_idx]
+
+                # Determine default style based on position
+                if row_idx == 0:
+                    default_style = default_styles["th"]
+                elif col_idx == 0:
+                    default_style = default_styles["td1"]
+                else:
+                    default_style = default_styles["td"]
+
+                # Extract formatting and text as separate parts
+                text_parts = []
+                prev_para = None  # Track previous paragraph for detecting paragraph breaks
+
+                for para in cell.paragraphs:
+                    # Extract alt text from images in the paragraph, if the paragraph has an element
+                    img_matches = []
+                    if para._element is not None:
+                        for drawing in para._element.findall('.//w:drawing', namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
+                            tables_logger.debug("Found a drawing element in table %d, row %d", table_idx, row_idx)
+                            doc_pr = drawing.find('.//wp:docPr', namespaces={'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'})
+                            if doc_pr is not None:
+                                alt_text = doc_pr.attrib.get('descr', '').strip()
+                                if alt_text:
+                                    img_match = {"alt_text": (alt_text)}
+                                    _, image_type, *image_alt_text = alt_text.split("-")
+                                    image_alt_text = "-".join(image_alt_text)
+                                    icon_class, icon_name = image_alt_text.split(":")
+                                    if image_type == "icon":
+                                        img_match["iconHtml"] = f"<span class={icon_class}>{icon_name}</span>"
+                                        img_match["iconPosition"] = "start" #TODO make dynamic based on actual position in cell: could also be top, bottom, end
+                                    else:
+                                        tables_logger.warning("Images not supported in tables yet (table %d): %s", table_idx, alt_text)
+                            img_matches.append(img_match)
+
+                    if para.text.strip() or any(run.text.strip() for run in para.runs):  # Ignore empty paragraphs
+                        # Insert newline if this is a new paragraph (except for the first one)
+                        if prev_para is not None:
+                            text_parts.append({"text": "\n", "newline": True})
+
+                        prev_para = para  # Update previous paragraph tracker
+
+                        for run in para.runs:
+                            if run.text:
+                                # Handle inline newlines within a run
+                                segments = run.text.split("\n")
+                                for i, segment in enumerate(segments):
+                                    part = {"text": segment}
+                                    if run.bold:
+                                        part["bold"] = True
+                                    if run.italic:
+                                        part["italic"] = True
+                                    if run.font.superscript:
+                                        part["superscript"] = True
+                                    if run.font.subscript:
+                                        part["subscript"] = True
+                                    if run.font.color and run.font.color.rgb:
+                                        part["color"] = f"#{run.font.color.rgb}" if f"#{run.font.color.rgb}" != default_style.get("color") else None
+                                    if run.font.size:
+                                        part["fontSize"] = convert_pt_to_rem(run.font.size.pt)
+
+                                    text_parts.append(part)
+
+                                    # If this was a split part, add an explicit newline
+                                    if i < len(segments) - 1:
+                                        text_parts.append({"text": "\n", "newline": True})
+
+                # Check if any part has formatting
+                has_formatting = any(len(part) > 1 for part in text_parts if part["text"] != "\n")
+
+                # Check if all formatted parts share the same styling
+                def extract_format(part):
+                    """Extracts formatting keys (excluding text) from a part."""
+                    return {k: v for k, v in part.items() if k not in ["text", "newline"]}
+
+                common_format = extract_format(text_parts[0]) if text_parts else {}
+                all_same_format = all(extract_format(part) == common_format for part in text_parts if part["text"] != "\n")
+
+                # Handle different cases
+                if not text_parts:  # No text, return empty string
+                    actual_style = {"text": ""}
+                elif not has_formatting:  # Merge unformatted text, preserving newlines
+                    actual_style = {
+                        "text": "".join(
+                            part["text"] if "newline" not in part else "<br>"
+                            for part in text_parts
+                        )
+                    }
+                elif all_same_format:  # Merge text and apply common formatting at the top level, preserving newlines
+                    actual_style = {
+                        "text": "".join(
+                            part["text"] if "newline" not in part else "<br>"
+                            for part in text_parts
+                        ),
+                        **common_format  # Apply the shared formatting
+                    }
+                else:  # Mixed formatting, keep textParts
+                    actual_style = {"textParts": text_parts}
+
+
+                # Handle merged cells
+                merge_info = is_cell_merged(cell, row_idx, col_idx, merge_tracker)
+                if "hidden" in merge_info:
+                    col_idx += 1
+                    continue  # Skip storing this cell (it's a continuation of a merged cell)
+
+                if merge_info["colSpan"]:
+                    actual_style["colSpan"] = merge_info["colSpan"]
+                    for i in range(1, merge_info["colSpan"]):  # Skip following columns
+                        merge_tracker[(row_idx, col_idx + i)] = 1
+
+                if merge_info["rowSpan"]:
+                    actual_style["rowSpan"] = merge_info["rowSpan"]
+                    for i in range(1, merge_info["rowSpan"]):  # Track vertically merged cells
+                        merge_tracker[(row_idx + i, col_idx)] = merge_info["rowSpan"] - i
+
+                # Extract other styles and replace if they differ from default
+                cell_text_align = get_paragraph_alignment(cell.paragraphs[0]) if cell.paragraphs else default_style.get("textAlign", "left")
+                
+                actual_style["textAlign"] = cell_text_align if cell_text_align != default_style["textAlign"] else None
+                cell_vertical_align = map_vertical_align(get_cell_vertical_alignment(cell))
+                actual_style["verticalAlign"] = cell_vertical_align if cell_vertical_align != default_style["verticalAlign"] else None
+
+                # Extract background color
+                shading = cell._element.xpath('.//w:shd/@w:fill')
+                actual_style["backgroundColor"] = f"#{shading[0]}" if shading else None
+
+                if img_matches:
+                    for img in img_matches: ## will be an empty list if none were found
+                        if "iconHtml" in img:
+                            actual_style["iconHtml"] = img["iconHtml"]
+                            actual_style["iconPosition"] = img["iconPosition"]
+                    
+
+                # Remove default styles
+                actual_style = clean_dict(actual_style)
+
+                # Determine if this is a header row or data row
+                if row_idx == 0:
+                    table_info["headers"].append(actual_style)
+                else:
+                    row_data.append(actual_style)
+
+                col_idx += 1  # Move to the next column
+
+            if row_idx > 0:  # Store only data rows (headers handled separately)
+                table_info["rows"].append(row_data)
+
+        tables_info[table_id] = table_info
+
+    return tables_info
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from conversion_logging import get_logger
+
+logger = get_logger("output")
+
+# Name of the manifest written into each output folder
+MANIFEST_FILE = "manifest.json"
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the sha256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Open a temporary file in the target folder for writing and rename it into place when the
+    block completes, so readers never see a partially written file (it is removed on error).
+    """
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(path, data: bytes):
+    """
+    Write bytes to a temporary file in the target folder and rename it into place,
+    so readers never see a partially written file.
+    """
+    with atomic_output(path) as f:
+        f.write(data)
+
+
+def write_if_changed(path, data: bytes) -> bool:
+    """
+    Atomically write bytes to path unless the file already holds the same content.
+    Returns True if the file was written.
+    """
+    if os.path.exists(path) and os.path.getsize(path) == len(data) and hash_file(path) == hash_bytes(data):
+        return False
+    atomic_write(path, data)
+    return True
+
+
+def dump_json(data, indent=2) -> bytes:
+    """Serialize JSON the same way the pipeline always has (json.dump with indent)."""
+    return json.dumps(data, indent=indent).encode("utf-8")
+
+
+class OutputWriter:
+    """
+    Writes the files of one output folder (app/<doc>) only when their content changes.
+
+    Every file goes through write_bytes(), which compares the sha256 of the new content
+    with what is already on disk and skips the write when they match. Changed files are
+    written atomically (temp file + rename). finalize() removes files written by the
+    previous run that were not produced this time and saves a manifest listing what was
+    added, changed, unchanged and removed, so sync jobs and cache purges can act on the
+    real differences only.
+    """
+
+    def __init__(self, output_path, manifest_name=MANIFEST_FILE):
+        self.output_path = output_path
+        self.manifest_path = os.path.join(output_path, manifest_name)
+        self.previous = self._load_manifest()
+        self.files = {}
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _current_digest(self, rel_path, target):
+        """Hash of the file currently on disk, reusing the manifest entry when size and mtime still match."""
+        if not os.path.exists(target):
+            return None
+        stat = os.stat(target)
+        previous = self.previous.get(rel_path)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            return previous["sha256"]
+        return hash_file(target)
+
+    def write_bytes(self, rel_path, data: bytes) -> bool:
+        """Write data to output_path/rel_path if it differs. Returns True if the file was written."""
+        rel_path = rel_path.replace(os.sep, "/")
+        target = os.path.join(self.output_path, rel_path)
+        digest = hash_bytes(data)
+        current = self._current_digest(rel_path, target)
+
+        if current is None:
+            status = "added"
+        elif current != digest:
+            status = "changed"
+        else:
+            status = "unchanged"
+
+        if status != "unchanged":
+            atomic_write(target, data)
+
+        self.files[rel_path] = {
+            "sha256": digest,
+            "size": len(data),
+            "mtime_ns": os.stat(target).st_mtime_ns,
+            "status": status,
+        }
+        return status != "unchanged"
+
+    def write_text(self, rel_path, text, encoding="utf-8") -> bool:
+        return self.write_bytes(rel_path, text.encode(encoding))
+
+    def write_json(self, rel_path, data, indent=2) -> bool:
+        return self.write_bytes(rel_path, dump_json(data, indent))
+
+    def copy_file(self, src_path, rel_path) -> bool:
+        with open(src_path, "rb") as f:
+            return self.write_bytes(rel_path, f.read())
+
+    def copy_tree(self, src_dir, rel_dir):
+        """Copy every file under src_dir into output_path/rel_dir, writing only the ones that changed."""
+        for root, _, filenames in os.walk(src_dir):
+            for filename in sorted(filenames):
+                src_path = os.path.join(root, filename)
+                rel_path = os.path.join(rel_dir, os.path.relpath(src_path, src_dir))
+                self.copy_file(src_path, rel_path)
+
+    def keep(self, rel_path) -> bool:
+        """
+        Carry a file of the previous run over as unchanged without reading it (for outputs derived
+        from content that is known not to have changed). Returns False if there is nothing to keep.
+        """
+        rel_path = rel_path.replace(os.sep, "/")
+        previous = self.previous.get(rel_path)
+        if previous is None or not os.path.exists(os.path.join(self.output_path, rel_path)):
+            return False
+        self.files[rel_path] = {**previous, "status": "unchanged"}
+        return True
+
+    def paths_with_status(self, *statuses):
+        return sorted(path for path, entry in self.files.items() if entry["status"] in statuses)
+
+    def finalize(self, prune=True):
+        """
+        Remove outputs left over from the previous run (unless prune is False) and write
+        the manifest. Returns the manifest as a dictionary.
+        """
+        leftover = sorted(path for path in self.previous if path not in self.files)
+        removed = []
+        for rel_path in leftover:
+            target = os.path.join(self.output_path, rel_path)
+            if not os.path.exists(target):
+                removed.append(rel_path)
+            elif prune:
+                os.remove(target)
+                removed.append(rel_path)
+            else:
+                # Keep tracking files that stay published
+                self.files[rel_path] = {**self.previous[rel_path], "status": "retained"}
+
+        manifest = {
+            "files": self.files,
+            "added": self.paths_with_status("added"),
+            "changed": self.paths_with_status("changed"),
+            "removed": removed,
+            "unchanged": len(self.paths_with_status("unchanged")),
+        }
+        write_if_changed(self.manifest_path, dump_json(manifest))
+        logger.info("Outputs in %s: %d added, %d changed, %d removed, %d unchanged.", self.output_path,
+                    len(manifest["added"]), len(manifest["changed"]), len(removed), manifest["unchanged"])
+        return manifest
@@ -0,0 +1,541 @@
+import json
+import os
+import re
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+import docx_converter as dc
+import html_converter as hc
+from conversion_logging import get_logger
+from docx_package import DocxPackage
+from figure_registry import FigureRegistry
+from bootstrap import bootstrap_document, render_bootstrap_index
+from asset_bundle import ASSET_BUNDLE_FOLDER, BUNDLE_MANIFEST_FILE, build_asset_bundle, render_index_html
+from output_writer import OutputWriter, dump_json, write_if_changed
+from precompress import precompress_outputs
+from profiling import StageProfiler, file_size, text_size
+from revision_cache import RevisionCache, first_difference, full_conversion
+from split_convert import split_convert
+from style_cache import StyleCache
+from style_sheet import STYLESHEET_FILE, StyleSheet, class_tables
+from table_renderer import TABLES_HTML_FILE, render_table_fragments, render_tables_html
+from table_shards import TABLE_INDEX_FILE, TABLES_FOLDER, write_table_shards
+
+logger = get_logger("pipeline")
+
+# Front-end files copied next to every converted document
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts")
+LUA_SCRIPT = os.path.join(SCRIPTS_DIR, "pandoc", "pandoc_docx_cleanup.lua")
+
+## Text and table styles of the report template, used when no style cache is given (see style_cache.StyleCache)
+DEFAULT_STYLES = {
+  "headings": {
+    "h1": {
+      "fontFamily": "Chillax Semibold",
+      "fontSize": "1.67rem",
+      "color": "#1D426F"
+    },
+    "h2": {
+      "fontFamily": "Chillax Semibold",
+      "fontSize": "1.17rem",
+      "color": "#1D426F"
+    },
+    "h3": {
+      "fontFamily": "Chillax Medium",
+      "fontSize": "1.00rem",
+      "color": "#1D426F"
+    }
+  },
+  "body": {
+    "p": {
+      "fontSize": "0.92rem"
+    }
+  },
+  "lists": {},
+  "captions": {
+    "caption": {
+      "fontSize": "0.83rem",
+      "fontStyle": "italic"
+    }
+  },
+  "table": {
+    "border": "1px solid black",
+    "borderCollapse": "collapse",
+    "marginBottom": "12px"
+  },
+  "th": {
+    "fontSize": "0.92rem",
+    "textAlign": "left",
+    "padding": "5px",
+    "verticalAlign": "middle"
+  },
+  "td1": {
+    "fontSize": "0.92rem",
+    "textAlign": "left",
+    "padding": "5px",
+    "verticalAlign": "middle"
+  },
+  "td": {
+    "fontSize": "0.92rem",
+    "textAlign": "left",
+    "padding": "5px",
+    "verticalAlign": "middle"
+  }
+}
+
+
+# "copy": every document folder gets its own js/, css/ and index.html (self-contained, the original behaviour)
+# "bundle": documents share one fingerprinted bundle in app/_assets and only hold content and data
+ASSET_MODES = ("copy", "bundle")
+
+
+# "classes": table cells and text parts refer to short classes of a generated content/document.css
+# "inline": every cell of tables.json carries its own style properties (the original behaviour)
+STYLE_MODES = ("classes", "inline")
+
+
+# "build": content.html is written with its H1 sections wrapped and paragraph spacing applied
+# "runtime": auto-wrap-sections.js and insertBr.js do it in the browser (the original behaviour)
+LAYOUT_MODES = ("build", "runtime")
+
+
+# Image manifest keyed by the data-src of each div.image placeholder (loaded by mediaLoader.js)
+MEDIA_MANIFEST_FILE = "media.json"
+
+# One HTML fragment per H1 section (content/sections/) and the manifest the viewer loads them from
+SECTIONS_FOLDER = "sections"
+SECTIONS_MANIFEST_FILE = "sections.json"
+
+# Heading tree of the document, loaded by navigation.js
+NAVIGATION_FILE = "navigation.json"
+
+
+def asset_bundle_path(output_path, bundle_path=None):
+    """Folder of the shared front-end bundle ("bundle" mode): bundle_path, or _assets next to the document folder."""
+    return bundle_path or os.path.join(os.path.dirname(output_path), ASSET_BUNDLE_FOLDER)
+
+
+def front_end_index_html(output_path, asset_mode="copy", bundle_path=None):
+    """The index.html of one document folder: the template, pointed at the shared bundle in "bundle" mode."""
+    index_html = Path(f"{SCRIPTS_DIR}/index.html").read_text(encoding="utf-8")
+    if asset_mode == "bundle":
+        with open(os.path.join(asset_bundle_path(output_path, bundle_path), BUNDLE_MANIFEST_FILE), encoding="utf-8") as f:
+            index_html = render_index_html(index_html, json.load(f))
+    return index_html
+
+
+def bootstrap_index_html(output_path, asset_mode="copy", bundle_path=None):
+    """
+    front_end_index_html() with the first section, the styles and the navigation inlined (see
+    bootstrap.render_bootstrap_index). Built from the outputs already written to output_path.
+    """
+    def read_text(rel_path):
+        return Path(output_path, rel_path).read_text(encoding="utf-8")
+
+    def read_json(rel_path, default=None):
+        path = Path(output_path, rel_path)
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+
+    data_folder = dc.FOLDERS['data']
+    styles = read_json(f"{data_folder}/styles.json")
+    content_html, data = bootstrap_document(
+        read_json(f"{data_folder}/{SECTIONS_MANIFEST_FILE}"),
+        read_text,
+        styles,
+        read_json(f"{data_folder}/tables.json", {}),
+        read_json(f"{data_folder}/{NAVIGATION_FILE}", []),
+        read_json(f"{data_folder}/{MEDIA_MANIFEST_FILE}", {}),
+    )
+    stylesheet = (styles["stylesheet"], read_text(styles["stylesheet"])) if styles.get("stylesheet") else None
+    return render_bootstrap_index(front_end_index_html(output_path, asset_mode, bundle_path), content_html, data, stylesheet)
+
+
+def publish_front_end(writer, output_path, asset_mode="copy", publish_index=True, bundle_path=None, build_bundle=True):
+    """
+    Publish index.html (unless publish_index is False) and the front-end scripts for one document folder.
+    With build_bundle False, the shared bundle of "bundle" mode is left as it is (built by the caller).
+    """
+    if asset_mode == "copy":
+        writer.copy_tree(f"{SCRIPTS_DIR}/js", dc.FOLDERS['js'])
+        writer.copy_tree(f"{SCRIPTS_DIR}/css", dc.FOLDERS['css'])
+    elif asset_mode == "bundle":
+        if build_bundle:
+            publish_asset_bundle(asset_bundle_path(output_path, bundle_path))
+    else:
+        raise ValueError(f"Unknown asset mode: {asset_mode}. Expected one of {ASSET_MODES}")
+    if publish_index:
+        writer.write_text("index.html", front_end_index_html(output_path, asset_mode, bundle_path))
+
+
+def publish_asset_bundle(bundle_path):
+    """Build the shared bundle of the front-end scripts (see asset_bundle.build_asset_bundle)."""
+    return build_asset_bundle(bundle_path, SCRIPTS_DIR, asset_folders=(dc.FOLDERS['js'], dc.FOLDERS['css']))
+
+
+# Regular expression to match tables
+TABLE_PATTERN = re.compile(r'<table.*?</table>', re.DOTALL)
+
+
+def replace_tables(html_content):
+    """Replace every <table> with a div placeholder (table_0, table_1, ...) holding its caption."""
+    # Fresh counters for every document
+    counter = [0]
+    table_caption_counter = [0]
+    return TABLE_PATTERN.sub(lambda match: dc.table_replacer(match, counter, table_caption_counter), html_content)
+
+
+def publish_tables(writer, tables, template_styles, style_sheet=None):
+    """Write data/tables.json (and, in "classes" style mode, the generated stylesheet). Returns (tables, tables_json)."""
+    if style_sheet:
+        tables = class_tables(tables, template_styles, style_sheet)
+        writer.write_text(f"{dc.FOLDERS['content']}/{STYLESHEET_FILE}", style_sheet.render_css())
+    tables_json = dump_json(tables)
+    writer.write_bytes(f"{dc.FOLDERS['data']}/tables.json", tables_json)
+    return tables, tables_json
+
+
+def build_media_manifest(figures, media_info):
+    """
+    Key the media.json entries by the exact data-src of each div.image placeholder, so the viewer
+    finds an image with one lookup and can reserve its width and height before it loads.
+    """
+    manifest = {}
+    for image_meta in figures.kept():
+        if image_meta["image_type"] != "image":
+            continue
+        path = f"{dc.FOLDERS['media']}/{os.path.basename(image_meta.get('image_file', ''))}"
+        info = media_info.get(path)
+        if info is None:
+            logger.warning("No extracted image for %s (%s)", dc.image_data_src(image_meta), path)
+            continue
+        manifest[dc.image_data_src(image_meta)] = {"path": path, **info, "alt_text": image_meta.get("alt_text_new") or info["alt_text"]}
+    return manifest
+
+
+def write_sections(writer, html_content, nav_data=None):
+    """
+    Write every H1 section of content.html to content/sections/<id>.html and return the section
+    manifest: the generate_navigation_data() entries of the H1s plus the file and size of each.
+    """
+    nav_data = {entry["id"]: entry for entry in (nav_data or dc.generate_navigation_data(html_content))}
+    preamble, sections = dc.split_h1_sections(html_content)
+
+    manifest = {"preamble": None, "sections": []}
+    if preamble:
+        manifest["preamble"] = f"{dc.FOLDERS['content']}/{SECTIONS_FOLDER}/_preamble.html"
+        writer.write_text(manifest["preamble"], preamble)
+
+    used_names = set()
+    for index, (section_id, section_html) in enumerate(sections):
+        name = re.sub(r'[^\w.-]', '_', section_id)
+        if name in used_names:
+            name = f"{name}-{index}"
+        used_names.add(name)
+
+        file = f"{dc.FOLDERS['content']}/{SECTIONS_FOLDER}/{name}.html"
+        writer.write_text(file, section_html)
+        entry = nav_data.get(section_id, {"id": section_id, "text": "", "h2": []})
+        manifest["sections"].append({**entry, "file": file, "size": text_size(section_html)})
+    return manifest
+
+
+def parse_docx_to_html(docx_path, lua_script, output_path, asset_mode="copy", profiler=None, prerender_tables=True,
+                       style_mode="classes", layout_mode="build", split_sections=True, writer=None, publish_index=True,
+                       bootstrap=False, style_cache=None, table_shards=True, split_workers=None, revision_cache=None,
+                       verify_revisions=False, bundle_path=None, build_bundle=True):
+    """
+    Convert a DOCX file to HTML and output tables and images for use in a web application.
+    Files are published through an OutputWriter, so only outputs whose content changed are
+    rewritten. Returns the output manifest.
+
+    writer is an optional OutputWriter shared with the caller, who then finalizes it (and gets
+    None back). publish_index=False leaves index.html to the caller as well.
+
+    asset_mode selects how the front-end is published (see ASSET_MODES). In "bundle" mode the shared
+    bundle is bundle_path (default: _assets next to output_path), built unless build_bundle is False.
+    profiler is an optional StageProfiler that records each stage.
+    prerender_tables writes the final table markup to content/tables.html at build time, so the
+    browser only attaches it instead of running generateTable() for every table on page load.
+    style_mode selects how table and text styles are delivered (see STYLE_MODES).
+    layout_mode selects where sections are wrapped and paragraphs spaced (see LAYOUT_MODES).
+    split_sections also writes each H1 section to content/sections/ with a data/sections.json
+    manifest, so the viewer only downloads the section being read (needs layout_mode="build").
+    bootstrap inlines the first section, the styles and the navigation into index.html, so the
+    first section renders without any further request (needs split_sections).
+    style_cache is a folder of styles computed once per Word template (see style_cache.StyleCache);
+    without it the hand-tuned DEFAULT_STYLES are used.
+    table_shards also writes every table to its own data/tables/<table_id>.json (and .html when
+    pre-rendered) with a data/tables/index.json, so the viewer fetches each table when it scrolls
+    into view instead of loading tables.json or tables.html whole.
+    split_workers converts the H1 sections of the document in that many processes and stitches
+    them back (see split_convert.py); the outputs are the same as without it.
+    revision_cache is a folder keeping the output of every H1 section, so the next conversion of
+    the document only converts the sections whose content changed (see revision_cache.py).
+    verify_revisions also converts the whole document and raises ValueError if the section-wise
+    outputs (split_workers or revision_cache) differ from it.
+    """
+    if style_mode not in STYLE_MODES:
+        raise ValueError(f"Unknown style mode: {style_mode}. Expected one of {STYLE_MODES}")
+    if layout_mode not in LAYOUT_MODES:
+        raise ValueError(f"Unknown layout mode: {layout_mode}. Expected one of {LAYOUT_MODES}")
+    if bootstrap and not (layout_mode == "build" and split_sections):
+        raise ValueError('bootstrap needs the section fragments: layout_mode="build" and split_sections=True')
+    if verify_revisions and not (split_workers or revision_cache):
+        raise ValueError("verify_revisions checks section-wise conversions: it needs split_workers or revision_cache")
+    profiler = profiler or StageProfiler(enabled=False)
+    compatible_docx_path = os.path.join(os.path.dirname(output_path), f"{os.path.splitext(os.path.basename(docx_path))[0]}.docx")
+
+    os.makedirs(output_path, exist_ok=True)
+    allowed_alt_texts = ["timeline"]
+
+    os.makedirs(f"{output_path}/{dc.FOLDERS['media']}", exist_ok=True)
+    os.makedirs(f"{output_path}/{dc.FOLDERS['data']}", exist_ok=True)
+    os.makedirs(f"{output_path}/{dc.FOLDERS['content']}", exist_ok=True)
+
+    own_writer = writer is None
+    writer = writer or OutputWriter(output_path)
+
+    with profiler.stage("compatibility", input_size=file_size(docx_path)) as record:
+        # The original DOCX when it needs no fix (nothing is written then)
+        compatible_docx_path = dc.check_compatibility(docx_path, compatible_docx_path)
+        record["output_size"] = file_size(compatible_docx_path)
+
+    # Mapped once for the stages reading the DOCX (styles, tables, media, figure registry): each
+    # part is inflated once and python-docx parses the package once for both styles and tables.
+    # Closed (also when a stage fails) before pandoc, which reads the DOCX itself
+    with DocxPackage(compatible_docx_path) as package:
+
+        ## index.html and the front-end scripts
+        with profiler.stage("front_end"):
+            # With bootstrap, index.html is written once the sections it inlines exist
+            publish_front_end(writer, output_path, asset_mode, publish_index and not bootstrap, bundle_path, build_bundle)
+
+        ## Styles
+
+        style_sheet = StyleSheet() if style_mode == "classes" else None
+        with profiler.stage("styles") as record:
+            template_styles = DEFAULT_STYLES
+            if style_cache:
+                template_styles = StyleCache(style_cache).styles_for(
+                    compatible_docx_path, lambda _: dc.extract_template_styles(package), fingerprint_path=docx_path)
+            styles = template_styles
+            if style_sheet:
+                # applyStyles() links the generated stylesheet instead of styling every element
+                style_sheet.add_tag_styles(template_styles)
+                styles = {**template_styles, "stylesheet": f"{dc.FOLDERS['content']}/{STYLESHEET_FILE}"}
+            styles_json = dump_json(styles)
+            writer.write_bytes(f"{dc.FOLDERS['data']}/styles.json", styles_json)
+            record["output_size"] = len(styles_json)
+
+        ## Extract table data and formating that differs from the default styles (per section when split)
+        section_wise = split_workers or revision_cache
+        if not section_wise:
+            with profiler.stage("tables", input_size=file_size(compatible_docx_path)) as record:
+                tables, tables_json = publish_tables(writer, dc.extract_table_format(package, template_styles), template_styles, style_sheet)
+                record["output_size"] = len(tables_json)
+
+        ## End Styles ##
+        ## Images ##
+
+        with profiler.stage("media", input_size=file_size(compatible_docx_path)) as record:
+            media_info = {}
+            alt_text_map = dc.extract_docx_media(package, output_path, dc.FOLDERS['media'], allowed_alt_texts, writer, media_info)
+            logger.debug("Alt text to image mapping: %s", alt_text_map)
+            record["output_size"] = sum(file_size(os.path.join(output_path, path)) or 0 for path in alt_text_map.values())
+
+        keep_images = [value.replace("assets", "media") for _, value in alt_text_map.items()]
+        logger.debug("keep_images: %s", keep_images)
+
+        ## One pass over the DOCX for every drawing: image type, link, caption and original/new figure number
+        with profiler.stage("figure_registry", input_size=file_size(compatible_docx_path)):
+            figures = FigureRegistry.from_docx(package)
+
+    with profiler.stage("media_manifest") as record:
+        media_json = dump_json(build_media_manifest(figures, media_info))
+        writer.write_bytes(f"{dc.FOLDERS['data']}/{MEDIA_MANIFEST_FILE}", media_json)
+        record["output_size"] = len(media_json)
+
+    if section_wise:
+        ## Pandoc, the tables and the HTML passes section by section in parallel, stitched in order
+        ## (only for the sections that changed since the previous run with a revision cache)
+        revisions = RevisionCache(revision_cache, docx_path) if revision_cache else None
+        with profiler.stage("split_convert", input_size=file_size(compatible_docx_path)) as record:
+            tables, html_figure_references_updated = split_convert(
+                compatible_docx_path, lua_script, keep_images, figures, template_styles, split_workers or 1, revisions)
+            record["output_size"] = text_size(html_figure_references_updated)
+        if verify_revisions:
+            with profiler.stage("verify_revisions", input_size=file_size(compatible_docx_path)):
+                difference = first_difference(full_conversion(compatible_docx_path, lua_script, keep_images, figures, template_styles),
+                                              (tables, html_figure_references_updated))
+            if difference:
+                if revisions:
+                    revisions.discard()
+                raise ValueError(f"Section-wise conversion of {docx_path} differs from the whole-document one: {difference}")
+        if revisions:
+            revisions.save()
+        with profiler.stage("tables") as record:
+            tables, tables_json = publish_tables(writer, tables, template_styles, style_sheet)
+            record["output_size"] = len(tables_json)
+    else:
+        with profiler.stage("pandoc", input_size=file_size(compatible_docx_path)) as record:
+            initial_html = dc.convert_docx_to_html(compatible_docx_path, lua_script, keep_images)
+            record["output_size"] = text_size(initial_html)
+        logger.info("HTML with unwanted images removed has been generated.")
+
+        with profiler.stage("remove_empty_paragraphs", input_size=text_size(initial_html)) as record:
+            initial_html_clean = dc.remove_empty_paragraphs(initial_html)
+            record["output_size"] = text_size(initial_html_clean)
+
+        # Remove empty <figure> tags
+        with profiler.stage("remove_empty_figures", input_size=text_size(initial_html_clean)) as record:
+            html_captions_removed = dc.remove_empty_figures(initial_html_clean)
+            record["output_size"] = text_size(html_captions_removed)
+
+        ## Replace img tags with div placeholders
+        with profiler.stage("replace_images_with_divs", input_size=text_size(html_captions_removed)) as record:
+            html_images_replaced = dc.replace_images_with_divs(html_captions_removed, figures)
+            record["output_size"] = text_size(html_images_replaced)
+
+        ## Remove captions from unwanted figures that weren't apart for a <figure> tag
+        with profiler.stage("remove_captions_from_unwanted_figures", input_size=text_size(html_images_replaced)) as record:
+            html_more_captions_removed = dc.remove_captions_from_unwanted_figures(html_images_replaced)
+            record["output_size"] = text_size(html_more_captions_removed)
+
+        ## Update in-text figure references
+        with profiler.stage("update_in_text_figure_references", input_size=text_size(html_more_captions_removed)) as record:
+            html_figure_references_updated = dc.update_in_text_figure_references(html_more_captions_removed, figures.number_map())
+            record["output_size"] = text_size(html_figure_references_updated)
+
+    ## End Images ##
+    ## Tables ##
+
+    with profiler.stage("table_replacer", input_size=text_size(html_figure_references_updated)) as record:
+        html_tables_id = replace_tables(html_figure_references_updated)
+        record["output_size"] = text_size(html_tables_id)
+
+    table_fragments = None
+    if prerender_tables:
+        with profiler.stage("render_tables", input_size=len(tables_json)) as record:
+            table_fragments = render_table_fragments(tables, template_styles, html_tables_id)
+            tables_html = render_tables_html(tables, template_styles, html_tables_id, table_fragments)
+            writer.write_text(f"{dc.FOLDERS['content']}/{TABLES_HTML_FILE}", tables_html)
+            record["output_size"] = text_size(tables_html)
+
+    if table_shards:
+        with profiler.stage("table_shards", input_size=len(tables_json)) as record:
+            table_index = write_table_shards(writer, tables, html_tables_id, dc.FOLDERS['data'], table_fragments)
+            table_index_json = dump_json(table_index)
+            writer.write_bytes(f"{dc.FOLDERS['data']}/{TABLES_FOLDER}/{TABLE_INDEX_FILE}", table_index_json)
+            record["output_size"] = len(table_index_json) + sum(entry["size"] + entry.get("htmlSize", 0) for entry in table_index["tables"])
+
+    ## End Tables ##
+
+    if layout_mode == "build":
+        with profiler.stage("section_layout", input_size=text_size(html_tables_id)) as record:
+            html_tables_id = dc.build_section_layout(html_tables_id)
+            record["output_size"] = text_size(html_tables_id)
+
+    with profiler.stage("navigation", input_size=text_size(html_tables_id)) as record:
+        nav_data = dc.generate_navigation_data(html_tables_id)
+        navigation_json = dump_json(nav_data)
+        writer.write_bytes(f"{dc.FOLDERS['data']}/{NAVIGATION_FILE}", navigation_json)
+        record["output_size"] = len(navigation_json)
+
+    if layout_mode == "build" and split_sections:
+        with profiler.stage("split_sections", input_size=text_size(html_tables_id)) as record:
+            sections_json = dump_json(write_sections(writer, html_tables_id, nav_data))
+            writer.write_bytes(f"{dc.FOLDERS['data']}/{SECTIONS_MANIFEST_FILE}", sections_json)
+            record["output_size"] = len(sections_json)
+
+    if bootstrap and publish_index:
+        with profiler.stage("bootstrap") as record:
+            index_html = bootstrap_index_html(output_path, asset_mode, bundle_path)
+            writer.write_text("index.html", index_html)
+            record["output_size"] = text_size(index_html)
+
+    # Save the modified content.html
+    with profiler.stage("write_outputs"):
+        writer.write_text(f"{dc.FOLDERS['content']}/content.html", html_tables_id)
+        manifest = writer.finalize() if own_writer else None
+    logger.info("Conversion complete! HTML file saved as %s.", output_path)
+
+    return manifest
+
+
+def parse_html_to_json(html_path: str, json_path: str, profiler=None, writer=None) -> bool:
+    """
+    Convert the generated content.html into the platform JSON.
+    The file is only rewritten (atomically) when its content changed. Returns True if it was written.
+    When json_path is inside the writer's output folder it is written through the writer (and
+    listed in its manifest); a platform JSON written elsewhere is not in the manifest.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+
+    # Load the HTML content
+    html_content = Path(html_path).read_text(encoding="utf-8")
+
+    with profiler.stage("html_convert", input_size=text_size(html_content)) as record:
+        soup = BeautifulSoup(html_content, "html.parser")
+        json_data = hc.html_convert(soup)
+
+        # Clean the JSON fields
+        cleaned_json_data = hc.clean_nested_json(json_data)
+        platform_json = dump_json(cleaned_json_data)
+        record["output_size"] = len(platform_json)
+
+    # Save the updated structure
+    if writer is not None:
+        rel_json_path = os.path.relpath(json_path, writer.output_path)
+        if not rel_json_path.startswith(".."):
+            return writer.write_bytes(rel_json_path, platform_json)
+    return write_if_changed(json_path, platform_json)
+
+
+def convert_docx(docx_path, lua_script, output_path, json_path=None, asset_mode="copy", profile=False, cprofile=False,
+                 prerender_tables=True, style_mode="classes", layout_mode="build", split_sections=True, precompress=False,
+                 bootstrap=False, style_cache=None, table_shards=True, split_workers=None, revision_cache=None,
+                 verify_revisions=False, bundle_path=None, build_bundle=True):
+    """
+    Run the full 06 pipeline: DOCX -> app/<doc>/ outputs -> platform JSON.
+
+    :param json_path: Where to write the platform JSON (default: <output_path>/data/platform.json).
+    :param profile: Record per-stage wall/CPU time, peak memory and sizes into <output_path>/profile.json.
+    :param cprofile: Also dump a cProfile file per stage into <output_path>/profile/.
+    :param prerender_tables: Write the rendered tables to <output_path>/content/tables.html.
+    :param style_mode: "classes" (generated content/document.css) or "inline" styles, see STYLE_MODES.
+    :param layout_mode: "build" (sections wrapped in content.html) or "runtime", see LAYOUT_MODES.
+    :param split_sections: Also write one fragment per H1 section and data/sections.json.
+    :param precompress: Publish fingerprinted copies of the text outputs with .gz/.br siblings and an
+                        index.html that links them (see precompress.precompress_outputs).
+    :param bootstrap: Inline the first section, the styles and the navigation into index.html.
+    :param style_cache: Folder of per-template styles (see style_cache.StyleCache), instead of DEFAULT_STYLES.
+    :param table_shards: Also write one file per table and data/tables/index.json, loaded table by table by the viewer.
+    :param split_workers: Convert the H1 sections in this many parallel processes (see split_convert.py).
+    :param revision_cache: Folder of per-section outputs, so only the sections edited since the last run are converted (see revision_cache.py).
+    :param verify_revisions: Also convert the whole document and fail if the section-wise outputs differ.
+    :param bundle_path: Shared bundle folder of asset_mode="bundle" (default: _assets next to output_path).
+    :param build_bundle: Build the bundle; False when the caller already did (see work_queue.py).
+    :return: The output manifest.
+    """
+    profiler = StageProfiler(enabled=profile or cprofile, cprofile=cprofile)
+    json_path = json_path or os.path.join(output_path, dc.FOLDERS['data'], "platform.json")
+    writer = OutputWriter(output_path)
+
+    parse_docx_to_html(docx_path, lua_script, output_path, asset_mode, profiler, prerender_tables, style_mode,
+                       layout_mode, split_sections, writer=writer, publish_index=not precompress, bootstrap=bootstrap,
+                       style_cache=style_cache, table_shards=table_shards, split_workers=split_workers,
+                       revision_cache=revision_cache, verify_revisions=verify_revisions, bundle_path=bundle_path,
+                       build_bundle=build_bundle)
+    parse_html_to_json(os.path.join(output_path, dc.FOLDERS['content'], "content.html"), json_path, profiler, writer)
+
+    if precompress:
+        with profiler.stage("precompress"):
+            rel_paths = list(writer.files)
+            index_html = (bootstrap_index_html(output_path, asset_mode, bundle_path) if bootstrap
+                          else front_end_index_html(output_path, asset_mode, bundle_path))
+            precompress_outputs(writer, rel_paths, index_html)
+    manifest = writer.finalize()
+
+    profiler.save(output_path, docx_path=docx_path, docx_size=file_size(docx_path))
+    return manifest
@@ -0,0 +1,124 @@
+import gzip
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from asset_bundle import fingerprint_name
+from conversion_logging import get_logger
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .gz siblings are written
+    brotli = None
+
+logger = get_logger("output")
+
+# Text artifacts that get fingerprinted copies and precompressed siblings
+COMPRESSIBLE_EXTENSIONS = (".html", ".json", ".css", ".js", ".svg", ".txt")
+
+# Written by the converter for tooling, not served to the viewer
+UNSERVED_FILES = ("manifest.json", "profile.json")
+
+# <script type="application/json" id="asset-map"> in index.html, read by assetUrl() in contentLoader.js
+ASSET_MAP_ID = "asset-map"
+ASSET_MAP_PATTERN = re.compile(rf'\s*<script type="application/json" id="{ASSET_MAP_ID}">.*?</script>', re.DOTALL)
+
+# Fingerprinted outputs: name.<10 hex digits>.ext
+FINGERPRINT_PATTERN = re.compile(r'\.[0-9a-f]{10}\.[^./]+$')
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def compress_gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def encodings():
+    """{suffix: compress function} for the encodings available here."""
+    available = {".gz": compress_gzip}
+    if brotli is not None:
+        available[".br"] = compress_brotli
+    return available
+
+
+def is_served_text(rel_path):
+    return (
+        rel_path.endswith(COMPRESSIBLE_EXTENSIONS)
+        and os.path.basename(rel_path) not in UNSERVED_FILES
+        and not FINGERPRINT_PATTERN.search(rel_path)
+    )
+
+
+def rewrite_references(text, asset_map):
+    """Replace every quoted reference to an original path ("data/styles.json") with its fingerprinted name."""
+    for original, fingerprinted in asset_map.items():
+        text = text.replace(f'"{original}"', f'"{fingerprinted}"')
+    return text
+
+
+def render_index_with_asset_map(index_html, asset_map):
+    """Point index.html at the fingerprinted scripts/stylesheets and embed the asset map for the loaders."""
+    index_html = ASSET_MAP_PATTERN.sub("", index_html)
+    index_html = rewrite_references(index_html, asset_map)
+    asset_map_json = json.dumps(asset_map, sort_keys=True).replace("</", "<\\/")
+    script = f'    <script type="application/json" id="{ASSET_MAP_ID}">{asset_map_json}</script>\n'
+    return index_html.replace("</head>", f"{script}</head>", 1)
+
+
+def precompress_outputs(writer, rel_paths, index_html, workers=None):
+    """
+    Publish fingerprinted, precompressed copies of the text artifacts of one document folder.
+
+    Every served text file in rel_paths (content.html, tables.json, the section fragments, ...)
+    is copied to name.<hash>.ext, with references to other fingerprinted files rewritten, and
+    gets .gz (and, when the brotli package is installed, .br) siblings. index.html stays the
+    entry point: it gets the same siblings, links the fingerprinted files and embeds the
+    original -> fingerprinted map that the loader scripts resolve their fetches through.
+
+    Compression runs in a thread pool. A file whose content hash is unchanged keeps its
+    compressed siblings from the previous run instead of being compressed again.
+
+    :param writer: The OutputWriter of the document folder (finalize() prunes stale fingerprints).
+    :param rel_paths: Output files to consider, relative to the writer's output path.
+    :param index_html: The index.html to publish.
+    :return: The asset map {original path: fingerprinted path}.
+    """
+    sources = sorted(path for path in rel_paths if is_served_text(path) and path != "index.html")
+    # Fragments, stylesheets and scripts first, so the JSON files that list them can be rewritten
+    sources.sort(key=lambda path: path.endswith(".json"))
+
+    asset_map = {}
+    published = {}
+    for rel_path in sources:
+        with open(os.path.join(writer.output_path, rel_path), "rb") as f:
+            data = f.read()
+        if rel_path.endswith(".json"):
+            data = rewrite_references(data.decode("utf-8"), asset_map).encode("utf-8")
+        fingerprinted = fingerprint_name(rel_path, data)
+        asset_map[rel_path] = fingerprinted
+        published[fingerprinted] = data
+
+    published["index.html"] = render_index_with_asset_map(index_html, asset_map).encode("utf-8")
+
+    jobs = []
+    for rel_path, data in published.items():
+        changed = writer.write_bytes(rel_path, data)
+        for suffix, compress in encodings().items():
+            if changed or not writer.keep(rel_path + suffix):
+                jobs.append((rel_path + suffix, compress, data))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda job: (job[0], job[1](job[2])), jobs)
+        for rel_path, compressed in results:
+            writer.write_bytes(rel_path, compressed)
+
+    logger.info("Precompressed %d files (%d compressions, %d reused)%s.", len(published), len(jobs),
+                len(published) * len(encodings()) - len(jobs), "" if brotli else ", brotli not installed: no .br files")
+    return asset_map
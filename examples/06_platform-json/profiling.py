@@ -0,0 +1,117 @@
+import cProfile
+import gc
+import json
+import marshal
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from conversion_logging import get_logger
+from output_writer import atomic_output, atomic_write
+
+logger = get_logger("pipeline")
+
+PROFILE_FILE = "profile.json"
+CPROFILE_FOLDER = "profile"
+
+
+def text_size(text):
+    """Size in bytes of a string as it would be written to disk."""
+    return len(text.encode("utf-8")) if isinstance(text, str) else None
+
+
+def file_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else None
+
+
+def cpu_seconds():
+    """CPU time of this process plus finished child processes (pandoc runs as a subprocess)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, peak traced memory and input/output sizes for each
+    conversion stage.
+
+    Usage:
+        profiler = StageProfiler()
+        with profiler.stage("tables", input_size=file_size(docx_path)) as record:
+            tables = dc.extract_table_format(docx_path, styles)
+            record["output_size"] = ...
+
+    A disabled profiler (the default in the pipeline) only yields an empty record, so stages
+    can always be wrapped without paying for tracemalloc. With cprofile=True each stage is
+    also run under cProfile and dumped to <output_path>/profile/<stage>.prof by save().
+    """
+
+    def __init__(self, enabled=True, trace_memory=True, cprofile=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.cprofile = enabled and cprofile
+        self.stages = []
+        self.profiles = {}
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name, input_size=None):
+        record = {"stage": name, "input_size": input_size, "output_size": None}
+        if not self.enabled:
+            yield record
+            return
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.trace_memory:
+            # Collect garbage left by earlier stages so it can't be freed mid-stage and skew the peak
+            gc.collect()
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        profile = cProfile.Profile() if self.cprofile else None
+        wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+                self.profiles[name] = profile
+            record["wall_time"] = round(time.perf_counter() - wall_start, 6)
+            record["cpu_time"] = round(cpu_seconds() - cpu_start, 6)
+            if self.trace_memory:
+                # Peak allocated on top of what was already held when the stage started
+                record["peak_memory"] = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+            self.stages.append(record)
+            logger.debug("Stage %s: %.3fs wall, %.3fs cpu", name, record["wall_time"], record["cpu_time"])
+
+    def report(self, **metadata):
+        return {
+            **metadata,
+            "total_wall_time": round(sum(s["wall_time"] for s in self.stages), 6),
+            "total_cpu_time": round(sum(s["cpu_time"] for s in self.stages), 6),
+            "stages": self.stages,
+        }
+
+    def save(self, output_path, **metadata):
+        """Write profile.json (and the per-stage cProfile dumps) into output_path. Returns the report."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        report = self.report(**metadata)
+        if not self.enabled:
+            return report
+
+        atomic_write(os.path.join(output_path, PROFILE_FILE), json.dumps(report, indent=2).encode("utf-8"))
+        if self.profiles:
+            os.makedirs(os.path.join(output_path, CPROFILE_FOLDER), exist_ok=True)
+            for name, profile in self.profiles.items():
+                # As Profile.dump_stats, but replacing the file (it may be a hard link to a published copy)
+                profile.create_stats()
+                with atomic_output(os.path.join(output_path, CPROFILE_FOLDER, f"{name}.prof")) as f:
+                    marshal.dump(profile.stats, f)
+        return report
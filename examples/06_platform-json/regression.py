@@ -0,0 +1,308 @@
+"""
+Regression gate for the 06 pipeline: output goldens plus per-stage time and memory budgets.
+
+    python regression.py --update          # record goldens and baselines on the reference machine
+    python regression.py                   # check; exits with status 1 on any regression
+    python regression.py --corpus data/    # also run every DOCX in data/
+    python regression.py --split-workers 4 # same goldens, converted section by section in parallel
+    python regression.py --revision-cache /tmp/revisions --verify-revisions   # same goldens, sections reused across runs
+
+A fixed synthetic corpus (REGRESSION_CORPUS) is always included, so the gate works without
+any client documents. For every document, content.html, tables.json, styles.json and the
+platform JSON must be byte-identical to the goldens, and every stage of profile.json must
+stay within the stored baseline times/memory plus a tolerance. When node is installed, the
+browser fallback generateTable() (scripts/js/tableGenerator.js) must also render every table,
+and a fixture covering the inline styles, exactly as table_renderer does.
+"""
+import argparse
+import difflib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pipeline
+from conversion_logging import configure_logging
+from synthetic_docx import generate_docx
+from table_renderer import render_table_html, table_captions
+
+REGRESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regression")
+GOLDENS_FOLDER = "goldens"
+BASELINE_FILE = "baseline.json"
+
+# Outputs that must not change (relative to app/<doc>/)
+GOLDEN_FILES = (
+    "content/content.html",
+    "data/tables.json",
+    "data/styles.json",
+    "data/platform.json",
+)
+
+# Deterministic documents that exercise the different stages
+REGRESSION_CORPUS = {
+    "synthetic_small": {"headings": 6, "paragraphs": 30, "tables": 3, "kept_images": 2, "dropped_images": 2, "footnotes": 4},
+    "synthetic_tables": {"headings": 9, "paragraphs": 40, "tables": 25, "table_rows": 30, "table_cols": 6, "kept_images": 1, "dropped_images": 1},
+    "synthetic_figures": {"headings": 12, "paragraphs": 120, "tables": 2, "kept_images": 20, "dropped_images": 20, "footnotes": 30},
+}
+
+DEFAULT_TIME_TOLERANCE = 0.5      # Fail when a stage is more than 50% slower than its baseline...
+DEFAULT_MIN_TIME_DELTA = 0.05     # ...and at least 50ms slower (ignores noise on tiny stages)
+DEFAULT_MEMORY_TOLERANCE = 0.5    # Same for peak traced memory
+DEFAULT_MIN_MEMORY_DELTA = 1024 * 1024
+
+# pipeline.convert_docx options naming folders (made absolute: the documents are converted from a temporary directory)
+PATH_OPTIONS = ("revision_cache", "style_cache", "bundle_path")
+
+TABLE_GENERATOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "js", "tableGenerator.js")
+
+# Renders {"tables", "styles", "captions"} (stdin) with generateTable() into {table_id: html} (stdout)
+NODE_RENDER_TABLES = """
+const { generateTable } = require(process.argv[1]);
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const output = {};
+for (const [tableId, caption] of Object.entries(input.captions)) {
+    output[tableId] = generateTable(input.tables[tableId], input.styles, caption);
+}
+process.stdout.write(JSON.stringify(output));
+"""
+
+# Inline-styled table data (style_mode="inline") with every cell feature both renderers handle
+TABLE_GENERATOR_FIXTURE = {
+    "styles": {"table": {"width": "100%"}, "th": {"backgroundColor": "#003366", "color": "#fff"}, "td": {"padding": "4px"}},
+    "captions": {"table_1": "Table 1: Costs &amp; <i>risks</i>", "table_2": ""},
+    "tables": {
+        "table_1": {
+            "styles": {"border": "2px solid #ccc"},
+            "td1": {"fontWeight": "bold"},
+            "headers": [
+                {"text": "Item", "textAlign": "center"},
+                {"colSpan": 2, "textParts": [{"text": "Cost", "bold": True}, {"newline": True}, {"text": "(<EUR> & VAT)", "italic": True}]},
+            ],
+            "rows": [
+                [{"text": "Line 1\nLine 2<br>Line 3", "bold": True, "underline": True}, {"text": "10", "verticalAlign": "top"},
+                 {"text": "", "iconHtml": '<span class="material-symbols-outlined">check</span>'}],
+                [{"rowSpan": "2", "textParts": [{"text": "H", "color": "#f00"}, {"text": "2", "subscript": True, "fontSize": "8pt"},
+                                                {"text": "O", "strikethrough": True, "superscript": True}]},
+                 {"text": "x", "backgroundColor": "#eee", "color": "#111", "fontSize": "9pt", "iconHtml": "<b>!</b>", "iconPosition": "end"},
+                 {"textParts": []}],
+            ],
+        },
+        "table_2": {"rows": [[{"text": "only & cell"}]]},
+    },
+}
+
+
+def build_corpus(folder, extra_docx_folder=None):
+    """Return {name: docx_path} for the synthetic corpus plus any DOCX files in extra_docx_folder."""
+    os.makedirs(folder, exist_ok=True)
+    corpus = {}
+    for name, spec in REGRESSION_CORPUS.items():
+        corpus[name] = generate_docx(os.path.join(folder, f"{name}.docx"), **spec)
+    if extra_docx_folder:
+        for filename in sorted(os.listdir(extra_docx_folder)):
+            if filename.endswith(".docx") and not filename.startswith("~$"):
+                corpus[os.path.splitext(filename)[0]] = os.path.join(extra_docx_folder, filename)
+    return corpus
+
+
+def run_document(docx_path, app_dir, name, repeat=1, options=None):
+    """
+    Convert one document (repeat times) and return its output folder and per-stage profile.
+    Times are the best of the runs, memory the lowest peak, to keep noise out of the gate.
+
+    :param options: Extra pipeline.convert_docx arguments, e.g. {"split_workers": 4}.
+    """
+    output_path = os.path.join(app_dir, name)
+    stages = {}
+    for _ in range(repeat):
+        pipeline.convert_docx(docx_path, pipeline.LUA_SCRIPT, output_path, profile=True, **(options or {}))
+        with open(os.path.join(output_path, "profile.json")) as f:
+            profile = json.load(f)
+        for record in profile["stages"]:
+            best = stages.setdefault(record["stage"], {"wall_time": record["wall_time"], "peak_memory": record.get("peak_memory", 0)})
+            best["wall_time"] = min(best["wall_time"], record["wall_time"])
+            best["peak_memory"] = min(best["peak_memory"], record.get("peak_memory", 0))
+    return output_path, stages
+
+
+def diff_outputs(name, output_path, golden_path):
+    """Compare the golden files of one document. Returns a list of failure messages."""
+    failures = []
+    for rel_path in GOLDEN_FILES:
+        golden_file = os.path.join(golden_path, rel_path)
+        output_file = os.path.join(output_path, rel_path)
+        if not os.path.exists(golden_file):
+            failures.append(f"{name}: no golden for {rel_path} (run with --update)")
+            continue
+        if not os.path.exists(output_file):
+            failures.append(f"{name}: {rel_path} was not produced")
+            continue
+        with open(golden_file, encoding="utf-8") as f:
+            expected = f.read()
+        with open(output_file, encoding="utf-8") as f:
+            actual = f.read()
+        if expected != actual:
+            diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(), f"golden/{rel_path}", f"output/{rel_path}", lineterm="", n=1)
+            snippet = "\n".join(list(diff)[:40])
+            failures.append(f"{name}: {rel_path} differs from golden\n{snippet}")
+    return failures
+
+
+def render_tables_in_node(tables, styles, captions):
+    """{table_id: html} of generateTable() for every captioned table, or None when node is not installed."""
+    node = shutil.which("node")
+    if node is None:
+        return None
+    result = subprocess.run([node, "-e", NODE_RENDER_TABLES, TABLE_GENERATOR_SCRIPT], check=True, capture_output=True,
+                            input=json.dumps({"tables": tables, "styles": styles, "captions": captions}).encode("utf-8"))
+    return json.loads(result.stdout)
+
+
+def check_table_generator(name, tables, styles, captions):
+    """Compare generateTable() with table_renderer for some tables. Returns a list of failure messages."""
+    captions = {table_id: caption for table_id, caption in captions.items() if table_id in tables}
+    actual = render_tables_in_node(tables, styles, captions)
+    if actual is None:
+        return []
+    for table_id, caption in captions.items():
+        expected = render_table_html(tables[table_id], styles, caption)
+        if actual.get(table_id) != expected:
+            return [f"{name}: generateTable() renders {table_id} differently from table_renderer\n"
+                    f"expected: {expected[:300]}\nactual:   {(actual.get(table_id) or '')[:300]}"]
+    return []
+
+
+def check_output_tables(name, output_path):
+    """Compare generateTable() with the pre-rendered tables of one document folder."""
+    def read(rel_path):
+        with open(os.path.join(output_path, rel_path), encoding="utf-8") as f:
+            return f.read()
+
+    tables = json.loads(read("data/tables.json"))
+    styles = json.loads(read("data/styles.json"))
+    return check_table_generator(name, tables, styles, table_captions(read("content/content.html")))
+
+
+def compare_budgets(name, stages, baseline, time_tolerance, min_time_delta, memory_tolerance, min_memory_delta):
+    """Compare per-stage timings/memory against the baseline. Returns a list of failure messages."""
+    failures = []
+    for stage, expected in baseline.items():
+        actual = stages.get(stage)
+        if actual is None:
+            continue  # Stage renamed or removed: outputs are still checked by the goldens
+
+        time_budget = expected["wall_time"] * (1 + time_tolerance)
+        if actual["wall_time"] > time_budget and actual["wall_time"] - expected["wall_time"] > min_time_delta:
+            failures.append(f"{name}: stage {stage} took {actual['wall_time']:.3f}s "
+                            f"(baseline {expected['wall_time']:.3f}s, budget {time_budget:.3f}s)")
+
+        memory_budget = expected["peak_memory"] * (1 + memory_tolerance)
+        if actual["peak_memory"] > memory_budget and actual["peak_memory"] - expected["peak_memory"] > min_memory_delta:
+            failures.append(f"{name}: stage {stage} peaked at {actual['peak_memory'] / 1e6:.1f}MB "
+                            f"(baseline {expected['peak_memory'] / 1e6:.1f}MB, budget {memory_budget / 1e6:.1f}MB)")
+    return failures
+
+
+def update_goldens(name, output_path, golden_path):
+    if os.path.exists(golden_path):
+        shutil.rmtree(golden_path)
+    for rel_path in GOLDEN_FILES:
+        source = os.path.join(output_path, rel_path)
+        if os.path.exists(source):
+            os.makedirs(os.path.dirname(os.path.join(golden_path, rel_path)), exist_ok=True)
+            shutil.copyfile(source, os.path.join(golden_path, rel_path))
+
+
+def run_regression(regression_dir=REGRESSION_DIR, extra_docx_folder=None, update=False, repeat=3,
+                   time_tolerance=DEFAULT_TIME_TOLERANCE, min_time_delta=DEFAULT_MIN_TIME_DELTA,
+                   memory_tolerance=DEFAULT_MEMORY_TOLERANCE, min_memory_delta=DEFAULT_MIN_MEMORY_DELTA, options=None):
+    """Run the corpus through the pipeline and check (or, with update=True, record) goldens and budgets. Returns the failures."""
+    regression_dir = os.path.abspath(regression_dir)
+    extra_docx_folder = extra_docx_folder and os.path.abspath(extra_docx_folder)
+    options = {key: os.path.abspath(value) if key in PATH_OPTIONS and value else value for key, value in (options or {}).items()}
+    baseline_path = os.path.join(regression_dir, BASELINE_FILE)
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix="docx_regression_")
+    cwd = os.getcwd()
+    failures = []
+    if not update:
+        if shutil.which("node") is None:
+            print("node not found: generateTable() is not checked")
+        failures += check_table_generator("fixture", **TABLE_GENERATOR_FIXTURE)
+    try:
+        # pandoc --extract-media=. writes into the working directory
+        os.chdir(work_dir)
+        corpus = build_corpus(os.path.join(work_dir, "corpus"), extra_docx_folder)
+        for name, docx_path in corpus.items():
+            output_path, stages = run_document(docx_path, os.path.join(work_dir, "app"), name, repeat, options)
+            golden_path = os.path.join(regression_dir, GOLDENS_FOLDER, name)
+            if update:
+                update_goldens(name, output_path, golden_path)
+                baseline[name] = stages
+                print(f"Recorded goldens and baseline for {name}")
+                continue
+
+            doc_failures = diff_outputs(name, output_path, golden_path)
+            if not doc_failures:
+                doc_failures += check_output_tables(name, output_path)
+            if name in baseline:
+                doc_failures += compare_budgets(name, stages, baseline[name], time_tolerance, min_time_delta,
+                                                memory_tolerance, min_memory_delta)
+            else:
+                doc_failures.append(f"{name}: no timing baseline (run with --update)")
+            print(f"{'FAIL' if doc_failures else 'ok  '} {name}")
+            failures += doc_failures
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if update:
+        os.makedirs(regression_dir, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(baseline, f, indent=2)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="Record new goldens and timing baselines")
+    parser.add_argument("--corpus", help="Folder of extra DOCX files to include")
+    parser.add_argument("--regression-dir", default=REGRESSION_DIR, help="Where goldens and baseline.json are stored")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per document (best time is compared)")
+    parser.add_argument("--time-tolerance", type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument("--min-time-delta", type=float, default=DEFAULT_MIN_TIME_DELTA)
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    parser.add_argument("--min-memory-delta", type=int, default=DEFAULT_MIN_MEMORY_DELTA,
+                        help="Bytes a stage's peak memory may grow whatever the tolerance")
+    parser.add_argument("--pandoc", help="Path to a local pandoc binary")
+    parser.add_argument("--split-workers", type=int, help="Convert every document section by section with this many processes")
+    parser.add_argument("--revision-cache", help="Revision cache folder: later runs of a document reuse its unchanged sections")
+    parser.add_argument("--verify-revisions", action="store_true", help="Also check section-wise outputs against a whole-document conversion")
+    args = parser.parse_args()
+
+    if args.pandoc:
+        os.environ["PYPANDOC_PANDOC"] = os.path.abspath(args.pandoc)
+    configure_logging("WARNING")
+
+    options = {key: value for key, value in (("split_workers", args.split_workers), ("revision_cache", args.revision_cache),
+                                             ("verify_revisions", args.verify_revisions)) if value}
+    failures = run_regression(args.regression_dir, args.corpus, args.update, args.repeat,
+                              args.time_tolerance, args.min_time_delta, args.memory_tolerance, args.min_memory_delta,
+                              options=options or None)
+    for failure in failures:
+        print(f"\n{failure}")
+    if failures:
+        print(f"\n{len(failures)} regression(s) found.")
+        sys.exit(1)
+    if not args.update:
+        print("\nAll outputs match their goldens and every stage is within budget.")
+
+
+if __name__ == "__main__":
+    main()
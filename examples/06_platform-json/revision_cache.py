@@ -0,0 +1,230 @@
+"""
+Revision-aware reconversion of edited documents (pipeline revision_cache=<folder>):
+
+    convert_docx(docx_path, LUA_SCRIPT, output_path, revision_cache="revision_cache", verify_revisions=True)
+
+The document is converted H1 section by H1 section (see split_convert.py). Every top-level
+block of document.xml (paragraph, table, drawing, ...) is fingerprinted without its revision
+ids, and the outputs of each section are kept in <folder>/<doc>.<path hash>.json under keys hashing
+everything they depend on:
+
+- convert (pandoc HTML and tables): the section's blocks, the copies of earlier headings and
+  numbered paragraphs in front of it, its footnote offset, the footnotes, relationships and
+  media it refers to, the rest of the package (styles, numbering, ...), the template styles,
+  the images to keep, pandoc and the conversion code;
+- clean (the HTML passes): the section's pandoc HTML, the figures of its images and the
+  figure renumbering.
+
+Only the sections whose keys changed since the previous run are converted again. Editing a
+paragraph reconverts its own section; editing a heading or a numbered paragraph, or adding a
+footnote, also reconverts the sections after it (their heading ids, list and footnote numbers
+follow). verify_revisions also runs the whole-document conversion and fails when the outputs
+differ, dropping the cache entry so the next run starts from scratch.
+"""
+import json
+import os
+import re
+from html import unescape
+
+import pypandoc
+from lxml import etree
+
+import docx_converter as dc
+import figure_registry
+import split_convert
+import style_resolver
+import table_records
+import zip_rewrite
+from conversion_logging import get_logger
+from output_writer import atomic_write, dump_json, hash_bytes
+from split_convert import ENDNOTES_PART, FOOTNOTES_PART, RELS_NS, W, clean_part
+from style_cache import FINGERPRINT_LENGTH, RSID_PATTERN
+
+logger = get_logger("revisions")
+
+# Entries of an older layout are ignored (and replaced)
+FORMAT_VERSION = 1
+CACHE_SUFFIX = ".json"
+
+# Modules computing the cached section outputs (pandoc HTML, tables, HTML passes): any change to
+# them invalidates every entry. Other modules (tests, benchmark, queue, ...) don't affect them
+CONVERSION_MODULES = (dc, split_convert, zip_rewrite, table_records, style_resolver, figure_registry)
+
+# Parts fingerprinted per section (the blocks, notes and relationships it refers to), and parts
+# the fragment pandoc writes doesn't read (document properties)
+SECTION_PARTS = (dc.DOCUMENT_PART, dc.DOCUMENT_RELS_PART, FOOTNOTES_PART, ENDNOTES_PART)
+UNREAD_PARTS = ("docProps/", f"{dc.MEDIA_PART_FOLDER}/")
+
+IMG_SRC = re.compile(r'<img\s[^>]*?src="([^"]*)"')
+
+
+def strip_revision_ids(xml):
+    """XML bytes without the revision ids Word changes on every edit (pandoc ignores them)."""
+    return RSID_PATTERN.sub(b"", xml)
+
+
+def block_fingerprint(xml):
+    return hash_bytes(strip_revision_ids(xml))[:FINGERPRINT_LENGTH]
+
+
+def digest(*values):
+    """Key of some JSON-serializable values."""
+    return hash_bytes(json.dumps(values, sort_keys=True).encode("utf-8"))
+
+
+def code_fingerprint(lua_script):
+    """Hash of the pandoc version, the conversion modules and the Lua filter."""
+    hashes = [pypandoc.get_pandoc_version()]
+    for path in [module.__file__ for module in CONVERSION_MODULES] + [lua_script]:
+        with open(path, "rb") as f:
+            hashes.append(hash_bytes(f.read()))
+    return digest(*hashes)
+
+
+def package_fingerprint(package, plan):
+    """Hash of what every section reads besides its own content: document.xml around the body and the shared parts."""
+    hashes = [hash_bytes(strip_revision_ids(plan["head"] + plan["tail"]))]
+    for name in sorted(package.names()):
+        if name in SECTION_PARTS or name.startswith(UNREAD_PARTS):
+            continue
+        hashes.append([name, hash_bytes(strip_revision_ids(bytes(package.read(name, cache=False))))])
+    return digest(*hashes)
+
+
+def note_fingerprints(package):
+    """{"footnote:<id>" / "endnote:<id>": fingerprint} of every note."""
+    notes = {}
+    for part, tag in ((FOOTNOTES_PART, "footnote"), (ENDNOTES_PART, "endnote")):
+        if part not in package:
+            continue
+        for note in etree.fromstring(bytes(package.read(part))).iterfind(f"{W}{tag}"):
+            notes[f"{tag}:{note.get(f'{W}id')}"] = block_fingerprint(etree.tostring(note))
+    return notes
+
+
+def relationship_fingerprints(package):
+    """{relationship id: [type, target, mode, CRC of the media part]} of the main document."""
+    if dc.DOCUMENT_RELS_PART not in package:
+        return {}
+    relationships = {}
+    for rel in etree.fromstring(bytes(package.read(dc.DOCUMENT_RELS_PART))).iter(f"{RELS_NS}Relationship"):
+        target = rel.get("Target", "")
+        part = f"word/{target}"
+        crc = package.info(part).CRC if rel.get("TargetMode") != "External" and part in package else None
+        relationships[rel.get("Id")] = [rel.get("Type"), target, rel.get("TargetMode"), crc]
+    return relationships
+
+
+class RevisionCache:
+    """
+    The section outputs of the previous conversion of a document, and those of this one:
+
+        revisions = RevisionCache("revision_cache", docx_path)
+        tables, html = split_convert(..., revisions=revisions)   # Reuses and records the sections
+        revisions.save()                                         # Keeps this run's sections only
+
+    Entries are keyed by content, so a stale or foreign entry is never wrong, only useless.
+    """
+
+    def __init__(self, folder, docx_path):
+        self.folder = folder
+        self.document = os.path.basename(docx_path)
+        # Documents of the same name in different folders get their own entries
+        path_hash = hash_bytes(os.path.abspath(docx_path).encode("utf-8"))[:FINGERPRINT_LENGTH]
+        self.path = os.path.join(folder, f"{os.path.splitext(self.document)[0]}.{path_hash}{CACHE_SUFFIX}")
+        previous = self._read()
+        self.previous_sections = {section["key"]: section for section in previous.get("sections", [])}
+        self.previous_cleaned = previous.get("cleaned", {})
+        self.previous_blocks = {block for section in previous.get("sections", []) for block in section["blocks"]}
+        self.bases, self.blocks = [], []
+        self.sections, self.cleaned_sections = {}, {}
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as error:
+            logger.warning("Ignoring unreadable revision cache file %s: %s", self.path, error)
+            return {}
+        return entry if entry.get("version") == FORMAT_VERSION else {}
+
+    def fingerprint(self, package, plan, note_ref, lua_script, keep_images, template_styles):
+        """Fingerprint the blocks and the dependencies of every section of a split_convert plan."""
+        conversion = digest(code_fingerprint(lua_script), package_fingerprint(package, plan), note_ref,
+                            keep_images, template_styles)
+        notes = note_fingerprints(package)
+        relationships = relationship_fingerprints(package)
+        for index, section in enumerate(plan["sections"]):
+            blocks = [block_fingerprint(xml) for xml in section["xml"]]
+            prefix = [block_fingerprint(xml) for xml in plan["prefixes"][index]]
+            section_notes = sorted(section["note_ids"] | plan["prefix_notes"][index])
+            section_rels = sorted(section["rels"] | plan["prefix_rels"][index])
+            self.blocks.append(blocks)
+            self.bases.append(digest(conversion, blocks, prefix, [[note, notes.get(note)] for note in section_notes],
+                                     [[rid, relationships.get(rid)] for rid in section_rels]))
+
+    def section_key(self, index, placeholder_notes):
+        return digest(self.bases[index], placeholder_notes)
+
+    def converted(self, index, placeholder_notes):
+        """(pandoc HTML, tables) of a section from the previous run, or None when it must be converted."""
+        section = self.previous_sections.get(self.section_key(index, placeholder_notes))
+        if section is None:
+            blocks = self.blocks[index]
+            changed = sum(block not in self.previous_blocks for block in blocks)
+            logger.info("Section %d: %d of %d block(s) new or changed%s", index, changed, len(blocks),
+                        "" if changed else " (depends on an earlier section, a note or a shared part)")
+            return None
+        logger.debug("Section %d: reused", index)
+        return section["html"], section["tables"]
+
+    def keep_converted(self, index, placeholder_notes, result):
+        html, tables = result
+        self.sections[index] = {"key": self.section_key(index, placeholder_notes), "blocks": self.blocks[index],
+                                "html": html, "tables": tables}
+
+    def clean_key(self, body, figures):
+        sources = [unescape(src) for src in IMG_SRC.findall(body)]
+        return digest(body, [[src, figures.for_image(src)] for src in sources], figures.number_map())
+
+    def cleaned(self, key):
+        return self.previous_cleaned.get(key)
+
+    def keep_cleaned(self, key, html):
+        self.cleaned_sections[key] = html
+
+    def save(self):
+        """Replace the previous run's entry with this run's sections."""
+        reused = sum(section["key"] in self.previous_sections for section in self.sections.values())
+        logger.info("%s: %d of %d section(s) reused", self.document, reused, len(self.sections))
+        os.makedirs(self.folder, exist_ok=True)
+        entry = {"version": FORMAT_VERSION, "document": self.document,
+                 "sections": [self.sections[index] for index in sorted(self.sections)], "cleaned": self.cleaned_sections}
+        # Atomic, so conversions of the same document on other hosts never read a partial entry
+        atomic_write(self.path, dump_json(entry, indent=None))
+
+    def discard(self):
+        """Remove the entry, so the next run converts every section."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def full_conversion(docx_path, lua_script, keep_images, figures, template_styles):
+    """(tables, HTML) of the whole-document conversion, as the pipeline produces them without sections."""
+    html = clean_part(dc.convert_docx_to_html(docx_path, lua_script, keep_images), figures)
+    return dc.extract_table_format(docx_path, template_styles), html
+
+
+def first_difference(expected, actual):
+    """Where section-wise (tables, HTML) first differ from the whole-document ones, or None."""
+    expected_tables, expected_html = expected
+    tables, html = actual
+    if tables != expected_tables or dump_json(tables) != dump_json(expected_tables):
+        names = sorted(name for name in expected_tables.keys() | tables.keys() if expected_tables.get(name) != tables.get(name))
+        return f"tables differ: {', '.join(names[:5]) or 'order'}"
+    if html != expected_html:
+        offset = next((i for i, (a, b) in enumerate(zip(html, expected_html)) if a != b), min(len(html), len(expected_html)))
+        return f"HTML differs at character {offset}: expected {expected_html[offset:offset + 80]!r}, got {html[offset:offset + 80]!r}"
+    return None
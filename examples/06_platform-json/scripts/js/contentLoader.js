@@ -0,0 +1,230 @@
+document.addEventListener("DOMContentLoaded", async function () {
+    await loadContent();
+});
+
+// Fingerprinted file names embedded in index.html by the converter (precompress=True),
+// e.g. "data/styles.json" -> "data/styles.3f2a9c1b7e.json". Unlisted paths are used as they are.
+const assetMap = JSON.parse(document.getElementById("asset-map")?.textContent || "{}");
+
+function assetUrl(path) {
+    return assetMap[path] || path;
+}
+
+// Critical data inlined into index.html by the converter (bootstrap=True): styles, navigation, the
+// section manifest and the media of the first section, whose markup is already in #content
+const bootstrapData = JSON.parse(document.getElementById("bootstrap-data")?.textContent || "null");
+
+async function loadContent() {
+    try {
+        if (bootstrapData && typeof loadSections === "function") {
+            await loadBootstrapped(bootstrapData, document.getElementById("content"));
+            return;
+        }
+
+        const [sectionsRes, stylesRes, tableSource] = await Promise.all([
+            // Per-section fragments written at build time (missing when the document wasn't split)
+            fetch(assetUrl("data/sections.json")).then(res => res.ok ? res.json() : null).catch(() => null),
+            fetch(assetUrl("data/styles.json")).then(res => res.json()),
+            loadTableSource()
+        ]);
+
+        const contentDiv = document.getElementById("content");
+
+        // Only download the section being read (see sectionLoader.js)
+        if (sectionsRes && typeof loadSections === "function") {
+            await loadSections(sectionsRes, contentDiv, section => prepareContent(section, stylesRes, tableSource));
+            return;
+        }
+
+        contentDiv.innerHTML = await fetch(assetUrl("content/content.html")).then(res => res.text());
+        prepareContent(contentDiv, stylesRes, tableSource);
+
+        // Sections and spacing are already in content.html when it was built with layout_mode="build"
+        const builtLayout = contentDiv.querySelector(".h1-section") !== null;
+
+        // 🔹 Wrap sections correctly after content loads
+        if (!builtLayout && typeof wrapHeadings === "function") {
+            wrapHeadings(contentDiv);
+        }
+
+        // 🔹 Load navigation after sections are available
+        if (typeof loadNavigation === "function") {
+            loadNavigation();
+        }
+
+        // 🔹 Add <br> after each <p> AFTER content is loaded
+        if (!builtLayout && typeof addBrAfterParagraphs === "function") {
+            addBrAfterParagraphs();
+        }
+
+    } catch (error) {
+        console.error("❌ Error loading content:", error);
+    }
+}
+
+// The first section renders straight from index.html; no request is made until something is missing
+async function loadBootstrapped(bootstrap, contentDiv) {
+    const prepare = root => prepareContentLazily(root, bootstrap.styles);
+    prepare(contentDiv);
+    await loadSections(bootstrap.sections, contentDiv, prepare);
+}
+
+// Tables too large to inline keep an empty placeholder: fetch the table source once, when the first one shows up
+let tableSourcePromise = null;
+
+function prepareContentLazily(root, styles) {
+    prepareContent(root, styles, null);
+    if (root.querySelector("div.table:empty")) {
+        tableSourcePromise = tableSourcePromise || loadTableSource();
+        return tableSourcePromise.then(tableSource => prepareTables(root, styles, tableSource));
+    }
+}
+
+// One file per table (data/tables/index.json, fetched table by table), else the tables pre-rendered
+// at build time (content/tables.html), else tables.json to generate them in the browser
+async function loadTableSource() {
+    const tableIndex = await fetch(assetUrl("data/tables/index.json")).then(res => res.ok ? res.json() : null).catch(() => null);
+    if (tableIndex !== null) {
+        return { index: Object.fromEntries(tableIndex.tables.map(entry => [entry.id, entry])) };
+    }
+    const tablesHtml = await fetch(assetUrl("content/tables.html")).then(res => res.ok ? res.text() : null).catch(() => null);
+    if (tablesHtml !== null) {
+        const templates = document.createElement("div");
+        templates.innerHTML = tablesHtml;
+        return { templates };
+    }
+    return { tables: await fetch(assetUrl("data/tables.json")).then(res => res.json()) };
+}
+
+// Styles, tables and images for newly inserted content (tables are left alone without a tableSource)
+function prepareContent(root, styles, tableSource) {
+    applyStyles(styles);
+    if (tableSource) {
+        prepareTables(root, styles, tableSource);
+    }
+    if (typeof loadImages === "function") {
+        loadImages();
+    }
+}
+
+function prepareTables(root, styles, tableSource) {
+    if (tableSource.index) {
+        observeTables(root, styles, tableSource.index);
+    } else if (tableSource.templates) {
+        attachTables(tableSource.templates, root);
+    } else {
+        renderTables(tableSource.tables, styles, root);
+    }
+}
+
+
+function applyStyles(styles) {
+    if (!styles) return;
+
+    // Styles compiled into a stylesheet at build time: link it instead of styling every element
+    // (unless index.html already holds it as <style data-href="...">)
+    if (styles.stylesheet) {
+        if (!document.querySelector(`link[href="${styles.stylesheet}"], style[data-href="${styles.stylesheet}"]`)) {
+            const link = document.createElement("link");
+            link.rel = "stylesheet";
+            link.href = styles.stylesheet;
+            document.head.appendChild(link);
+        }
+        return;
+    }
+
+    const applyStyle = (element, styleObj) => {
+        if (!styleObj) return;
+        Object.entries(styleObj).forEach(([key, value]) => {
+            element.style[key] = value;
+        });
+    };
+
+    if (styles.headings) {
+        Object.entries(styles.headings).forEach(([tag, styleObj]) => {
+            document.querySelectorAll(tag).forEach(el => applyStyle(el, styleObj));
+        });
+    }
+
+    if (styles.body) {
+        if (styles.body.p) {
+            document.querySelectorAll("p").forEach(el => applyStyle(el, styles.body.p));
+        }
+        if (styles.body.ul) {
+            document.querySelectorAll("ul").forEach(el => applyStyle(el, styles.body.ul));
+        }
+        if (styles.body.li) {
+            document.querySelectorAll("li").forEach(el => applyStyle(el, styles.body.li));
+        }
+    }
+}
+
+// Move each pre-rendered <template data-table="table_N"> into its (still empty) placeholder div
+function attachTables(templates, root) {
+    root.querySelectorAll("div.table:empty").forEach(div => {
+        const template = templates.querySelector(`template[data-table="${div.id}"]`);
+        if (template) {
+            div.replaceChildren(template.content);
+        } else {
+            console.error(`Table ID ${div.id} not found in tables.html`);
+            div.innerHTML = `<p>Table ${div.id} not found</p>`;
+        }
+    });
+}
+
+// Each placeholder is filled from its own file once it comes near the viewport (tables of hidden
+// sections wait until the section is shown), so a large appendix table never delays the first ones
+let tableObserver = null;
+
+function observeTables(root, styles, index) {
+    const placeholders = root.querySelectorAll("div.table:empty");
+    if (!("IntersectionObserver" in window)) {
+        placeholders.forEach(div => loadTable(div, styles, index));
+        return;
+    }
+    tableObserver = tableObserver || new IntersectionObserver(entries => {
+        entries.filter(entry => entry.isIntersecting).forEach(entry => {
+            tableObserver.unobserve(entry.target);
+            loadTable(entry.target, styles, index);
+        });
+    }, { rootMargin: "400px 0px" });
+    placeholders.forEach(div => tableObserver.observe(div));
+}
+
+async function loadTable(div, styles, index) {
+    const entry = index[div.id];
+    try {
+        if (!entry) throw new Error("not in data/tables/index.json");
+        if (entry.html) {
+            // Pre-rendered at build time, caption included
+            div.innerHTML = await fetch(assetUrl(entry.html)).then(res => {
+                if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+                return res.text();
+            });
+        } else {
+            const tableData = await fetch(assetUrl(entry.file)).then(res => {
+                if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+                return res.json();
+            });
+            div.innerHTML = generateTable(tableData, styles, div.getAttribute("data-caption") || "");
+        }
+    } catch (error) {
+        console.error(`Table ${div.id} could not be loaded:`, error);
+        div.innerHTML = `<p>Table ${div.id} not found</p>`;
+    }
+}
+
+// Fallback: build the tables in the browser from tables.json
+function renderTables(tables, globalStyles, root) {
+    root.querySelectorAll("div.table:empty").forEach(div => {
+        const tableId = div.id;
+        const caption = div.getAttribute("data-caption") || ""; // Extract caption from div
+
+        if (tables[tableId]) {
+            div.innerHTML = generateTable(tables[tableId], globalStyles, caption);
+        } else {
+            console.error(`Table ID ${tableId} not found in tables.json`);
+            div.innerHTML = `<p>Table ${tableId} not found</p>`;
+        }
+    });
+}
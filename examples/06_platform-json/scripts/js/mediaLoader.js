@@ -1,27 +1,43 @@
+// media.json is keyed by the data-src of each div.image placeholder: { "./assets/x.png": { path, width, height, alt_text, ... } }
+let mediaDataPromise = null;
+
+function loadMediaData() {
+    if (!mediaDataPromise) {
+        mediaDataPromise = fetch(assetUrl("data/media.json")).then(res => res.json());
+    }
+    return mediaDataPromise;
+}
+
 async function loadImages() {
     try {
-        // Fetch media.json
-        const mediaRes = await fetch("data/media.json");
-        const mediaData = await mediaRes.json();
+        const placeholders = document.querySelectorAll("#content div.image");
 
-        console.log("Loaded media.json:", mediaData);
+        // Images of the section inlined into index.html (bootstrap) don't need media.json
+        const inlineMedia = (typeof bootstrapData !== "undefined" && bootstrapData?.media) || {};
+        const complete = [...placeholders].every(div => inlineMedia[div.getAttribute("data-src")]);
+        const mediaData = complete ? inlineMedia : { ...inlineMedia, ...await loadMediaData() };
 
-        // Find all elements with the data-image attribute
-        document.querySelectorAll("#content div.image").forEach(div => {
+        // Find all image placeholders
+        placeholders.forEach(div => {
             const imagePath = div.getAttribute("data-src"); // ✅ Extract image path
             const captionText = div.getAttribute("data-caption"); // ✅ Extract caption
 
-            // Find the corresponding image entry in media.json
-            const imageEntry = Object.values(mediaData).find(img => img.path === imagePath);
+            const imageEntry = mediaData[imagePath];
 
             if (imageEntry) {
-                console.log(`Replacing div with image: ${imageEntry.path}`);
-
                 // Create an <img> element
                 const imgElement = document.createElement("img");
                 imgElement.src = imageEntry.path;
                 imgElement.alt = imageEntry.alt_text;
+                imgElement.loading = "lazy";
+                imgElement.decoding = "async";
+                // Intrinsic size from media.json reserves the space before the image loads (no layout shift)
+                if (imageEntry.width && imageEntry.height) {
+                    imgElement.width = imageEntry.width;
+                    imgElement.height = imageEntry.height;
+                }
                 imgElement.style.maxWidth = "50%"; // Optional for responsiveness
+                imgElement.style.height = "auto";
 
                 let replacementElement;
 
@@ -58,10 +58,13 @@ function setActiveNavigation() {
 // Function to initialize navigation and page switching
 async function loadNavigation() {
     try {
-        const response = await fetch("data/navigation.json");
-        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
-
-        const navData = await response.json();
+        // Inlined into index.html by the converter (bootstrap=True), fetched otherwise
+        let navData = typeof bootstrapData !== "undefined" && bootstrapData ? bootstrapData.navigation : null;
+        if (!navData) {
+            const response = await fetch(assetUrl("data/navigation.json"));
+            if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
+            navData = await response.json();
+        }
         await waitForContent();
 
         insertNavigation(navData);
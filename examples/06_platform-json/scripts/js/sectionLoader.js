@@ -0,0 +1,89 @@
+// Viewer for documents split into H1 sections at build time (data/sections.json).
+// Only the section being read is downloaded; the others are prefetched while the browser is idle.
+
+const sectionCache = new Map(); // file -> Promise of the fragment HTML
+
+function fetchSection(file) {
+    if (!sectionCache.has(file)) {
+        sectionCache.set(file, fetch(assetUrl(file)).then(res => {
+            if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+            return res.text();
+        }));
+    }
+    return sectionCache.get(file);
+}
+
+// Section holding the H1, H2 or H3 with this id (the first section by default)
+function findSection(manifest, id) {
+    return manifest.sections.find(section =>
+        section.id === id ||
+        section.h2.some(h2 => h2.id === id || (h2.h3 || []).some(h3 => h3.id === id))
+    ) || manifest.sections[0];
+}
+
+async function loadSections(manifest, contentDiv, prepare) {
+    if (manifest.preamble) {
+        contentDiv.innerHTML = await fetchSection(manifest.preamble);
+        prepare(contentDiv);
+    }
+
+    // One empty slot per section keeps the document order, whatever order the sections load in
+    const slots = new Map();
+    const loaded = new Map(); // section id -> Promise resolved once the slot is filled
+    manifest.sections.forEach(section => {
+        // Sections inlined into index.html (bootstrap) are already in place and prepared
+        const inlined = section.inline && [...contentDiv.children].find(child => child.dataset.section === section.id);
+        if (inlined) {
+            slots.set(section.id, inlined);
+            loaded.set(section.id, Promise.resolve());
+            return;
+        }
+        const slot = document.createElement("div");
+        slot.dataset.section = section.id;
+        slot.style.display = "none";
+        contentDiv.appendChild(slot);
+        slots.set(section.id, slot);
+    });
+    async function showSection() {
+        const hash = window.location.hash.substring(1);
+        const section = findSection(manifest, hash);
+        if (!section) return;
+
+        const slot = slots.get(section.id);
+        if (!loaded.has(section.id)) {
+            loaded.set(section.id, fetchSection(section.file).then(html => {
+                slot.innerHTML = html;
+                prepare(slot);
+            }));
+        }
+        await loaded.get(section.id);
+
+        // Another hash change may have happened while this section was loading
+        if (findSection(manifest, window.location.hash.substring(1)) !== section) return;
+        slots.forEach(other => {
+            other.style.display = other === slot ? "" : "none";
+        });
+        if (hash) {
+            document.getElementById(hash)?.scrollIntoView({ behavior: "smooth" });
+        }
+    }
+
+    window.addEventListener("hashchange", showSection);
+    await showSection();
+    prefetchSections(manifest);
+}
+
+// Warm the cache with the remaining sections, one per idle period
+function prefetchSections(manifest) {
+    const whenIdle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+    const queue = manifest.sections.filter(section => !section.inline).map(section => section.file);
+
+    const next = () => {
+        const file = queue.shift();
+        if (!file) return;
+        fetchSection(file)
+            .catch(() => sectionCache.delete(file)) // Retried when the section is opened
+            .finally(() => whenIdle(next));
+    };
+    whenIdle(next);
+}
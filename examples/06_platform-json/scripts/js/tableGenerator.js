@@ -0,0 +1,133 @@
+// Builds the same markup as table_renderer.render_table_html() (checked against it by regression.py)
+
+const BR_TAG = "<br>";
+
+function cssDeclarations(properties) {
+    // {fontSize: "1rem"} -> "font-size: 1rem;", like style_sheet.css_declarations()
+    return Object.entries(properties)
+        .map(([key, value]) => `${key.replace(/[A-Z]/g, letter => "-" + letter.toLowerCase())}: ${value};`)
+        .join(" ");
+}
+
+function escapeText(text) {
+    // Escape cell text while keeping the <br> line breaks added by extract_table_format
+    return String(text).split(BR_TAG)
+        .map(segment => segment.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;"))
+        .join(BR_TAG)
+        .replace(/\n/g, BR_TAG);
+}
+
+function tableProperties(tableStyle) {
+    return {
+        border: tableStyle.border || "1px solid black",
+        width: tableStyle.width || "auto",
+        borderCollapse: tableStyle.borderCollapse || "collapse",
+        marginBottom: tableStyle.marginBottom || "10px",
+    };
+}
+
+function cellProperties(cell, defaultStyle) {
+    return {
+        backgroundColor: cell.backgroundColor || defaultStyle.backgroundColor || "transparent",
+        color: cell.color || defaultStyle.color || "black",
+        fontSize: cell.fontSize || defaultStyle.fontSize || "1rem",
+        fontWeight: cell.fontWeight || defaultStyle.fontWeight || "normal",
+        textAlign: cell.textAlign || defaultStyle.textAlign || "left",
+        verticalAlign: cell.verticalAlign || defaultStyle.verticalAlign || "middle",
+        padding: cell.padding || defaultStyle.padding || "5px",
+    };
+}
+
+function styleReference(element, properties, defaultClass) {
+    // class="..." for elements interned into content/document.css, inline style="..." otherwise
+    const className = element.className || defaultClass;
+    return className ? `class="${className}"` : `style="${cssDeclarations(properties)}"`;
+}
+
+function renderTextPart(part) {
+    if (part.newline) return BR_TAG;
+    let text = escapeText(part.text || "");
+    if (part.bold) text = `<b>${text}</b>`;
+    if (part.superscript) text = `<sup>${text}</sup>`;
+    if (part.subscript) text = `<sub>${text}</sub>`;
+    if (part.italic) text = `<i>${text}</i>`;
+    if (part.underline) text = `<u>${text}</u>`;
+    if (part.strikethrough) text = `<del>${text}</del>`;
+    const spanStyle = {};
+    if (part.color) spanStyle.color = part.color;
+    if (part.fontSize) spanStyle.fontSize = part.fontSize;
+    if (part.className) text = `<span class="${part.className}">${text}</span>`;
+    else if (Object.keys(spanStyle).length) text = `<span style="${cssDeclarations(spanStyle)}">${text}</span>`;
+    return text;
+}
+
+function renderCell(tag, cell, defaultStyle, defaultClass) {
+    let content;
+    if (cell.textParts && cell.textParts.length) {
+        content = cell.textParts.map(renderTextPart).join("");
+    } else {
+        // Formatting shared by the whole cell is stored at the top level of the cell
+        content = renderTextPart({ ...cell, color: null, fontSize: null, className: null });
+    }
+
+    if (cell.iconHtml) {
+        // iconHtml is built by extract_table_format from the icon alt text (trusted markup)
+        const atStart = ("iconPosition" in cell ? cell.iconPosition : "start") === "start";
+        content = atStart ? cell.iconHtml + content : content + cell.iconHtml;
+    }
+
+    const spans = [["colSpan", "colspan"], ["rowSpan", "rowspan"]]
+        .filter(([key]) => cell[key])
+        .map(([key, name]) => ` ${name}="${parseInt(cell[key], 10)}"`)
+        .join("");
+    return `<${tag}${spans} ${styleReference(cell, cellProperties(cell, defaultStyle), defaultClass)}>${content}</${tag}>`;
+}
+
+function generateTable(tableData, globalStyles, caption = "") {
+    if (!tableData) return "<p>Table not found</p>";
+
+    if (tableData.rows && !Array.isArray(tableData.rows)) {
+        console.error("Error: tableData.rows is not an array.", tableData.rows);
+        return "<p>Error: Table data is not structured correctly.</p>";
+    }
+
+    const tableStyle = { ...globalStyles.table, ...tableData.styles };
+    const thStyle = { ...globalStyles.th, ...tableData.th };
+    const td1Style = { ...globalStyles.td1, ...tableData.td1 };
+    const tdStyle = { ...globalStyles.td, ...tableData.td };
+    const cellClassNames = tableData.cellClassNames || {};
+
+    // Tables converted with style_mode="classes" refer to classes of content/document.css
+    let tableHTML = `<table ${styleReference(tableData, tableProperties(tableStyle))}>`;
+
+    // Caption HTML from the table placeholder (already escaped by pandoc)
+    if (caption) {
+        tableHTML += `<caption class="table-caption">${caption}</caption>`;
+    }
+
+    if (tableData.headers && tableData.headers.length) {
+        tableHTML += "<thead><tr>";
+        tableHTML += tableData.headers.map(header => renderCell("th", header, thStyle, cellClassNames.th)).join("");
+        tableHTML += "</tr></thead>";
+    }
+
+    tableHTML += "<tbody>";
+    (tableData.rows || []).forEach((row, rowIndex) => {
+        if (!Array.isArray(row)) {
+            console.error(`Error: Row ${rowIndex} is not an array`, row);
+            return;
+        }
+        tableHTML += "<tr>";
+        tableHTML += row.map((cell, colIndex) => colIndex === 0
+            ? renderCell("td", cell, td1Style, cellClassNames.td1)
+            : renderCell("td", cell, tdStyle, cellClassNames.td)).join("");
+        tableHTML += "</tr>";
+    });
+    tableHTML += "</tbody></table>";
+
+    return tableHTML;
+}
+
+if (typeof module !== "undefined") {
+    module.exports = { generateTable };
+}
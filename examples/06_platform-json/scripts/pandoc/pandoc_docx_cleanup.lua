@@ -23,19 +23,41 @@
 local image_counter = 0
 local keep_set = {} -- Lookup table of images to keep
 local image_positions = {} -- Maps image index to element
-local log_file = io.open("lua_log.txt", "w")
+local log_enabled = true -- Switched off with the metadata field lua_debug_log=false
+local log_file = nil -- Opened on the first message so a disabled log never touches the disk
+local split_marker = nil -- Set (metadata split_marker) for the sub-documents of split_convert.py
+local split_marker_class = "split-marker-notes" -- SPLIT_MARKER_CLASS in split_convert.py
 
 -- Custom debug print function to prevent HTML output
 function debug_log(...)
+    if not log_enabled then
+        return
+    end
+    if not log_file then
+        log_file = io.open("lua_log.txt", "w")
+    end
     local args = {...}
     for i, v in ipairs(args) do
         if type(v) ~= "string" then
             args[i] = pandoc.utils.stringify(v) -- Convert Pandoc objects to strings
         end
     end
-    local msg = table.concat(args, " ")
-    log_file:write(msg .. "\n")
-    log_file:flush()
+    -- Buffered: the file is flushed once at the end of the document instead of on every line
+    log_file:write(table.concat(args, " ") .. "\n")
+end
+
+-- Reads the lua_debug_log switch before any other filter function runs
+function ConfigureLog(meta)
+    local setting = meta.lua_debug_log
+    if setting ~= nil then
+        if type(setting) ~= "boolean" then
+            setting = pandoc.utils.stringify(setting) ~= "false"
+        end
+        log_enabled = setting
+    end
+    if meta.split_marker ~= nil then
+        split_marker = pandoc.utils.stringify(meta.split_marker)
+    end
 end
 
 -- First pass: Collect image positions
@@ -143,18 +165,50 @@ function Pandoc(doc)
         end
     }).content
 
-    -- Remove first 5 blocks
     local new_blocks = {}
-    for i, block in ipairs(filtered) do
-        if i > 5 then
-            table.insert(new_blocks, block)
-        else
-            debug_log("DEBUG: Removing block", i)
+    if split_marker then
+        -- Sub-document of a split conversion: it has no title page, but starts with copies of the
+        -- earlier headings and lists ending with the marker paragraph. Drop them, keeping only the
+        -- marker's footnotes so the section's own footnotes are numbered as in the whole document.
+        -- The footnotes go in a div the stitch removes (always written, so it can check it's there).
+        local marker_found = false
+        for i, block in ipairs(filtered) do
+            if marker_found then
+                table.insert(new_blocks, block)
+            elseif pandoc.utils.stringify(block):find(split_marker, 1, true) then
+                marker_found = true
+                local notes = {}
+                block:walk({ Note = function(note) table.insert(notes, note) end })
+                local content = #notes > 0 and { pandoc.Para(notes) } or {}
+                table.insert(new_blocks, pandoc.Div(content, pandoc.Attr("", { split_marker_class })))
+                debug_log("DEBUG: Split marker at block", i, "with", #notes, "footnote(s)")
+            end
+        end
+        if not marker_found then
+            error("Split marker " .. split_marker .. " not found: the section would be dropped")
+        end
+    else
+        -- Remove first 5 blocks
+        for i, block in ipairs(filtered) do
+            if i > 5 then
+                table.insert(new_blocks, block)
+            else
+                debug_log("DEBUG: Removing block", i)
+            end
         end
     end
 
     debug_log("DEBUG: Final number of blocks:", #new_blocks)
+    if log_file then
+        log_file:flush()
+    end
     doc.blocks = new_blocks
     return doc
 end
 
+-- Run ConfigureLog as its own pass first: element functions otherwise run before the metadata is read
+return {
+    { Meta = ConfigureLog },
+    { Image = Image, Figure = Figure, Pandoc = Pandoc }
+}
+
@@ -0,0 +1,340 @@
+"""
+Split-and-stitch conversion of one large DOCX (pipeline split_workers=N):
+
+1. split: the body of document.xml is cut before every H1 but the first, and each section is
+   written to a sub-document sharing every other part of the package (styles, numbering,
+   footnotes, rels and the media it refers to, copied without recompression).
+2. convert: pandoc and the table extraction run on the sub-documents in parallel processes.
+3. stitch: the sections' HTML is joined in order with one footnotes list; their tables are
+   renumbered table_0, table_1, ... across the document.
+4. clean: the HTML passes up to the table placeholders run on every section in parallel.
+
+Pandoc numbers footnotes and makes heading ids unique while writing, and wraps lines around
+them, so these can't be renumbered after the fact. Instead every sub-document but the first
+starts with copies of the earlier headings and numbered paragraphs (so heading ids and list
+numbering continue as in the whole document) and a marker paragraph holding as many footnote
+references as the earlier sections have footnotes. The Lua filter drops these copies and the
+stitch drops the placeholder footnotes. Figure numbers come from the FigureRegistry of the
+whole document. With a RevisionCache, sections unchanged since the previous run skip phases 2
+and 4 (see revision_cache.py).
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+import docx_converter as dc
+from conversion_logging import get_logger
+from docx_package import docx_package
+from zip_rewrite import rewrite_zip
+
+logger = get_logger("split")
+
+W = dc.W_NS
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+FOOTNOTES_PART = "word/footnotes.xml"
+ENDNOTES_PART = "word/endnotes.xml"
+
+HEADING_STYLE = re.compile(r"heading ([1-9])$", re.IGNORECASE)
+
+# Footnote references of deleted text are not converted (pandoc accepts tracked changes)
+DELETED_TAGS = (f"{W}del", f"{W}moveFrom")
+
+# Pandoc writes the footnotes of a document in one section at its end
+FOOTNOTES_SECTION = '<section id="footnotes" class="footnotes footnotes-end-of-document"'
+FOOTNOTE_ITEM = re.compile(r'(?=<li id="fn\d+">)')
+FOOTNOTES_END = "</ol>\n</section>"
+FOOTNOTE_REF = 'class="footnote-ref"'
+
+# The Lua filter writes the marker's footnotes first, in a div of their own (split_marker_class)
+SPLIT_MARKER_CLASS = "split-marker-notes"
+MARKER_NOTES_START = f'<div class="{SPLIT_MARKER_CLASS}">\n'
+MARKER_NOTES_END = "</div>\n"
+
+
+def paragraph_styles(styles_xml):
+    """{paragraph style id: (name, based-on style id, has numbering, has outline level)} of styles.xml."""
+    styles = {}
+    for style in etree.fromstring(styles_xml).iterfind(f"{W}style"):
+        if style.get(f"{W}type") != "paragraph":
+            continue
+        name = style.find(f"{W}name")
+        based_on = style.find(f"{W}basedOn")
+        styles[style.get(f"{W}styleId")] = (
+            name.get(f"{W}val") if name is not None else "",
+            based_on.get(f"{W}val") if based_on is not None else None,
+            style.find(f"{W}pPr/{W}numPr") is not None,
+            style.find(f"{W}pPr/{W}outlineLvl") is not None,
+        )
+    return styles
+
+
+def style_traits(styles, style_id, cache):
+    """(heading level or None, carries state) of a paragraph style, following its basedOn chain."""
+    if style_id in cache:
+        return cache[style_id]
+    level, stateful, seen = None, False, set()
+    current = style_id
+    while current in styles and current not in seen:
+        seen.add(current)
+        name, based_on, numbered, outlined = styles[current]
+        match = HEADING_STYLE.match(name or "")
+        if level is None and match:
+            level = int(match.group(1))
+        stateful = stateful or numbered or outlined
+        current = based_on
+    cache[style_id] = (level, stateful or level is not None)
+    return cache[style_id]
+
+
+def count_notes(element):
+    """Footnote and endnote references pandoc converts in an element."""
+    count = 0
+    for ref in element.iter(f"{W}footnoteReference", f"{W}endnoteReference"):
+        if not any(ancestor.tag in DELETED_TAGS for ancestor in ref.iterancestors()):
+            count += 1
+    return count
+
+
+def note_ids(element):
+    """"footnote:<id>" and "endnote:<id>" of the notes an element refers to."""
+    return {f"{ref.tag[len(W):-len('Reference')]}:{ref.get(f'{W}id')}"
+            for ref in element.iter(f"{W}footnoteReference", f"{W}endnoteReference")}
+
+
+def relationship_ids(element):
+    return {value for node in element.iter() if isinstance(node.tag, str)
+            for key, value in node.attrib.items() if key.startswith(f"{{{R_NS}}}")}
+
+
+def note_reference(package):
+    """Markup of a reference to an existing footnote (or endnote), repeated for the placeholder footnotes."""
+    for part, tag in ((FOOTNOTES_PART, "footnote"), (ENDNOTES_PART, "endnote")):
+        if part not in package:
+            continue
+        for note in etree.fromstring(bytes(package.read(part))).iterfind(f"{W}{tag}"):
+            if note.get(f"{W}type") in (None, "normal"):
+                return f'<w:r><w:{tag}Reference w:id="{note.get(f"{W}id")}"/></w:r>'
+    return ""
+
+
+def plan_sections(package):
+    """
+    Cut the body of the document at its H1 headings (the first H1 stays with the title page).
+
+    :return: {"head", "tail", "sections": [{"xml", "state", "notes", "note_ids", "rels"}, ...]} where head
+             and tail are the bytes of document.xml around the body content, xml the section's
+             elements, state the headings and numbered paragraphs later sections need copies of.
+    """
+    styles = paragraph_styles(bytes(package.read(dc.STYLES_PART)))
+    cache = {}
+    root = etree.fromstring(bytes(package.read(dc.DOCUMENT_PART)))
+    body = root.find(f"{W}body")
+    children = list(body)
+    tail_elements = [children.pop()] if children and children[-1].tag == f"{W}sectPr" else []
+
+    sections, h1_count = [], 0
+    for child in children:
+        level, stateful = None, False
+        if child.tag == f"{W}p":
+            level, stateful = style_traits(styles, dc.paragraph_style_id(child), cache)
+            p_pr = child.find(f"{W}pPr")
+            stateful = stateful or (p_pr is not None and (p_pr.find(f"{W}numPr") is not None or p_pr.find(f"{W}outlineLvl") is not None))
+        if level == 1:
+            h1_count += 1
+        if not sections or (level == 1 and h1_count > 1):
+            sections.append({"xml": [], "state": [], "notes": 0, "note_ids": set(), "rels": set()})
+        section = sections[-1]
+        xml = etree.tostring(child)
+        section["xml"].append(xml)
+        if stateful:
+            section["state"].append(xml)
+        section["notes"] += count_notes(child)
+        section["note_ids"] |= note_ids(child)
+        section["rels"] |= relationship_ids(child)
+
+    # Everything but the body content, split where the sections go
+    token = uuid.uuid4().hex
+    for child in children + tail_elements:
+        body.remove(child)
+    body.text = token
+    head, tail = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True).split(token.encode())
+    tail = b"".join(etree.tostring(element) for element in tail_elements) + tail
+    return {"head": head, "tail": tail, "sections": sections}
+
+
+def media_targets(package):
+    """{relationship id: part name} of the media the main document refers to."""
+    if dc.DOCUMENT_RELS_PART not in package:
+        return {}
+    rels = etree.fromstring(bytes(package.read(dc.DOCUMENT_RELS_PART)))
+    return {rel.get("Id"): f"word/{rel.get('Target')}" for rel in rels.iter(f"{RELS_NS}Relationship")
+            if rel.get("Target", "").startswith("media/")}
+
+
+def write_sub_document(docx_path, sub_path, plan, index, prefix, placeholder_notes, note_ref, marker, media):
+    """
+    Write the sub-document of one section: the original package with document.xml holding the
+    prefix (copies of earlier state paragraphs and the marker) and the section, and the media
+    the section doesn't use emptied.
+    """
+    section = plan["sections"][index]
+    content = b"".join(section["xml"])
+    if index:
+        marker_paragraph = f"<w:p><w:r><w:t>{marker}</w:t></w:r>{note_ref * placeholder_notes}</w:p>".encode()
+        content = b"".join(prefix) + marker_paragraph + content
+    rels = section["rels"] | plan["prefix_rels"][index]
+    used = {media[rid] for rid in rels if rid in media}
+    replacements = {name: b"" for name in set(media.values()) - used}
+    replacements[dc.DOCUMENT_PART] = plan["head"] + content + plan["tail"]
+    rewrite_zip(docx_path, sub_path, replacements)
+    return sub_path
+
+
+def convert_part(part):
+    """Pandoc HTML and tables.json tables of one sub-document (run in a worker process)."""
+    metadata = {"split_marker": part["marker"]} if part["index"] else None
+    html = dc.convert_docx_to_html(part["path"], part["lua_script"], part["keep_images"], metadata, part["workdir"])
+    tables = dc.extract_table_format(part["path"], part["template_styles"])
+    return html, tables
+
+
+def clean_part(html, figures):
+    """The HTML passes from remove_empty_paragraphs to update_in_text_figure_references on one section."""
+    html = dc.remove_empty_paragraphs(html)
+    html = dc.remove_empty_figures(html)
+    html = dc.replace_images_with_divs(html, figures)
+    html = dc.remove_captions_from_unwanted_figures(html)
+    return dc.update_in_text_figure_references(html, figures.number_map())
+
+
+def split_footnotes(html, placeholder_notes, marked):
+    """
+    (section HTML, [footnote <li>s], (footnotes section start, end)) with the placeholder footnotes dropped.
+
+    :param marked: The HTML is that of a sub-document starting with the marker's footnotes.
+    """
+    if marked:
+        end = html.find(MARKER_NOTES_END) if html.startswith(MARKER_NOTES_START) else -1
+        if end < 0 or html[:end].count(FOOTNOTE_REF) != placeholder_notes:
+            raise ValueError(f"Section HTML doesn't start with the div of the {placeholder_notes} split marker footnote(s)")
+        html = html[end + len(MARKER_NOTES_END):]
+    start = html.find(FOOTNOTES_SECTION)
+    if start < 0:
+        return html, [], None
+    section = html[start:]
+    end = section.rindex(FOOTNOTES_END)
+    items = FOOTNOTE_ITEM.split(section[:end])
+    return html[:start], items[1 + placeholder_notes:], (items[0], section[end:])
+
+
+def map_parts(executor, function, *iterables):
+    return list(executor.map(function, *iterables) if executor else map(function, *iterables))
+
+
+def split_convert(docx_path, lua_script, keep_images, figures, template_styles, workers, revisions=None):
+    """
+    Convert a DOCX section by section in parallel and stitch the results.
+
+    :param revisions: Optional RevisionCache: sections whose output the previous run already
+                      produced are taken from it, and every section's output is recorded in it
+                      (the caller saves it, see revision_cache.py).
+    :return: (tables as extract_table_format returns them, HTML as after update_in_text_figure_references)
+    """
+    with docx_package(docx_path) as package:
+        plan = plan_sections(package)
+        note_ref = note_reference(package)
+        media = media_targets(package)
+        sections = plan["sections"]
+
+        # Copies of the state paragraphs of every earlier section
+        prefixes, prefix_rels, prefix_notes, state, rels, state_notes = [], [], [], [], set(), set()
+        for section in sections:
+            prefixes.append(list(state))
+            prefix_rels.append(set(rels))
+            prefix_notes.append(set(state_notes))
+            state.extend(section["state"])
+            for xml in section["state"]:
+                element = etree.fromstring(xml)
+                rels |= relationship_ids(element)
+                state_notes |= note_ids(element)
+        plan.update(prefixes=prefixes, prefix_rels=prefix_rels, prefix_notes=prefix_notes)
+
+        if revisions:
+            revisions.fingerprint(package, plan, note_ref, lua_script, keep_images, template_styles)
+    logger.info("Converting %d section(s) of %s with %d worker(s)", len(sections), os.path.basename(docx_path), workers)
+
+    # Footnotes of the earlier sections, as counted in document.xml (checked against pandoc below)
+    placeholders = [sum(section["notes"] for section in sections[:index]) for index in range(len(sections))]
+    if not note_ref:
+        placeholders = [0] * len(sections)
+    marker = f"splitmarker{uuid.uuid4().hex}"
+
+    def converted(index):
+        return revisions.converted(index, placeholders[index]) if revisions else None
+
+    # Spawned, not forked: workers must not inherit the caller's tracemalloc tracing or threads
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    with tempfile.TemporaryDirectory(prefix="split_") as folder:
+        def build(index):
+            path = docx_path if len(sections) == 1 else write_sub_document(
+                docx_path, os.path.join(folder, f"section_{index}.docx"), plan, index, prefixes[index],
+                placeholders[index], note_ref, marker, media)
+            # In worker processes pandoc extracts each part's media to a folder of its own
+            workdir = os.path.join(folder, f"section_{index}") if executor else None
+            if workdir:
+                os.makedirs(workdir, exist_ok=True)
+            return {"index": index, "path": path, "lua_script": lua_script, "keep_images": keep_images,
+                    "marker": marker, "template_styles": template_styles, "workdir": workdir}
+
+        try:
+            results = [converted(index) for index in range(len(sections))]
+            dirty = [index for index, result in enumerate(results) if result is None]
+            for index, result in zip(dirty, map_parts(executor, convert_part, [build(index) for index in dirty])):
+                results[index] = result
+
+            # Footnotes pandoc dropped (or added) change the numbering of the sections after them
+            expected = 0
+            for index, (html, tables) in enumerate(results):
+                if index and placeholders[index] != expected:
+                    logger.warning("Section %d: %d footnote(s) before it, not %d, converting it again",
+                                   index, expected, placeholders[index])
+                    placeholders[index] = expected
+                    results[index] = converted(index) or map_parts(executor, convert_part, [build(index)])[0]
+                expected += results[index][0].count(FOOTNOTE_REF) - placeholders[index]
+            if revisions:
+                for index, result in enumerate(results):
+                    revisions.keep_converted(index, placeholders[index], result)
+
+            bodies, notes, frame = [], [], None
+            for index, (html, _) in enumerate(results):
+                body, items, footnotes_frame = split_footnotes(html, placeholders[index], index > 0)
+                bodies.append(body)
+                notes.extend(items)
+                frame = frame or footnotes_frame
+            if notes:
+                bodies.append(frame[0] + "".join(notes) + frame[1])
+
+            clean_keys = [revisions.clean_key(body, figures) for body in bodies] if revisions else None
+            cleaned = [revisions.cleaned(key) for key in clean_keys] if revisions else [None] * len(bodies)
+            dirty = [index for index, html in enumerate(cleaned) if html is None]
+            for index, html in zip(dirty, map_parts(executor, clean_part, [bodies[index] for index in dirty], [figures] * len(dirty))):
+                cleaned[index] = html
+            if revisions:
+                for key, html in zip(clean_keys, cleaned):
+                    revisions.keep_cleaned(key, html)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    # Tables are numbered in document order across the sections
+    tables = {}
+    for _, section_tables in results:
+        for table in section_tables.values():
+            tables[f"table_{len(tables)}"] = table
+    return tables, "".join(cleaned)
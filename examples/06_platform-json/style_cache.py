@@ -0,0 +1,166 @@
+"""
+Per-template style cache. Build or refresh the entries of a corpus from all of its documents:
+
+    python style_cache.py style_cache/ reports/*.docx
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from zipfile import ZipFile
+
+import docx_converter as dc
+from conversion_logging import configure_logging, get_logger
+from output_writer import atomic_write, dump_json
+
+logger = get_logger("styles")
+
+# Parts of a DOCX that define its template's look
+STYLES_PART = "word/styles.xml"
+THEME_PART_PATTERN = re.compile(r'^word/theme/[^/]+\.xml$')
+
+# Revision ids change every time a document is edited, not when its template does
+RSID_PATTERN = re.compile(rb'<w:rsid [^>]*/>|\sw:rsid\w*="[^"]*"')
+
+# Cache entries: <fingerprint>.json (computed), <fingerprint>.override.json (written by hand)
+CACHE_SUFFIX = ".json"
+OVERRIDE_SUFFIX = ".override.json"
+
+FINGERPRINT_LENGTH = 16
+
+# Version of the styles extract_template_styles / extract_corpus_styles compute, recorded in every
+# entry: bump it when their output changes, so the entries computed before are treated as stale
+STYLE_EXTRACTOR_VERSION = 2
+
+
+def template_fingerprint(docx_path):
+    """
+    Hash of the styles.xml and theme parts of a DOCX, without revision ids: the same for every
+    document built from one Word template, whatever their content.
+    """
+    digest = hashlib.sha256()
+    with ZipFile(docx_path) as docx_zip:
+        names = sorted(name for name in docx_zip.namelist() if name == STYLES_PART or THEME_PART_PATTERN.match(name))
+        for name in names:
+            digest.update(name.encode("utf-8") + b"\0")
+            digest.update(RSID_PATTERN.sub(b"", docx_zip.read(name)) + b"\0")
+    return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def merge_styles(base, override):
+    """Deep-merge an override into styles: {"th": {"color": "#fff"}} only replaces th.color."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_styles(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class StyleCache:
+    """
+    Styles computed once per Word template and reused for every document built from it:
+
+        cache = StyleCache("style_cache")
+        styles = cache.styles_for(docx_path)
+        cache.build(corpus_docx_paths)   # Or compute every template's entry from all of its documents
+
+    Entries live in <folder>/<fingerprint>.json. A <fingerprint>.override.json next to one is
+    merged over it (and over the result of any later recomputation), so hand-tuned values such
+    as the template's fonts survive; delete the computed entry to extract it again.
+
+    An entry computed by another STYLE_EXTRACTOR_VERSION is stale: one extracted from a single
+    document is extracted again, one built from a corpus is kept (with a warning) until build()
+    runs again, since one document's tables would replace the defaults of the whole corpus.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def entry_path(self, fingerprint):
+        return os.path.join(self.folder, f"{fingerprint}{CACHE_SUFFIX}")
+
+    def override_path(self, fingerprint):
+        return os.path.join(self.folder, f"{fingerprint}{OVERRIDE_SUFFIX}")
+
+    def save(self, fingerprint, entry):
+        # Atomic, so batch workers sharing the cache never read a partial entry
+        atomic_write(self.entry_path(fingerprint), dump_json({"fingerprint": fingerprint, **entry,
+                                                              "extractor": STYLE_EXTRACTOR_VERSION}))
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as error:
+            logger.warning("Ignoring unreadable style cache file %s: %s", path, error)
+            return None
+
+    def styles_for(self, docx_path, extract=dc.extract_template_styles, fingerprint_path=None):
+        """
+        Styles of the template of docx_path: the cached entry, or extract(docx_path) saved as a new
+        one, with the override file merged over it.
+
+        :param extract: Function computing the styles of a DOCX (only called on a cache miss).
+        :param fingerprint_path: DOCX to fingerprint when it differs from the one to extract from
+                                 (the original document rather than its compatibility copy).
+        """
+        fingerprint = template_fingerprint(fingerprint_path or docx_path)
+        entry = self._read(self.entry_path(fingerprint))
+        if entry is not None and entry.get("extractor") != STYLE_EXTRACTOR_VERSION:
+            if "documents" in entry:
+                logger.warning("Cached styles of template %s were built from %d document(s) by extractor version %s "
+                               "(current: %d), rebuild them with: python style_cache.py %s <documents>",
+                               fingerprint, entry["documents"], entry.get("extractor"), STYLE_EXTRACTOR_VERSION, self.folder)
+            else:
+                logger.info("Cached styles of template %s were computed by extractor version %s, extracting them again",
+                            fingerprint, entry.get("extractor"))
+                entry = None
+        if entry is None:
+            logger.info("No cached styles for template %s, extracting them from %s", fingerprint, os.path.basename(docx_path))
+            entry = {"source": os.path.basename(fingerprint_path or docx_path), "styles": extract(docx_path)}
+            self.save(fingerprint, entry)
+        else:
+            logger.debug("Reusing cached styles of template %s", fingerprint)
+
+        styles = entry["styles"]
+        override = self._read(self.override_path(fingerprint))
+        if override is not None:
+            logger.debug("Applying style override %s", self.override_path(fingerprint))
+            styles = merge_styles(styles, override)
+        return styles
+
+    def build(self, docx_paths, extract_corpus=dc.extract_corpus_styles):
+        """
+        (Re)compute the entry of every template of a corpus from all of its documents at once, so
+        the table defaults come from every table instead of the first document's.
+
+        :param extract_corpus: Function of a list of DOCX paths returning the entry ({"styles": ..., ...}).
+        :return: {fingerprint: number of documents}
+        """
+        templates = {}
+        for docx_path in docx_paths:
+            templates.setdefault(template_fingerprint(docx_path), []).append(docx_path)
+        for fingerprint, paths in templates.items():
+            logger.info("Template %s: extracting styles from %d document(s)", fingerprint, len(paths))
+            self.save(fingerprint, {"source": os.path.basename(paths[0]), **extract_corpus(paths)})
+        return {fingerprint: len(paths) for fingerprint, paths in templates.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cache", help="Style cache folder")
+    parser.add_argument("docx", nargs="+", help="Documents of the corpus")
+    args = parser.parse_args()
+
+    configure_logging()
+    for fingerprint, documents in StyleCache(args.cache).build(args.docx).items():
+        print(f"{fingerprint}: {documents} document(s)")
+
+
+if __name__ == "__main__":
+    main()
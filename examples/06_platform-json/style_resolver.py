@@ -0,0 +1,134 @@
+import xml.etree.ElementTree as ET
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+from conversion_logging import get_logger
+
+logger = get_logger("styles")
+
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+# <w:b w:val="0"/> switches a toggle property off; <w:b/> alone switches it on
+FALSE_VALUES = ("0", "false", "off")
+
+# rFonts w:asciiTheme values -> theme font scheme entry
+THEME_FONT_SLOTS = {"major": "majorFont", "minor": "minorFont"}
+
+
+def on_off(element):
+    return element.get(qn("w:val")) not in FALSE_VALUES
+
+
+def read_theme_fonts(theme_xml):
+    """{"major": typeface, "minor": typeface} of the latin fonts of a theme part."""
+    fonts = {}
+    root = ET.fromstring(theme_xml)
+    for slot, tag in THEME_FONT_SLOTS.items():
+        latin = root.find(f".//{{{A_NS}}}fontScheme/{{{A_NS}}}{tag}/{{{A_NS}}}latin")
+        if latin is not None and latin.get("typeface"):
+            fonts[slot] = latin.get("typeface")
+    return fonts
+
+
+def read_run_properties(rpr, theme_fonts):
+    """
+    The properties a <w:rPr> sets: bold, italic, vertAlign, color (None for "auto"), size (pt)
+    and font (theme fonts resolved to their typeface). Properties it doesn't set are left out.
+    """
+    properties = {}
+    if rpr is None:
+        return properties
+    for child in rpr:
+        if child.tag == qn("w:b"):
+            properties["bold"] = on_off(child)
+        elif child.tag == qn("w:i"):
+            properties["italic"] = on_off(child)
+        elif child.tag == qn("w:vertAlign"):
+            properties["vertAlign"] = child.get(qn("w:val"))
+        elif child.tag == qn("w:color"):
+            value = child.get(qn("w:val"))
+            properties["color"] = None if value in (None, "auto") else f"#{value}"
+        elif child.tag == qn("w:sz") and child.get(qn("w:val")):
+            properties["size"] = int(child.get(qn("w:val"))) / 2  # Half-points
+        elif child.tag == qn("w:rFonts"):
+            theme = child.get(qn("w:asciiTheme"))
+            font = theme_fonts.get("major" if theme.startswith("major") else "minor") if theme else child.get(qn("w:ascii"))
+            if font:
+                properties["font"] = font
+    return properties
+
+
+class StyleResolver:
+    """
+    Effective run properties of the styles of one DOCX, computed once per style id:
+
+        resolver = StyleResolver.from_document(doc)
+        resolver.style_properties("Heading2")      # docDefaults + the basedOn chain of Heading2
+        resolver.run_properties(run, paragraph)    # + the run's character style and direct formatting
+
+    A style's properties are those of its basedOn chain with its own <w:rPr> applied on top, so
+    every chain is walked once whatever the number of runs using it; runs then only add their
+    direct formatting. Theme fonts (asciiTheme) resolve to the typefaces of theme1.xml.
+    """
+
+    def __init__(self, styles_element, theme_fonts=None):
+        self.theme_fonts = theme_fonts or {}
+        self.styles = {style.get(qn("w:styleId")): style for style in styles_element.iterfind(qn("w:style"))}
+        self.default_paragraph_style = next((
+            style_id for style_id, style in self.styles.items()
+            if style.get(qn("w:type")) == "paragraph" and style.get(qn("w:default")) in ("1", "true", "on")
+        ), None)
+        self.defaults = read_run_properties(
+            styles_element.find(f"{qn('w:docDefaults')}/{qn('w:rPrDefault')}/{qn('w:rPr')}"), self.theme_fonts)
+        self._chains = {}   # style id -> properties of its basedOn chain (docDefaults excluded)
+        self._runs = {}     # (paragraph style id, character style id) -> effective properties
+
+    @classmethod
+    def from_document(cls, doc):
+        try:
+            theme_fonts = read_theme_fonts(doc.part.part_related_by(RT.THEME).blob)
+        except (KeyError, ET.ParseError) as error:
+            logger.debug("No readable theme part, theme fonts are not resolved: %s", error)
+            theme_fonts = {}
+        return cls(doc.styles.element, theme_fonts)
+
+    def chain_properties(self, style_id):
+        """Properties set by a style and the styles it is based on, without the document defaults."""
+        if style_id in self._chains:
+            return self._chains[style_id]
+        properties = {}
+        chain, current = [], style_id
+        while current in self.styles and self.styles[current] not in chain:  # basedOn loops are invalid but not unheard of
+            chain.append(self.styles[current])
+            based_on = self.styles[current].find(qn("w:basedOn"))
+            current = based_on.get(qn("w:val")) if based_on is not None else None
+        for style in reversed(chain):
+            properties.update(read_run_properties(style.find(qn("w:rPr")), self.theme_fonts))
+        self._chains[style_id] = properties
+        return properties
+
+    def style_properties(self, style_id=None):
+        """Effective properties of a paragraph style (the default paragraph style when None or undefined)."""
+        return {**self.defaults, **self.chain_properties(style_id if style_id in self.styles else self.default_paragraph_style)}
+
+    def paragraph_style_id(self, paragraph):
+        """The paragraph's style id; as in Word, the default paragraph style when it has none or one styles.xml doesn't define."""
+        p_style = paragraph._p.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+        style_id = p_style.get(qn("w:val")) if p_style is not None else None
+        if style_id not in self.styles:
+            if style_id is not None:
+                logger.debug("Paragraph style %s is not defined, using the default paragraph style", style_id)
+            style_id = self.default_paragraph_style
+        return style_id
+
+    def run_properties(self, run, paragraph):
+        """Effective properties of a run: docDefaults, paragraph style, character style, then its own formatting."""
+        r_pr = run._r.rPr
+        r_style = r_pr.find(qn("w:rStyle")) if r_pr is not None else None
+        key = (self.paragraph_style_id(paragraph), r_style.get(qn("w:val")) if r_style is not None else None)
+        styled = self._runs.get(key)
+        if styled is None:
+            styled = self._runs[key] = {**self.style_properties(key[0]), **(self.chain_properties(key[1]) if key[1] else {})}
+        direct = read_run_properties(r_pr, self.theme_fonts)
+        return {**styled, **direct} if direct else styled
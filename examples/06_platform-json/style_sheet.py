@@ -0,0 +1,156 @@
+import re
+
+# Stylesheet generated for each document, relative to the content folder
+STYLESHEET_FILE = "document.css"
+
+# Cell properties that end up in a class instead of on every cell of tables.json
+CELL_STYLE_KEYS = ("backgroundColor", "color", "fontSize", "fontWeight", "textAlign", "verticalAlign", "padding")
+TEXT_PART_STYLE_KEYS = ("color", "fontSize")
+
+# styles.json sections applied to every matching element by applyStyles() in contentLoader.js
+TAG_STYLE_SECTIONS = ("headings", "body")
+
+CLASS_NAME_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def css_name(key):
+    """fontSize -> font-size"""
+    return re.sub(r'([A-Z])', lambda m: '-' + m.group(1).lower(), key)
+
+
+def css_declarations(properties):
+    """Render {"fontSize": "1rem", ...} as 'font-size: 1rem; ...'."""
+    return " ".join(f"{css_name(key)}: {value};" for key, value in properties.items())
+
+
+def short_class_name(index, prefix="s"):
+    """0 -> s0, 35 -> sz, 36 -> s10, ..."""
+    digits = ""
+    while True:
+        index, remainder = divmod(index, len(CLASS_NAME_DIGITS))
+        digits = CLASS_NAME_DIGITS[remainder] + digits
+        if not index:
+            return prefix + digits
+
+
+class StyleSheet:
+    """
+    Interns style dictionaries into short class names. Every distinct combination of
+    properties gets one class, however many cells use it:
+
+        sheet = StyleSheet()
+        sheet.intern({"fontSize": "0.92rem", "textAlign": "left"})  # -> "s0"
+        sheet.intern({"textAlign": "left", "fontSize": "0.92rem"})  # -> "s0" again
+        sheet.render_css()
+    """
+
+    def __init__(self, prefix="s"):
+        self.prefix = prefix
+        self.classes = {}     # (sorted property items) -> class name
+        self.tag_rules = {}   # selector -> properties
+
+    def intern(self, properties):
+        """Return the class name for these properties (None when there is nothing to style)."""
+        properties = {key: value for key, value in properties.items() if value not in (None, "")}
+        if not properties:
+            return None
+        key = tuple(sorted(properties.items()))
+        name = self.classes.get(key)
+        if name is None:
+            name = short_class_name(len(self.classes), self.prefix)
+            self.classes[key] = name
+        return name
+
+    def add_tag_styles(self, styles, scope="#content"):
+        """Turn the headings/body sections of styles.json into one rule per tag (h1, p, ...)."""
+        for section in TAG_STYLE_SECTIONS:
+            for tag, properties in (styles.get(section) or {}).items():
+                if properties:
+                    self.tag_rules[f"{scope} {tag}"] = properties
+
+    def render_css(self):
+        lines = [f"{selector} {{ {css_declarations(properties)} }}" for selector, properties in self.tag_rules.items()]
+        lines += [f".{name} {{ {css_declarations(dict(key))} }}" for key, name in self.classes.items()]
+        return "\n".join(lines) + "\n"
+
+
+def table_properties(table_style):
+    """Same properties and fallbacks as the <table> element in generateTable()."""
+    return {
+        "border": table_style.get("border") or "1px solid black",
+        "width": table_style.get("width") or "auto",
+        "borderCollapse": table_style.get("borderCollapse") or "collapse",
+        "marginBottom": table_style.get("marginBottom") or "10px",
+    }
+
+
+def cell_properties(cell, default_style):
+    """Same properties and fallbacks as the <th>/<td> elements in generateTable()."""
+    return {
+        "backgroundColor": cell.get("backgroundColor") or default_style.get("backgroundColor") or "transparent",
+        "color": cell.get("color") or default_style.get("color") or "black",
+        "fontSize": cell.get("fontSize") or default_style.get("fontSize") or "1rem",
+        "fontWeight": cell.get("fontWeight") or default_style.get("fontWeight") or "normal",
+        "textAlign": cell.get("textAlign") or default_style.get("textAlign") or "left",
+        "verticalAlign": cell.get("verticalAlign") or default_style.get("verticalAlign") or "middle",
+        "padding": cell.get("padding") or default_style.get("padding") or "5px",
+    }
+
+
+def table_default_styles(table_data, styles):
+    """(table, th, td1, td) styles of one table: styles.json defaults plus the table's own overrides."""
+    return (
+        {**styles.get("table", {}), **table_data.get("styles", {})},
+        {**styles.get("th", {}), **table_data.get("th", {})},
+        {**styles.get("td1", {}), **table_data.get("td1", {})},
+        {**styles.get("td", {}), **table_data.get("td", {})},
+    )
+
+
+def class_cell(cell, default_style, default_class, sheet):
+    """
+    Replace the style keys of a cell (and of its text parts) with a className. Cells styled
+    like their column default get no className and use the table's cellClassNames instead.
+    """
+    classed = {key: value for key, value in cell.items() if key not in CELL_STYLE_KEYS}
+    class_name = sheet.intern(cell_properties(cell, default_style))
+    if class_name != default_class:
+        classed["className"] = class_name
+    if "textParts" in cell:
+        classed["textParts"] = []
+        for part in cell["textParts"]:
+            classed_part = {key: value for key, value in part.items() if key not in TEXT_PART_STYLE_KEYS}
+            class_name = sheet.intern({key: part.get(key) for key in TEXT_PART_STYLE_KEYS})
+            if class_name:
+                classed_part["className"] = class_name
+            classed["textParts"].append(classed_part)
+    return classed
+
+
+def class_tables(tables, styles, sheet):
+    """
+    Return a copy of extract_table_format() output where tables, cells and text parts refer to
+    interned classes instead of repeating their style properties. Each table gets a className
+    and the default cellClassNames of its th, td1 (first column) and td cells.
+    """
+    classed_tables = {}
+    for table_id, table_data in tables.items():
+        table_style, th_style, td1_style, td_style = table_default_styles(table_data, styles)
+        defaults = {
+            "th": sheet.intern(cell_properties({}, th_style)),
+            "td1": sheet.intern(cell_properties({}, td1_style)),
+            "td": sheet.intern(cell_properties({}, td_style)),
+        }
+        classed_tables[table_id] = {
+            "className": sheet.intern(table_properties(table_style)),
+            "cellClassNames": defaults,
+            "headers": [class_cell(header, th_style, defaults["th"], sheet) for header in table_data.get("headers", [])],
+            "rows": [
+                [
+                    class_cell(cell, td1_style, defaults["td1"], sheet) if col_idx == 0 else class_cell(cell, td_style, defaults["td"], sheet)
+                    for col_idx, cell in enumerate(row)
+                ]
+                for row in table_data.get("rows", [])
+            ],
+        }
+    return classed_tables
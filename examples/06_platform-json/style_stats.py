@@ -0,0 +1,79 @@
+from collections import Counter
+
+# th: first row, td1: first column, td: every other cell (same split as extract_table_format)
+CELL_ROLES = ("th", "td1", "td")
+
+
+class TableStyleStats:
+    """
+    Streaming frequency counts of cell style values, per cell role and property:
+
+        stats = TableStyleStats()
+        stats.add_cell("td", {"textAlign": "left", "fontWeight": None, ...})   # for every cell of every table
+        stats.modal_styles(fallback=GLOBAL_DEFAULT_STYLES)                     # {"th": {...}, "td1": {...}, "td": {...}}
+        stats.histograms()                                                     # {"td": {"textAlign": [["left", 812], ...]}}
+
+    Only one counter per (role, property) is kept, so memory is bounded by the number of
+    distinct values, not by the number of cells. Stats of several documents can be merged.
+
+    extract_table_format only writes a property on a cell when it differs from the default, so the
+    most frequent value of each property is the default that leaves the fewest per-cell overrides.
+    """
+
+    def __init__(self):
+        self.counts = {role: {} for role in CELL_ROLES}   # role -> property -> Counter(value)
+        self.cells = Counter()                            # role -> number of cells seen
+        self.tables = 0
+
+    def add_cell(self, role, style):
+        self.cells[role] += 1
+        properties = self.counts[role]
+        for key, value in style.items():
+            properties.setdefault(key, Counter())[value] += 1
+
+    def add_cells(self, cells):
+        """Consume an iterable of (role, style), e.g. dc.table_cell_styles(doc)."""
+        for role, style in cells:
+            self.add_cell(role, style)
+
+    def merge(self, other):
+        for role, properties in other.counts.items():
+            for key, counter in properties.items():
+                self.counts[role].setdefault(key, Counter()).update(counter)
+        self.cells.update(other.cells)
+        self.tables += other.tables
+        return self
+
+    def modal_styles(self, fallback=None):
+        """
+        The most frequent value of every property, per role. A property whose most frequent value
+        is None (not set on most cells) is left out. Ties go to the fallback value, then to the value
+        seen first; properties never seen take the fallback value.
+        """
+        fallback = fallback or {}
+        modal = {}
+        for role in CELL_ROLES:
+            properties = self.counts[role]
+            role_styles = {}
+            for key in sorted(set(properties) | set(fallback)):
+                counter = properties.get(key)
+                if not counter:
+                    value = fallback.get(key)
+                else:
+                    top = max(counter.values())
+                    tied = [value for value, count in counter.items() if count == top]
+                    value = fallback.get(key) if fallback.get(key) in tied else tied[0]
+                if value is not None:
+                    role_styles[key] = value
+            modal[role] = role_styles
+        return modal
+
+    def histograms(self):
+        """{role: {property: [[value, count], ...]}}, most frequent first (JSON friendly, None stays null)."""
+        return {
+            role: {key: [[value, count] for value, count in counter.most_common()] for key, counter in sorted(properties.items())}
+            for role, properties in self.counts.items()
+        }
+
+    def summary(self):
+        return {"tables": self.tables, "cells": dict(self.cells)}
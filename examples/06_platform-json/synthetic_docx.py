@@ -0,0 +1,214 @@
+import io
+import os
+import random
+import struct
+import zlib
+
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Inches, Pt, RGBColor
+
+# Counts for a "scale 1" document. generate_corpus() multiplies these for bigger documents.
+DEFAULT_SPEC = {
+    "headings": 6,          # Every third heading is an H1, the rest are H2
+    "paragraphs": 30,
+    "tables": 3,
+    "table_rows": 6,
+    "table_cols": 4,
+    "merged_cells": True,   # Add a horizontal and a vertical merge to every table
+    "kept_images": 2,       # Alt text "keep-image-..." -> kept by the pipeline
+    "dropped_images": 2,    # Any other alt text -> removed by the Lua filter
+    "captions": True,       # SEQ Figure / SEQ Table captions for images and tables
+    "footnotes": 4,
+}
+
+# The Lua filter drops the first 5 blocks of every document (the title page)
+TITLE_PAGE_BLOCKS = 5
+
+WORDS = (
+    "carbon project area soil baseline emissions vegetation monitoring rainfall survey "
+    "estimate method sample period report forest grazing native land region model"
+).split()
+
+
+def make_png(width, height, color):
+    """Build a small solid-colour PNG without any imaging library."""
+    row = b"\x00" + bytes(color) * width
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b"")
+
+
+def spread(total, buckets):
+    """Split total into buckets counts as evenly as possible, e.g. spread(5, 3) -> [2, 2, 1]."""
+    if buckets <= 0:
+        return []
+    return [total // buckets + (1 if i < total % buckets else 0) for i in range(buckets)]
+
+
+def add_caption(doc, label, number, text):
+    """Add a Word caption paragraph: '<label> {SEQ <label>} <text>'."""
+    para = doc.add_paragraph(style="Caption")
+    para.add_run(f"{label} ")
+    para._p.append(parse_xml(
+        f'<w:fldSimple {nsdecls("w")} w:instr=" SEQ {label} \\* ARABIC ">'
+        f'<w:r><w:t>{number}</w:t></w:r></w:fldSimple>'
+    ))
+    para.add_run(f" {text}")
+    return para
+
+
+def add_picture(doc, png_bytes, alt_text):
+    doc.add_picture(io.BytesIO(png_bytes), width=Inches(1))
+    para = doc.paragraphs[-1]
+    para._p.xpath(".//wp:docPr")[0].set("descr", alt_text)
+    return para
+
+
+def add_footnote_reference(para, footnote_id):
+    para._p.append(parse_xml(
+        f'<w:r {nsdecls("w")}><w:rPr><w:vertAlign w:val="superscript"/></w:rPr>'
+        f'<w:footnoteReference w:id="{footnote_id}"/></w:r>'
+    ))
+
+
+def attach_footnotes(doc, footnotes):
+    """Add a word/footnotes.xml part holding the given footnote texts (ids start at 1)."""
+    body = "".join(
+        f'<w:footnote w:id="{i}"><w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:footnote>'
+        for i, text in enumerate(footnotes, start=1)
+    )
+    xml = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:footnotes {nsdecls("w")}>'
+        '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+        '<w:footnote w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/></w:r></w:p></w:footnote>'
+        f'{body}</w:footnotes>'
+    )
+    part = Part(PackURI("/word/footnotes.xml"), CT.WML_FOOTNOTES, xml.encode("utf-8"), doc.part.package)
+    doc.part.relate_to(part, RT.FOOTNOTES)
+
+
+def add_table(doc, rng, rows, cols, merged_cells):
+    table = doc.add_table(rows=rows, cols=cols)
+    table.style = doc.styles["Table Grid"]
+    for r in range(rows):
+        for c in range(cols):
+            para = table.cell(r, c).paragraphs[0]
+            if r == 0:
+                para.add_run(f"Header {c + 1}").bold = True
+                continue
+            para.add_run(f"{rng.choice(WORDS)} {r}.{c}")
+            if (r + c) % 3 == 0:
+                # Mixed formatting inside one cell
+                para.add_run(f" {rng.choice(WORDS)}").bold = True
+            if (r * c) % 5 == 1:
+                para.runs[0].font.color.rgb = RGBColor(0xC0, 0x00, 0x00)
+                para.runs[0].font.size = Pt(9)
+            if c == cols - 1 and r % 2 == 0:
+                shading = parse_xml(f'<w:shd {nsdecls("w")} w:val="clear" w:color="auto" w:fill="D9E2F3"/>')
+                table.cell(r, c)._tc.get_or_add_tcPr().append(shading)
+
+    if merged_cells and rows >= 4 and cols >= 3:
+        table.cell(1, 0).merge(table.cell(1, 1))                # Horizontal merge (gridSpan)
+        table.cell(2, cols - 1).merge(table.cell(3, cols - 1))  # Vertical merge (vMerge)
+    return table
+
+
+def sentence(rng, length=12):
+    words = [rng.choice(WORDS) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def generate_docx(path, headings=6, paragraphs=30, tables=3, table_rows=6, table_cols=4, merged_cells=True,
+                  kept_images=2, dropped_images=2, captions=True, footnotes=4, seed=0):
+    """
+    Write a synthetic report-like DOCX with the given element counts and return its path.
+
+    The document starts with a title page (removed by the Lua filter), then headings with the
+    paragraphs, tables, images and footnotes spread evenly between them. Figure and table
+    captions use Word SEQ fields, kept images use the "keep-image-" alt text prefix and some
+    paragraphs refer to figures by number, so every pass of the pipeline has work to do.
+    The same arguments always produce the same document.
+    """
+    rng = random.Random(seed)
+    doc = Document()
+
+    for i in range(TITLE_PAGE_BLOCKS):
+        doc.add_paragraph(f"Synthetic report title block {i + 1}")
+
+    headings = max(headings, 1)
+    images = ["keep"] * kept_images + ["drop"] * dropped_images
+    rng.shuffle(images)
+
+    paragraph_counts = spread(paragraphs, headings)
+    table_counts = spread(tables, headings)
+    image_counts = spread(len(images), headings)
+    footnote_counts = spread(footnotes, max(paragraphs, 1))
+
+    footnote_texts = []
+    figure_number = 0
+    table_number = 0
+    image_index = 0
+    paragraph_index = 0
+
+    for h in range(headings):
+        level = 1 if h % 3 == 0 else 2
+        doc.add_heading(f"{'Section' if level == 1 else 'Subsection'} {h + 1} {rng.choice(WORDS)}", level)
+
+        for _ in range(paragraph_counts[h]):
+            text = sentence(rng)
+            if figure_number and paragraph_index % 4 == 0:
+                text += f" See Figure {rng.randint(1, figure_number)} for details."
+            para = doc.add_paragraph(text)
+            for _ in range(footnote_counts[paragraph_index] if paragraph_index < len(footnote_counts) else 0):
+                footnote_texts.append(f"Footnote {len(footnote_texts) + 1}: {sentence(rng, 6)}")
+                add_footnote_reference(para, len(footnote_texts))
+            paragraph_index += 1
+
+        for _ in range(image_counts[h]):
+            kind = images[image_index]
+            image_index += 1
+            figure_number += 1
+            png = make_png(24 + image_index, 16, (image_index * 37 % 256, image_index * 91 % 256, 120))
+            alt_text = f"keep-image-figure{figure_number}" if kind == "keep" else f"decorative image {figure_number}"
+            add_picture(doc, png, alt_text)
+            if captions:
+                add_caption(doc, "Figure", figure_number, f"{sentence(rng, 5)[:-1]}")
+
+        for _ in range(table_counts[h]):
+            table_number += 1
+            if captions:
+                add_caption(doc, "Table", table_number, f"{sentence(rng, 4)[:-1]}")
+            add_table(doc, rng, table_rows, table_cols, merged_cells)
+            doc.add_paragraph(sentence(rng, 8))
+
+    if footnote_texts:
+        attach_footnotes(doc, footnote_texts)
+
+    doc.save(path)
+    return path
+
+
+def scaled_spec(scale, base=None):
+    """Multiply every count of a spec by scale (table shape and flags are kept)."""
+    spec = dict(base or DEFAULT_SPEC)
+    for key in ("headings", "paragraphs", "tables", "kept_images", "dropped_images", "footnotes"):
+        spec[key] = max(1, int(round(spec[key] * scale))) if spec[key] else 0
+    return spec
+
+
+def generate_corpus(folder, scales=(1, 2, 4, 8), base=None, seed=0):
+    """Generate one document per scale into folder. Returns {scale: (path, spec)}."""
+    os.makedirs(folder, exist_ok=True)
+    corpus = {}
+    for scale in scales:
+        spec = scaled_spec(scale, base)
+        path = os.path.join(folder, f"synthetic_x{scale}.docx")
+        generate_docx(path, seed=seed, **spec)
+        corpus[scale] = (path, spec)
+    return corpus
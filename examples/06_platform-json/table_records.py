@@ -0,0 +1,115 @@
+"""
+Compact records of the table cells read by dc.extract_table_records(). Every run segment is a
+slotted TextRun holding its text and an interned style tuple, and cells are slotted CellRecords,
+so a 100k-cell document doesn't allocate a dictionary per segment. The tables.json dictionaries
+are only built by serialize_tables(), when the tables are written.
+"""
+# Style tuple of a run: (bold, italic, superscript, subscript, color, fontSize), in the order the
+# keys are written to tables.json. color and fontSize are None when the run doesn't set them or
+# sets the cell's default value.
+RUN_STYLE_KEYS = ("bold", "italic", "superscript", "subscript", "color", "fontSize")
+PLAIN_STYLE = (False, False, False, False, None, None)
+
+# Paragraphs and lines of a cell whose text is stored whole are joined with a literal <br>
+BR_TAG = "<br>"
+
+# Shading fill of cells without a background (dropped like the other '#auto' values)
+AUTO_COLOR = "#auto"
+
+
+class TextRun:
+    """One run segment of a cell. style is None for the line break between paragraphs or lines."""
+
+    __slots__ = ("text", "style")
+
+    def __init__(self, text, style):
+        self.text = text
+        self.style = style
+
+
+# Shared by every cell: a line break has no text or style of its own
+LINE_BREAK = TextRun("\n", None)
+
+
+class CellRecord:
+    __slots__ = ("runs", "col_span", "row_span", "text_align", "vertical_align", "background_color", "icon_html", "icon_position")
+
+    def __init__(self, runs, col_span=None, row_span=None, text_align=None, vertical_align=None, background_color=None,
+                 icon_html=None, icon_position=None):
+        self.runs = runs
+        self.col_span = col_span
+        self.row_span = row_span
+        self.text_align = text_align
+        self.vertical_align = vertical_align
+        self.background_color = background_color
+        self.icon_html = icon_html
+        self.icon_position = icon_position
+
+
+class TableRecord:
+    __slots__ = ("headers", "rows")
+
+    def __init__(self):
+        self.headers = []
+        self.rows = []
+
+
+class StyleInterner:
+    """Returns one shared tuple per distinct run style, however many runs use it."""
+
+    def __init__(self):
+        self.styles = {PLAIN_STYLE: PLAIN_STYLE}
+
+    def __call__(self, style):
+        return self.styles.setdefault(style, style)
+
+
+def run_format(style):
+    """The formatting keys of a run style that are set (and differ from the cell default)."""
+    return {key: value for key, value in zip(RUN_STYLE_KEYS, style) if value}
+
+
+def serialize_cell(cell):
+    """The tables.json dictionary of a cell."""
+    runs = cell.runs
+    if not runs:
+        data = {"text": ""}
+    else:
+        first_style = next((run.style for run in runs if run.style is not None), PLAIN_STYLE)
+        formatted = any(run.style is not None and run.style != PLAIN_STYLE for run in runs)
+        if not formatted or all(run.style is None or run.style == first_style for run in runs):
+            # Merge the text, preserving line breaks, and apply the shared formatting at the top level
+            data = {"text": "".join(BR_TAG if run.style is None else run.text for run in runs)}
+            if formatted:
+                data.update(run_format(first_style))
+        else:
+            data = {"textParts": [
+                {"text": "\n", "newline": True} if run.style is None else {"text": run.text, **run_format(run.style)}
+                for run in runs
+            ]}
+
+    if cell.col_span:
+        data["colSpan"] = cell.col_span
+    if cell.row_span:
+        data["rowSpan"] = cell.row_span
+    if cell.text_align is not None:
+        data["textAlign"] = cell.text_align
+    if cell.vertical_align is not None:
+        data["verticalAlign"] = cell.vertical_align
+    if cell.background_color not in (None, AUTO_COLOR):
+        data["backgroundColor"] = cell.background_color
+    if cell.icon_html is not None:
+        data["iconHtml"] = cell.icon_html
+        data["iconPosition"] = cell.icon_position
+    return data
+
+
+def serialize_tables(tables):
+    """{table_id: TableRecord} -> the tables.json dictionary."""
+    return {
+        table_id: {
+            "headers": [serialize_cell(cell) for cell in table.headers],
+            "rows": [[serialize_cell(cell) for cell in row] for row in table.rows],
+        }
+        for table_id, table in tables.items()
+    }
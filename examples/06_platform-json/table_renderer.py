@@ -0,0 +1,136 @@
+import html
+import re
+
+from conversion_logging import get_logger
+from style_sheet import cell_properties, css_declarations, table_default_styles, table_properties
+from table_records import BR_TAG
+
+logger = get_logger("tables")
+
+# File holding the pre-rendered tables, relative to the content folder
+TABLES_HTML_FILE = "tables.html"
+
+# <div class="table" id="table_N" data-caption="..."> placeholders written by dc.table_replacer
+TABLE_PLACEHOLDER_PATTERN = re.compile(r'<div class="table" id="(table_\d+)"(?: data-caption="([^"]*)")?>')
+
+
+def escape_text(text):
+    """Escape cell text for HTML while keeping the <br> line breaks added by extract_table_format."""
+    return BR_TAG.join(html.escape(segment, quote=False) for segment in text.split(BR_TAG)).replace("\n", BR_TAG)
+
+
+def style_reference(element, properties, default_class=None):
+    """class="..." for elements interned into the document stylesheet, inline style="..." otherwise."""
+    class_name = element.get("className") or default_class
+    if class_name:
+        return f'class="{class_name}"'
+    return f'style="{css_declarations(properties)}"'
+
+
+def render_text_part(part):
+    if part.get("newline"):
+        return BR_TAG
+    text = escape_text(part.get("text", ""))
+    if part.get("bold"):
+        text = f"<b>{text}</b>"
+    if part.get("superscript"):
+        text = f"<sup>{text}</sup>"
+    if part.get("subscript"):
+        text = f"<sub>{text}</sub>"
+    if part.get("italic"):
+        text = f"<i>{text}</i>"
+    if part.get("underline"):
+        text = f"<u>{text}</u>"
+    if part.get("strikethrough"):
+        text = f"<del>{text}</del>"
+    span_style = {key: part[key] for key in ("color", "fontSize") if part.get(key)}
+    if part.get("className"):
+        text = f'<span class="{part["className"]}">{text}</span>'
+    elif span_style:
+        text = f'<span style="{css_declarations(span_style)}">{text}</span>'
+    return text
+
+
+def render_cell(tag, cell, default_style, default_class=None):
+    """Render one <th>/<td> from an extract_table_format cell dictionary."""
+    if cell.get("textParts"):
+        content = "".join(render_text_part(part) for part in cell["textParts"])
+    else:
+        # Formatting shared by the whole cell is stored at the top level of the cell
+        content = render_text_part({**cell, "color": None, "fontSize": None, "className": None})
+
+    if cell.get("iconHtml"):
+        # iconHtml is built by extract_table_format from the icon alt text (trusted markup)
+        content = cell["iconHtml"] + content if cell.get("iconPosition", "start") == "start" else content + cell["iconHtml"]
+
+    spans = "".join(f' {name}="{int(cell[key])}"' for key, name in (("colSpan", "colspan"), ("rowSpan", "rowspan")) if cell.get(key))
+    return f'<{tag}{spans} {style_reference(cell, cell_properties(cell, default_style), default_class)}>{content}</{tag}>'
+
+
+def render_table_html(table_data, styles, caption=""):
+    """
+    Render one table of extract_table_format() as static HTML, with the same markup and
+    inline styles that generateTable() in tableGenerator.js builds in the browser. Tables
+    passed through style_sheet.class_tables() are rendered with class attributes instead.
+
+    :param table_data: {"headers": [cell, ...], "rows": [[cell, ...], ...]} for one table.
+    :param styles: The styles.json dictionary (table, th, td1 and td defaults).
+    :param caption: Caption HTML from the table placeholder (already escaped by pandoc).
+    """
+    table_style, th_style, td1_style, td_style = table_default_styles(table_data, styles)
+    cell_classes = table_data.get("cellClassNames", {})
+
+    parts = [f'<table {style_reference(table_data, table_properties(table_style))}>']
+
+    if caption:
+        parts.append(f'<caption class="table-caption">{caption}</caption>')
+
+    if table_data.get("headers"):
+        parts.append("<thead><tr>")
+        parts.extend(render_cell("th", header, th_style, cell_classes.get("th")) for header in table_data["headers"])
+        parts.append("</tr></thead>")
+
+    parts.append("<tbody>")
+    for row in table_data.get("rows", []):
+        parts.append("<tr>")
+        parts.extend(
+            render_cell("td", cell, td1_style, cell_classes.get("td1")) if col_idx == 0 else render_cell("td", cell, td_style, cell_classes.get("td"))
+            for col_idx, cell in enumerate(row)
+        )
+        parts.append("</tr>")
+    parts.append("</tbody></table>")
+    return "".join(parts)
+
+
+def table_captions(html_content):
+    """Return {table_id: caption_html} for every table placeholder in content.html."""
+    return {
+        table_id: html.unescape(caption or "")
+        for table_id, caption in TABLE_PLACEHOLDER_PATTERN.findall(html_content)
+    }
+
+
+def render_table_fragments(tables, styles, html_content):
+    """{table_id: table HTML} for every table placeholder of content.html, in document order."""
+    fragments = {}
+    for table_id, caption in table_captions(html_content).items():
+        table_data = tables.get(table_id)
+        if table_data is None:
+            logger.warning("Table %s has a placeholder in content.html but no data in tables.json", table_id)
+            continue
+        fragments[table_id] = render_table_html(table_data, styles, caption)
+    return fragments
+
+
+def render_tables_html(tables, styles, html_content, fragments=None):
+    """
+    Pre-render every table placeholder of content.html as one <template data-table="table_N">
+    per table. The front-end moves each template's table into its placeholder instead of
+    generating the markup on every page view.
+
+    :param fragments: The render_table_fragments() result, when it was already computed.
+    """
+    if fragments is None:
+        fragments = render_table_fragments(tables, styles, html_content)
+    templates = [f'<template data-table="{table_id}">{table_html}</template>' for table_id, table_html in fragments.items()]
+    return "\n".join(templates) + "\n"
@@ -0,0 +1,58 @@
+import json
+
+from table_renderer import table_captions
+
+# One file per table in data/tables/, plus the index the viewer reads first
+TABLES_FOLDER = "tables"
+TABLE_INDEX_FILE = "index.json"
+
+
+def compact_json(data) -> bytes:
+    """JSON without indentation or spaces: shards are only read by the viewer."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def table_size(table_data):
+    """(rows, columns) of an extract_table_format table, header row included and column spans counted."""
+    rows = ([table_data["headers"]] if table_data.get("headers") else []) + table_data.get("rows", [])
+    columns = max((sum(cell.get("colSpan") or 1 for cell in row) for row in rows), default=0)
+    return len(rows), columns
+
+
+def write_table_shards(writer, tables, html_content, data_folder, fragments=None):
+    """
+    Write every table of tables.json to <data_folder>/tables/<table_id>.json and return the index
+    written next to them:
+
+        {"tables": [{"id": "table_0", "caption": "Table 1: ...", "rows": 12, "columns": 4,
+                     "file": "data/tables/table_0.json", "size": 5321,
+                     "html": "data/tables/table_0.html", "htmlSize": 7480}, ...]}
+
+    Tables are listed in document order (the order of their placeholders in content.html), so the
+    viewer can fetch each one when its placeholder scrolls into view instead of loading them all.
+
+    :param fragments: {table_id: pre-rendered table HTML}, written as <table_id>.html next to the JSON.
+    """
+    folder = f"{data_folder}/{TABLES_FOLDER}"
+    captions = table_captions(html_content)
+    index = []
+    for table_id in list(captions) + [table_id for table_id in tables if table_id not in captions]:
+        table_data = tables.get(table_id)
+        if table_data is None:
+            continue
+        rows, columns = table_size(table_data)
+        entry = {"id": table_id, "caption": captions.get(table_id, ""), "rows": rows, "columns": columns}
+
+        shard = compact_json(table_data)
+        entry["file"] = f"{folder}/{table_id}.json"
+        entry["size"] = len(shard)
+        writer.write_bytes(entry["file"], shard)
+
+        if fragments and table_id in fragments:
+            fragment = fragments[table_id].encode("utf-8")
+            entry["html"] = f"{folder}/{table_id}.html"
+            entry["htmlSize"] = len(fragment)
+            writer.write_bytes(entry["html"], fragment)
+        index.append(entry)
+
+    return {"tables": index}
@@ -0,0 +1,550 @@
+"""
+Batch conversion of many DOCX files by any number of hosts sharing a folder (e.g. on NFS), with
+no broker: jobs are files, and a worker owns a job while it holds the job's lease file.
+
+    python work_queue.py enqueue queue/ reports/*.docx --style-cache style_cache/
+    python work_queue.py work queue/ app/            # On every conversion host, as many as wanted
+    python work_queue.py status queue/               # Refresh and print queue/status.json
+    python work_queue.py local app/ reports/*.docx --workers 4   # Several local processes, temp queue
+
+Layout of the queue folder:
+
+    pending/<job>.json    job to convert: {"docx", "name", "options", "attempts", "errors"}
+    leases/<job>.lock     held by the worker converting the job, touched every heartbeat
+    done/<job>.json       result of a converted job (outputs published under app/<name>/)
+    failed/<job>.json     job given up after max_attempts failures or lost workers
+    status.json           counts, running jobs with their worker and heartbeat age, failures
+
+A lease is taken by hard-linking a file holding the worker's token to leases/<job>.lock, which
+is atomic on NFS (unlike O_EXCL on old clients). A lease whose file was not touched for
+lease_timeout seconds belongs to a dead worker: it is renamed away (only one worker wins the
+rename) and the job is taken again, counting as a failed attempt. Lease ages are measured with
+the file server's clock, so hosts don't need synchronised clocks.
+
+A job is converted into app/.staging/<job>.<token>/<name>/ (starting from hard links to the
+published files, so unchanged outputs are still detected) and renamed over app/<name>/ only if
+the worker still holds the lease: a worker whose lease was taken over never publishes. The old
+output is renamed aside first, so app/<name>/ is briefly missing while it is replaced (readers
+get a 404 in between); it is renamed back if the new one can't be moved in. In "bundle" asset
+mode the shared app/_assets bundle is built by one worker at a time, once per worker, under a
+lock in leases/.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+import pipeline
+from asset_bundle import ASSET_BUNDLE_FOLDER
+from conversion_logging import configure_logging, get_logger
+from output_writer import atomic_write, dump_json
+
+logger = get_logger("queue")
+
+PENDING_FOLDER = "pending"
+LEASES_FOLDER = "leases"
+DONE_FOLDER = "done"
+FAILED_FOLDER = "failed"
+CLOCK_FOLDER = ".clock"
+STATUS_FILE = "status.json"
+STAGING_FOLDER = ".staging"   # Under the app folder, so staged outputs are renamed into place on the same file system
+
+LEASE_SUFFIX = ".lock"
+BUNDLE_LOCK = "_asset_bundle"
+BUNDLE_LOCK_SUFFIX = ".bundle"   # Not a job lease: left out of the status
+JOB_SUFFIX = ".json"
+
+DEFAULT_LEASE_TIMEOUT = 300      # Seconds without heartbeat before a lease is considered stale
+DEFAULT_HEARTBEAT = 30           # Seconds between heartbeats (well under the lease timeout)
+DEFAULT_MAX_ATTEMPTS = 3         # Failures (or lost workers) before a job moves to failed/
+DEFAULT_POLL_INTERVAL = 10       # Seconds between looks at jobs leased by other workers
+BUNDLE_LOCK_POLL = 1             # Seconds between attempts at the bundle lock
+
+# Only the last lines of a traceback go into the job and the status file
+TRACEBACK_LINES = 20
+
+
+def job_id_for(name):
+    """File-system safe id of a job from its document name."""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def utc_timestamp(seconds=None):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except ValueError as error:
+        logger.warning("Ignoring unreadable queue file %s: %s", path, error)
+        return default
+
+
+class Lease:
+    """
+    A held job lease, kept alive by a heartbeat thread that touches the lease file until
+    release(). lost is set when the lease file no longer holds this lease's token (it was
+    declared stale and taken over), after which the holder must not record the job's outcome.
+    """
+
+    def __init__(self, path, token, heartbeat=DEFAULT_HEARTBEAT):
+        self.path = path
+        self.token = token
+        self.heartbeat = heartbeat
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def held(self):
+        lease = read_json(self.path)
+        return lease is not None and lease.get("token") == self.token
+
+    def start(self):
+        self._thread = threading.Thread(target=self._beat, name=f"heartbeat-{os.path.basename(self.path)}", daemon=True)
+        self._thread.start()
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            if not self.held():
+                logger.error("Lease %s was taken over, the job's outcome will not be recorded", self.path)
+                self.lost = True
+                return
+            os.utime(self.path)  # No times: set by the file server, like the clock probe
+
+    def stop(self):
+        """Stop the heartbeat, keeping the lease file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def release(self):
+        self.stop()
+        if not self.lost and self.held():
+            os.remove(self.path)
+
+
+class WorkQueue:
+    """
+    A folder-based job queue shared by every conversion host:
+
+        queue = WorkQueue("queue")
+        queue.enqueue(docx_paths, options={"style_cache": "style_cache"})
+        queue.work("app")            # Convert jobs until none is left, in any number of processes
+        queue.write_status()         # status.json from the current state of the folders
+
+    Jobs are converted with pipeline.convert_docx into <app_dir>/<name>/. A job that raises is
+    put back with its error and retried by any worker until max_attempts, then moved to failed/.
+    """
+
+    def __init__(self, folder, worker_id=None, lease_timeout=DEFAULT_LEASE_TIMEOUT, heartbeat=DEFAULT_HEARTBEAT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, convert=pipeline.convert_docx):
+        self.folder = folder
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_timeout = lease_timeout
+        self.heartbeat = heartbeat
+        self.max_attempts = max_attempts
+        self.convert = convert
+        self.bundle_built = False
+        for name in (PENDING_FOLDER, LEASES_FOLDER, DONE_FOLDER, FAILED_FOLDER, CLOCK_FOLDER):
+            os.makedirs(os.path.join(folder, name), exist_ok=True)
+
+    def path(self, state, job_id, suffix=JOB_SUFFIX):
+        return os.path.join(self.folder, state, f"{job_id}{suffix}")
+
+    def job_ids(self, state):
+        suffix = LEASE_SUFFIX if state == LEASES_FOLDER else JOB_SUFFIX
+        return sorted(name[:-len(suffix)] for name in os.listdir(os.path.join(self.folder, state)) if name.endswith(suffix))
+
+    def now(self):
+        """Current time of the file server: the mtime of a file this worker just touched."""
+        probe = os.path.join(self.folder, CLOCK_FOLDER, job_id_for(self.worker_id))
+        with open(probe, "a"):
+            pass
+        os.utime(probe)
+        return os.stat(probe).st_mtime
+
+    ## Producer
+
+    def enqueue(self, docx_paths, options=None):
+        """
+        Add a job per DOCX (named after the file, published under app/<name>). A document already
+        done or failed is queued again; one still pending is left as it is. Returns the job ids.
+        """
+        job_ids = []
+        for docx_path in docx_paths:
+            name = os.path.splitext(os.path.basename(docx_path))[0]
+            job_id = job_id_for(name)
+            if job_id in job_ids:
+                raise ValueError(f"Two documents would be published as app/{name}: {docx_path}")
+            job_ids.append(job_id)
+            if os.path.exists(self.path(PENDING_FOLDER, job_id)):
+                logger.info("%s is already queued", name)
+                continue
+            for state in (DONE_FOLDER, FAILED_FOLDER):
+                if os.path.exists(self.path(state, job_id)):
+                    os.remove(self.path(state, job_id))
+            job = {"id": job_id, "docx": os.path.abspath(docx_path), "name": name, "options": options or {},
+                   "attempts": 0, "errors": [], "queued": utc_timestamp()}
+            atomic_write(self.path(PENDING_FOLDER, job_id), dump_json(job))
+        logger.info("Queued %d job(s) in %s", len(job_ids), self.folder)
+        return job_ids
+
+    ## Leases
+
+    def acquire(self, job_id, suffix=LEASE_SUFFIX):
+        """The job's Lease if this worker could take it (breaking a stale one), else None."""
+        lease_path = self.path(LEASES_FOLDER, job_id, suffix)
+        token = uuid.uuid4().hex
+        content = dump_json({"token": token, "worker": self.worker_id, "acquired": utc_timestamp()})
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(lease_path), prefix=f".{job_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            for _ in range(2):  # Again once after breaking a stale lease
+                try:
+                    os.link(tmp_path, lease_path)
+                    return Lease(lease_path, token, self.heartbeat)
+                except FileExistsError:
+                    if not self.break_stale_lease(job_id, suffix):
+                        return None
+            return None
+        finally:
+            os.remove(tmp_path)
+
+    def break_stale_lease(self, job_id, suffix=LEASE_SUFFIX):
+        """Remove the job's lease if its worker stopped heartbeating. Returns True if the lease is gone."""
+        lease_path = self.path(LEASES_FOLDER, job_id, suffix)
+        try:
+            age = self.now() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if age <= self.lease_timeout:
+            return False
+
+        # Only one of the workers finding the stale lease wins the rename
+        stale_path = f"{lease_path}.stale.{uuid.uuid4().hex}"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return False
+        if self.now() - os.stat(stale_path).st_mtime <= self.lease_timeout:
+            # Touched by a heartbeat since it was found stale: put it back (unless already retaken)
+            try:
+                os.link(stale_path, lease_path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+
+        holder = read_json(stale_path, {})
+        os.remove(stale_path)
+        logger.warning("Lease of %s held by %s expired (%.0fs without heartbeat), taking the job over",
+                       job_id, holder.get("worker"), age)
+        self.record_failure(job_id, f"Worker {holder.get('worker')} stopped heartbeating", give_up=False)
+        return True
+
+    ## Consumer
+
+    def claim(self):
+        """(job, lease) of the next pending job this worker could lease, or None."""
+        for job_id in self.job_ids(PENDING_FOLDER):
+            if os.path.exists(self.path(LEASES_FOLDER, job_id, LEASE_SUFFIX)) and not self.break_stale_lease(job_id):
+                continue  # Leased by a live worker
+            lease = self.acquire(job_id)
+            if lease is None:
+                continue
+            job = read_json(self.path(PENDING_FOLDER, job_id))
+            if job is None or job["attempts"] >= self.max_attempts:
+                # Finished meanwhile, or given up after a lost worker
+                if job is not None:
+                    self.give_up(job)
+                lease.release()
+                continue
+            return job, lease
+        return None
+
+    def record_failure(self, job_id, error, give_up=True):
+        """
+        Count a failed attempt on a pending job, moving it to failed/ after max_attempts (or, with
+        give_up False, leaving that to the next worker leasing it).
+        """
+        job = read_json(self.path(PENDING_FOLDER, job_id))
+        if job is None:
+            return
+        job["attempts"] += 1
+        job["errors"] = (job["errors"] + [{"worker": self.worker_id, "time": utc_timestamp(), "error": error}])[-self.max_attempts:]
+        if job["attempts"] >= self.max_attempts and give_up:
+            self.give_up(job)
+        else:
+            atomic_write(self.path(PENDING_FOLDER, job_id), dump_json(job))
+
+    def give_up(self, job):
+        atomic_write(self.path(FAILED_FOLDER, job["id"]), dump_json({**job, "failed": utc_timestamp()}))
+        os.remove(self.path(PENDING_FOLDER, job["id"]))
+        logger.error("Giving up on %s after %d attempt(s)", job["name"], job["attempts"])
+
+    def build_bundle(self, app_dir):
+        """
+        Build the shared front-end bundle of app_dir once per worker, one worker at a time: the
+        OutputWriters of concurrent builds would overwrite each other's manifest.
+        """
+        if self.bundle_built:
+            return
+        lock = self.acquire(BUNDLE_LOCK, BUNDLE_LOCK_SUFFIX)
+        while lock is None:
+            time.sleep(BUNDLE_LOCK_POLL)
+            lock = self.acquire(BUNDLE_LOCK, BUNDLE_LOCK_SUFFIX)
+        try:
+            pipeline.publish_asset_bundle(os.path.join(app_dir, ASSET_BUNDLE_FOLDER))
+            self.bundle_built = True
+        finally:
+            lock.release()
+
+    def stage(self, job, lease, app_dir):
+        """
+        Staging folder of one attempt at a job, holding a hard-linked copy of its published output
+        (every output is replaced by a rename, never written in place). Removes the staging folders
+        of earlier attempts: their workers lost the lease and won't publish.
+        """
+        staging_root = os.path.join(app_dir, STAGING_FOLDER)
+        os.makedirs(staging_root, exist_ok=True)
+        staging = os.path.join(staging_root, f"{job['id']}.{lease.token}")
+        earlier = re.compile(rf"{re.escape(job['id'])}\.[0-9a-f]{{32}}(\.previous)?")
+        for name in os.listdir(staging_root):
+            if earlier.fullmatch(name) and name != os.path.basename(staging):
+                shutil.rmtree(os.path.join(staging_root, name), ignore_errors=True)
+        output_path = os.path.join(app_dir, job["name"])
+        if os.path.isdir(output_path):
+            shutil.copytree(output_path, os.path.join(staging, job["name"]), copy_function=os.link)
+        else:
+            os.makedirs(staging)
+        return staging
+
+    def publish(self, staging, job, lease, app_dir):
+        """Rename the staged output over app_dir/<name> if the lease is still held. Returns True if published."""
+        if not lease.held():
+            lease.lost = True
+            logger.error("%s: lease of %s was taken over, its output is not published", self.worker_id, job["name"])
+            return False
+        output_path = os.path.join(app_dir, job["name"])
+        previous = f"{staging}.previous"
+        try:
+            os.rename(output_path, previous)
+        except FileNotFoundError:
+            previous = None
+        try:
+            os.rename(os.path.join(staging, job["name"]), output_path)
+        except OSError:
+            if previous is not None:
+                os.rename(previous, output_path)  # Put the published output back
+            raise
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+        return True
+
+    def run(self, job, lease, app_dir):
+        """Convert one leased job into a staging folder, publish it as app_dir/<name> and record its outcome."""
+        logger.info("%s: converting %s (attempt %d)", self.worker_id, job["name"], job["attempts"] + 1)
+        lease.start()
+        started = time.monotonic()
+        error = None
+        manifest = None
+        staging = None
+        try:
+            options = dict(job["options"])
+            if options.get("asset_mode") == "bundle":
+                self.build_bundle(app_dir)
+                options.update(bundle_path=os.path.join(app_dir, ASSET_BUNDLE_FOLDER), build_bundle=False)
+            staging = self.stage(job, lease, app_dir)
+            manifest = self.convert(job["docx"], pipeline.LUA_SCRIPT, os.path.join(staging, job["name"]), **options)
+        except Exception:
+            error = "".join(traceback.format_exc().splitlines(keepends=True)[-TRACEBACK_LINES:])
+            logger.error("%s: %s failed:\n%s", self.worker_id, job["name"], error)
+        finally:
+            lease.stop()  # The lease is kept until the outcome is recorded, so nobody claims the job meanwhile
+        seconds = round(time.monotonic() - started, 3)
+
+        try:
+            if lease.lost:
+                return
+            if error is None:
+                try:
+                    if not self.publish(staging, job, lease, app_dir):
+                        return
+                except OSError:
+                    error = "".join(traceback.format_exc().splitlines(keepends=True)[-TRACEBACK_LINES:])
+                    logger.error("%s: %s could not be published:\n%s", self.worker_id, job["name"], error)
+        finally:
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+        output_path = os.path.join(app_dir, job["name"])
+        if error is None:
+            result = {**job, "worker": self.worker_id, "finished": utc_timestamp(), "seconds": seconds,
+                      "output": output_path, "changed": len(manifest["added"]) + len(manifest["changed"]) if manifest else None}
+            atomic_write(self.path(DONE_FOLDER, job["id"]), dump_json(result))
+            os.remove(self.path(PENDING_FOLDER, job["id"]))
+            logger.info("%s: %s converted in %.1fs", self.worker_id, job["name"], seconds)
+        else:
+            self.record_failure(job["id"], error)
+        lease.release()
+
+    def work(self, app_dir, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Convert jobs until the queue has no pending job left. Returns the number converted here."""
+        converted = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if not self.job_ids(PENDING_FOLDER):
+                    break
+                # Every pending job is leased: wait for them to finish or their leases to expire
+                time.sleep(poll_interval)
+                continue
+            self.run(*claimed, app_dir)
+            converted += 1
+            self.write_status()
+        self.write_status()
+        return converted
+
+    ## Status
+
+    def status(self):
+        """Progress and failures of the whole queue, from the state of its folders."""
+        now = self.now()
+        running = {}
+        for job_id in self.job_ids(LEASES_FOLDER):
+            lease_path = self.path(LEASES_FOLDER, job_id, LEASE_SUFFIX)
+            lease = read_json(lease_path)
+            try:
+                heartbeat_age = round(now - os.stat(lease_path).st_mtime, 1)
+            except FileNotFoundError:
+                continue
+            if lease is not None:
+                running[job_id] = {"worker": lease["worker"], "since": lease["acquired"], "heartbeat_age": heartbeat_age,
+                                   "stale": heartbeat_age > self.lease_timeout}
+
+        pending = [job for job in map(read_json, (self.path(PENDING_FOLDER, job_id) for job_id in self.job_ids(PENDING_FOLDER))) if job]
+        done = [job for job in map(read_json, (self.path(DONE_FOLDER, job_id) for job_id in self.job_ids(DONE_FOLDER))) if job]
+        failed = [job for job in map(read_json, (self.path(FAILED_FOLDER, job_id) for job_id in self.job_ids(FAILED_FOLDER))) if job]
+        return {
+            "updated": utc_timestamp(now),
+            "counts": {
+                "pending": sum(1 for job in pending if job["id"] not in running),
+                "running": len(running),
+                "done": len(done),
+                "failed": len(failed),
+            },
+            "running": running,
+            "retrying": {job["id"]: {"attempts": job["attempts"], "last_error": job["errors"][-1]}
+                         for job in pending if job["errors"]},
+            "failed": {job["id"]: {"attempts": job["attempts"], "errors": job["errors"]} for job in failed},
+            "done": {job["id"]: {"worker": job["worker"], "seconds": job["seconds"], "changed": job["changed"]}
+                     for job in done},
+        }
+
+    def write_status(self):
+        """Rewrite status.json (any worker may: it is derived from the folders only)."""
+        status = self.status()
+        atomic_write(os.path.join(self.folder, STATUS_FILE), dump_json(status))
+        return status
+
+
+def run_worker(queue_folder, app_dir, worker_id=None, lease_timeout=DEFAULT_LEASE_TIMEOUT, heartbeat=DEFAULT_HEARTBEAT,
+               max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Entry point of one worker process."""
+    configure_logging()
+    queue = WorkQueue(queue_folder, worker_id, lease_timeout, heartbeat, max_attempts)
+    return queue.work(app_dir, poll_interval)
+
+
+def run_local(app_dir, docx_paths, workers, queue_folder=None, options=None, **worker_options):
+    """
+    Convert docx_paths with several worker processes on this machine sharing one queue folder
+    (a temporary one unless given), exactly as separate hosts would. Returns the final status.
+    """
+    with tempfile.TemporaryDirectory(prefix="work_queue_") as tmp_folder:
+        queue_folder = queue_folder or tmp_folder
+        WorkQueue(queue_folder).enqueue(docx_paths, options)
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(queue_folder, app_dir, f"{socket.gethostname()}:local{index}"),
+                                    kwargs=worker_options)
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return WorkQueue(queue_folder).write_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue documents")
+    enqueue.add_argument("queue", help="Queue folder")
+    enqueue.add_argument("docx", nargs="+", help="Documents to convert")
+
+    work = commands.add_parser("work", help="Convert queued documents until none is left")
+    work.add_argument("queue", help="Queue folder")
+    work.add_argument("app", help="Output folder (documents are published under app/<doc>)")
+    work.add_argument("--worker-id", help="Name of this worker (default: host:pid)")
+
+    status = commands.add_parser("status", help="Refresh and print status.json")
+    status.add_argument("queue", help="Queue folder")
+
+    local = commands.add_parser("local", help="Convert documents with several local worker processes")
+    local.add_argument("app", help="Output folder")
+    local.add_argument("docx", nargs="+", help="Documents to convert")
+    local.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    local.add_argument("--queue", help="Queue folder (default: a temporary folder)")
+
+    for command in (enqueue, local):
+        command.add_argument("--style-cache", help="Style cache folder passed to the pipeline")
+        command.add_argument("--revision-cache", help="Revision cache folder: reconversions only convert the edited sections")
+        command.add_argument("--precompress", action="store_true", help="Publish precompressed outputs")
+        command.add_argument("--bootstrap", action="store_true", help="Inline the first section into index.html")
+    for command in (work, local):
+        command.add_argument("--lease-timeout", type=float, default=DEFAULT_LEASE_TIMEOUT)
+        command.add_argument("--heartbeat", type=float, default=DEFAULT_HEARTBEAT)
+        command.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+        command.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    configure_logging()
+    options = {}
+    if args.command in ("enqueue", "local"):
+        options = {key: value for key, value in (("style_cache", args.style_cache), ("revision_cache", args.revision_cache),
+                                                 ("precompress", args.precompress), ("bootstrap", args.bootstrap)) if value}
+    worker_options = {}
+    if args.command in ("work", "local"):
+        worker_options = {"lease_timeout": args.lease_timeout, "heartbeat": args.heartbeat,
+                          "max_attempts": args.max_attempts, "poll_interval": args.poll_interval}
+
+    if args.command == "enqueue":
+        WorkQueue(args.queue).enqueue(args.docx, options)
+    elif args.command == "work":
+        converted = run_worker(args.queue, args.app, args.worker_id, **worker_options)
+        print(f"{converted} document(s) converted by this worker")
+    elif args.command == "status":
+        print(json.dumps(WorkQueue(args.queue).write_status()["counts"]))
+    else:
+        status = run_local(args.app, args.docx, args.workers, args.queue, options, **worker_options)
+        print(json.dumps(status["counts"]))
+        return 1 if status["counts"]["failed"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
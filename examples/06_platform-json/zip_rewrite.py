@@ -0,0 +1,134 @@
+"""
+Rewrite some members of a ZIP package (DOCX) and copy every other member as it is: its local
+header and compressed bytes are copied without being inflated or deflated again, so the cost of
+replacing word/document.xml doesn't grow with the size of the media in the package.
+"""
+import struct
+import zlib
+
+from output_writer import atomic_output
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")         # signature, version, flags, method, time, date, crc, sizes, name/extra lengths
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")     # ..., comment length, disk, attributes, local header offset
+END_RECORD = struct.Struct("<4s4H2LH")            # signature, disks, entries, directory size and offset, comment length
+
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+DEFLATED = 8
+ZIP64_LIMIT = 0xFFFFFFFF
+
+# The end record is at most 22 bytes plus a 64 kB comment from the end of the file
+END_SEARCH_BYTES = END_RECORD.size + 0xFFFF
+
+COPY_CHUNK = 1024 * 1024
+
+
+def read_central_directory(f):
+    """(central directory entries as (fields, name, extra, comment), archive comment) of an open ZIP file."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    f.seek(max(0, file_size - END_SEARCH_BYTES))
+    tail = f.read()
+    position = tail.rfind(END_SIGNATURE)
+    if position < 0:
+        raise ValueError("Not a ZIP file: no end of central directory record")
+    _, _, _, _, entries, directory_size, directory_offset, comment_length = END_RECORD.unpack_from(tail, position)
+    if ZIP64_LIMIT in (directory_size, directory_offset) or entries == 0xFFFF:
+        raise ValueError("ZIP64 packages are not supported")
+    archive_comment = tail[position + END_RECORD.size:position + END_RECORD.size + comment_length]
+
+    f.seek(directory_offset)
+    directory = f.read(directory_size)
+    members, offset = [], 0
+    for _ in range(entries):
+        fields = list(CENTRAL_HEADER.unpack_from(directory, offset))
+        if fields[0] != CENTRAL_SIGNATURE:
+            raise ValueError("Corrupt ZIP central directory")
+        name_length, extra_length, comment_length = fields[10:13]
+        offset += CENTRAL_HEADER.size
+        name = directory[offset:offset + name_length]
+        extra = directory[offset + name_length:offset + name_length + extra_length]
+        comment = directory[offset + name_length + extra_length:offset + name_length + extra_length + comment_length]
+        offset += name_length + extra_length + comment_length
+        if fields[3] & FLAG_ENCRYPTED:
+            raise ValueError(f"Encrypted ZIP member: {name!r}")
+        members.append((fields, name, extra, comment))
+    return members, archive_comment
+
+
+def copy_bytes(src, dst, length):
+    while length:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise ValueError("Truncated ZIP member")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def copy_member(src, dst, fields):
+    """Copy one member's local header, compressed data and data descriptor verbatim."""
+    compress_size, local_offset = fields[8], fields[16]
+    src.seek(local_offset)
+    header = src.read(LOCAL_HEADER.size)
+    if header[:4] != LOCAL_SIGNATURE:
+        raise ValueError("Corrupt ZIP local header")
+    name_length, extra_length = LOCAL_HEADER.unpack(header)[9:11]
+    dst.write(header)
+    copy_bytes(src, dst, name_length + extra_length + compress_size)
+    if fields[3] & FLAG_DATA_DESCRIPTOR:
+        signature = src.read(4)
+        dst.write(signature)
+        copy_bytes(src, dst, 12 if signature == DESCRIPTOR_SIGNATURE else 8)
+
+
+def write_member(dst, fields, name, data):
+    """Write new content for a member (deflated) and return its updated central directory fields."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    crc = zlib.crc32(data)
+    flags = fields[3] & ~FLAG_DATA_DESCRIPTOR
+    version = max(fields[2], 20)
+    dst.write(LOCAL_HEADER.pack(LOCAL_SIGNATURE, version, flags, DEFLATED, fields[5], fields[6],
+                                crc, len(compressed), len(data), len(name), 0))
+    dst.write(name)
+    dst.write(compressed)
+    fields = list(fields)
+    fields[2:5] = [version, flags, DEFLATED]
+    fields[7:10] = [crc, len(compressed), len(data)]
+    return fields
+
+
+def rewrite_zip(src_path, dst_path, replacements):
+    """
+    Write a copy of the ZIP at src_path to dst_path (atomically) with the members named in
+    replacements ({name: bytes}) replaced. Every other member is copied without recompression,
+    in the original order, with its central directory entry (attributes, comments) unchanged.
+    """
+    with open(src_path, "rb") as src:
+        members, archive_comment = read_central_directory(src)
+        with atomic_output(dst_path) as dst:
+            directory = []
+            for fields, name, extra, comment in members:
+                offset = dst.tell()
+                if offset > ZIP64_LIMIT:
+                    raise ValueError("ZIP64 packages are not supported")
+                decoded = name.decode("utf-8" if fields[3] & 0x800 else "cp437")
+                if decoded in replacements:
+                    fields = write_member(dst, fields, name, replacements[decoded])
+                else:
+                    copy_member(src, dst, fields)
+                fields = list(fields)
+                fields[16] = offset
+                directory.append(CENTRAL_HEADER.pack(*fields) + name + extra + comment)
+
+            directory_offset = dst.tell()
+            directory_bytes = b"".join(directory)
+            dst.write(directory_bytes)
+            dst.write(END_RECORD.pack(END_SIGNATURE, 0, 0, len(directory), len(directory), len(directory_bytes),
+                                      directory_offset, len(archive_comment)))
+            dst.write(archive_comment)